@@ -0,0 +1,147 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+# Copyright 2014-2015 Michael Helmling
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 3 as
+# published by the Free Software Foundation
+
+"""Benchmarks for loading large BibTeX databases.
+
+Run from the repository root, e.g.::
+
+    python benchmarks/benchmark.py --entries 20000
+
+A synthetic ``.bib`` file with the given number of entries is created in a temporary directory.
+With ``--entry-memory``, the memory used by :class:`Entry` objects is compared to that of the
+previous ``OrderedDict`` based representation, e.g. for 50k entries::
+
+    python benchmarks/benchmark.py --entries 50000 --entry-memory
+"""
+from __future__ import division, print_function, unicode_literals
+import argparse, gc, io, os, shutil, sys, tempfile, time, tracemalloc
+from collections import OrderedDict
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bibtexvcs.bibfile import BibFile, Entry
+from bibtexvcs.parser import BACKENDS
+
+ENTRY = '''@Article{{Author{i}:{year},
+  Title                    = {{On the {{{{LP}}}} Decoding of Code Number {i}}},
+  Author                   = {{Helmling, Michael and Rosnes, Eirik and van der Zalm, E. and Coauthor{co}, A.}},
+  Journal                  = IEEE_J_IT,
+  Year                     = {{{year}}},
+  Month                    = jun # {{/}} # jul,
+  Pages                    = {{{i}--{j}}},
+  Abstract                 = {{We consider the decoding of binary linear codes by mathematical
+                              programming. {filler}}},
+  Doi                      = {{10.1109/TIT.{year}.{i}}},
+  File                     = {{:Author{i} - Code Number {i}.pdf:PDF}},
+  Owner                    = {{owner{co}}},
+  Timestamp                = {{{year}.02.17}}
+}}
+
+'''
+
+
+def writeSyntheticBibfile(path, entries):
+    """Write a ``.bib`` file with `entries` JabRef-style article entries to `path`."""
+    filler = 'The abstract goes on and on. ' * 10
+    with io.open(path, 'wt', encoding='UTF-8') as bibfile:
+        bibfile.write('% This file was created with JabRef 2.10.\n% Encoding: UTF8\n\n')
+        bibfile.write('@STRING{IEEE_J_IT = {IEEE Transactions on Information Theory}}\n\n')
+        for i in range(entries):
+            bibfile.write(ENTRY.format(i=i, j=i + 10, year=1990 + i % 25, co=i % 100,
+                                       filler=filler))
+
+
+def touchFields(bib):
+    """Typical check workload: access a few fields of every entry."""
+    for entry in bib.values():
+        entry.filename()
+        entry.get('owner')
+        entry.lastNames()
+
+
+def measure(function):
+    """Return wall time (in seconds) of `function()`, and its result's memory size (in bytes)."""
+    gc.collect()
+    start = time.perf_counter()
+    function()
+    seconds = time.perf_counter() - start
+    gc.collect()
+    tracemalloc.start()
+    result = function()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del result
+    return seconds, size
+
+
+def benchmarkBackends(path):
+    print('{:<10} {:>10} {:>12} {:>10}'.format('backend', 'load [s]', 'memory [MB]',
+                                                'touch [s]'))
+    for backend in BACKENDS:
+        seconds, size = measure(lambda: BibFile(path, backend=backend))
+        bib = BibFile(path, backend=backend)
+        touchSeconds, _ = measure(lambda: touchFields(bib))
+        print('{:<10} {:>10.2f} {:>12.1f} {:>10.2f}'.format(backend, seconds, size / 2 ** 20,
+                                                             touchSeconds))
+
+
+class OrderedDictEntry(OrderedDict):
+    """The former representation of entries: an ``OrderedDict`` with an instance ``__dict__``."""
+
+    def __init__(self, entrytype, citekey, fields, src):
+        OrderedDict.__init__(self)
+        self.bibsrc = src
+        for key, val in fields:
+            self[key.upper().lower()] = val  # the parser created a new string for each name
+        self.citekey = citekey
+        self.entrytype = entrytype
+
+
+def benchmarkEntryMemory(path):
+    """Compare the memory of the entries of the bib file at `path` in both representations.
+
+    Only the entry objects themselves are measured; the (decoded) field values and source texts
+    are shared.
+    """
+    bib = BibFile(path, backend='fast')
+    entries = [(entry.entrytype, entry.citekey, list(entry.items()), entry.bibsrc)
+               for entry in bib.values()]
+    del bib
+    print('{:<18} {:>12} {:>16}'.format('representation', 'memory [MB]', 'per entry [B]'))
+    for cls in OrderedDictEntry, Entry:
+        if cls is Entry:
+            create = lambda: [Entry(entrytype, citekey, OrderedDict(fields), src)
+                              for entrytype, citekey, fields, src in entries]
+        else:
+            create = lambda: [OrderedDictEntry(*entry) for entry in entries]
+        _, size = measure(create)
+        print('{:<18} {:>12.1f} {:>16.0f}'.format(cls.__name__, size / 2 ** 20,
+                                                   size / len(entries)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--entries', type=int, default=10000, help='number of entries')
+    parser.add_argument('--entry-memory', action='store_true',
+                        help='compare the memory of entry representations only')
+    args = parser.parse_args()
+    tmpdir = tempfile.mkdtemp()
+    try:
+        path = os.path.join(tmpdir, 'benchmark.bib')
+        writeSyntheticBibfile(path, args.entries)
+        print('{} entries, {:.1f} MB'.format(args.entries, os.path.getsize(path) / 2 ** 20))
+        if args.entry_memory:
+            benchmarkEntryMemory(path)
+        else:
+            benchmarkBackends(path)
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+if __name__ == '__main__':
+    main()
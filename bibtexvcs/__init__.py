@@ -8,7 +8,6 @@
 
 """BibTeX VCS main package."""
 from __future__ import division, print_function, unicode_literals
-import sys
 
 __version__ = '2015.16'
 
@@ -17,16 +16,10 @@ def pypiVersion():
     """Return the current version of this package on PyPI, or ``None`` in case of connection
     problems.
     """
-    if sys.version_info.major == 2:
-        import urllib2
-        from urllib2 import URLError
-        urlopen = urllib2.urlopen
-    else:
-        import urllib.request
-        from urllib.error import URLError
-        urlopen = urllib.request.urlopen
+    import urllib.request
+    from urllib.error import URLError
     try:
-        data = urlopen('https://pypi.python.org/pypi/bibtexvcs/json').read().decode()
+        data = urllib.request.urlopen('https://pypi.python.org/pypi/bibtexvcs/json').read().decode()
     except URLError:
         return None
     import json
@@ -7,8 +7,9 @@
 # published by the Free Software Foundation
 
 from __future__ import division, print_function, unicode_literals
-from collections import OrderedDict
-import io
+from collections import OrderedDict, namedtuple
+from collections.abc import MutableMapping
+import copyreg, io, os, re, shutil, sys, tempfile
 
 """This module contains classes for an object-oriented representation of the .bib file.
 
@@ -19,38 +20,274 @@ Most of it is generic for BibTeX, i.e. not special to the literature package.
 class BibFile(OrderedDict):
     """Object-oriented encapsulation of a BibTeX database.
 
-    :param filename: Path of the ``.bib`` file to read.
+    :param filename: Path of the ``.bib`` file to read, or a text file object.
     :type filename: str
 
     :param bibstring: BibTeX database as string (as an alternative to ``filename``)
     :type bibstring: str
 
+    :param backend: The parser backend to use (see :data:`bibtexvcs.parser.BACKENDS`).
+    :type backend: str
+
+    :param workers: Number of processes used to parse large files
+        (see :func:`bibtexvcs.parser.iterparse`).
+    :type workers: int
+
     .. attribute:: macroDefinitions
 
         Dictionary of :class:`MacroReference` objects defined in this bib file.
+
+    .. attribute:: macroReferences
+
+        Dictionary of the :class:`MacroReference` objects used in this bib file, by name. All uses
+        of a macro in field values and macro definitions share the same object.
+
+    .. attribute:: source
+
+        The complete text of the bib file. The :attr:`Entry.bibsrc` of all entries are slices of
+        this string, which is stored only once.
+
+    .. attribute:: newlines
+
+        The line ending used in the bib file, which is kept by :meth:`save`; ``None`` if unknown
+        or if the file mixes different line endings.
+
+    The elements are remembered by the fingerprints of their source texts, such that
+    :meth:`reload` only needs to parse the definitions that have changed in the file or, for
+    entries, in memory.
+
+    Entries can be searched with :meth:`find`, which uses secondary indexes. These are kept up to
+    date when entries are added, replaced, removed or moved through the mapping interface or by
+    :meth:`reload`; after modifying an entry in place, assign it again to re-index it.
+
+    The file can be written back with :meth:`save`, which re-serializes only the entries that
+    have been modified (see :attr:`Entry.modified`), added or removed.
     """
 
-    def __init__(self, filename=None, bibstring=None):
+    def __init__(self, filename=None, bibstring=None, backend='pyparsing', workers=1):
         super(BibFile, self).__init__()
         self.filename = filename
+        self.backend = backend
+        self.workers = workers
+        self.comments = []
+        self.macroDefinitions = OrderedDict()
+        self.macroReferences = {}
+        self._definitions = {}
+        self._sourceEntries = []
+        self._index = None
+        self._load(filename if filename else io.StringIO(bibstring))
+
+    def _load(self, source):
         from . import parser
-        if filename:
-            with io.open(filename, "rt", encoding='UTF-8') as bibFile:
-                bibstring = bibFile.read()
-        bibParsed = parser.bibfile.parseString(bibstring, parseAll=True)
+        if isinstance(source, str):
+            with io.open(source, 'rt', encoding='UTF-8') as stream:
+                text = stream.read()
+                newlines = stream.newlines
+        else:
+            text = source.read()
+            newlines = getattr(source, 'newlines', None)
+        # entries changed in memory no longer match their source text and must be parsed again
+        known = dict((key, item) for key, item in self._definitions.items()
+                     if not (isinstance(item, Entry) and item.modified))
+        items = list(parser.iterparseIncremental(parser.StringSource(text), known,
+                                                 self.backend, self.workers))
+        self.source = text
+        self.newlines = newlines if isinstance(newlines, str) else None
+        previous = OrderedDict(self)
+        OrderedDict.clear(self)
         self.comments = []
         self.macroDefinitions = OrderedDict()
-        for item in bibParsed:
+        self.__dict__.pop('preamble', None)
+        for _, offset, item in items:
             if isinstance(item, Entry):
-                self[item.citekey] = item
+                item.shareSource(text, offset)
+                item.internMacros(self.macroReferences)
+                OrderedDict.__setitem__(self, item.citekey, item)
             elif isinstance(item, Comment):
                 self.comments.append(item)
             elif isinstance(item, MacroDefinition):
+                item.value = _internMacros(item.value, self.macroReferences)
                 self.macroDefinitions[item.key] = item
             elif isinstance(item, Preamble):
                 self.preamble = item
             else:
                 raise ValueError('Unknown item parsed: {}'.format(item))
+        self._definitions = dict((key, item) for key, _, item in items)
+        self._sourceEntries = [(item.citekey, item) for _, _, item in items
+                               if isinstance(item, Entry)]
+        changes = BibFileChanges(added=[key for key in self if key not in previous],
+                                 removed=[key for key in previous if key not in self],
+                                 modified=[key for key in self
+                                           if key in previous and self[key] is not previous[key]])
+        if self._index is not None:
+            for key in changes.removed:
+                self._index.remove(key)
+            for key in changes.added + changes.modified:
+                self._index.add(key, self[key])
+            self._index.reorder(self)
+        return changes
+
+    def __setitem__(self, citekey, entry):
+        OrderedDict.__setitem__(self, citekey, entry)
+        entry.modified = True
+        if self._index is not None:
+            self._index.add(citekey, entry)
+
+    def __delitem__(self, citekey):
+        OrderedDict.__delitem__(self, citekey)
+        if self._index is not None:
+            self._index.remove(citekey)
+
+    def pop(self, citekey, *default):
+        if citekey in self:
+            entry = self[citekey]
+            del self[citekey]
+            return entry
+        return OrderedDict.pop(self, citekey, *default)
+
+    def popitem(self, last=True):
+        citekey, entry = OrderedDict.popitem(self, last)
+        if self._index is not None:
+            self._index.remove(citekey)
+        return citekey, entry
+
+    def setdefault(self, citekey, default=None):
+        if citekey not in self:
+            self[citekey] = default
+        return self[citekey]
+
+    def move_to_end(self, citekey, last=True):
+        OrderedDict.move_to_end(self, citekey, last)
+        if self._index is not None:
+            self._index.reorder(self)
+
+    def clear(self):
+        OrderedDict.clear(self)
+        self._index = None
+
+    def __reduce__(self):
+        # OrderedDict's pickling restores the entries by item assignment, which would mark all of
+        # them as modified; restore them in __setstate__ instead
+        return copyreg.__newobj__, (self.__class__,), (self.__dict__, list(self.items()))
+
+    def __setstate__(self, state):
+        attributes, items = state
+        self.__dict__.update(attributes)
+        for citekey, entry in items:
+            OrderedDict.__setitem__(self, citekey, entry)
+
+    def find(self, author=None, year=None, yearRange=None, entrytype=None, journal=None,
+             doi=None, filename=None):
+        """Return the list of entries matching all given criteria, in file order.
+
+        The secondary indexes used for searching are built on the first call.
+
+        :param author: Last name of an author, including nobility and suffix
+            (see :meth:`Name.lastName`); case-insensitive.
+        :param year: Publication year (int).
+        :param yearRange: Pair ``(first, last)`` of publication years (inclusive).
+        :param entrytype: Entry type, e.g. ``'article'``.
+        :param journal: Name of the macro used in the ``journal`` or ``booktitle`` field.
+        :param doi: DOI of the entry; case-insensitive.
+        :param filename: Document file name (see :meth:`Entry.filename`).
+        """
+        if self._index is None:
+            from bibtexvcs.index import EntryIndex
+            self._index = EntryIndex(self)
+        criteria = dict((name, value) for name, value in
+                        (('author', author), ('year', year), ('entrytype', entrytype),
+                         ('journal', journal), ('doi', doi), ('filename', filename))
+                        if value is not None)
+        return [self[key] for key in self._index.find(yearRange, **criteria)]
+
+    def reload(self):
+        """Re-read :attr:`filename` and update this object accordingly.
+
+        Only the definitions whose source text has changed and the entries that have been modified
+        in memory (see :attr:`Entry.modified`) are parsed again; for all others, the existing
+        objects are kept. If the file is malformed, this object remains unchanged.
+
+        :returns: The citekeys of the entries that have been added, removed and modified.
+        :rtype: :class:`BibFileChanges`
+        """
+        return self._load(self.filename)
+
+    def save(self, path=None):
+        """Write the bib file to `path` (default: :attr:`filename`).
+
+        All text of :attr:`source` is copied unchanged, except for the entries that have been
+        modified, replaced or removed; modified and replaced entries are re-serialized in place
+        (see :meth:`Entry.toBibtex`), and added entries are appended at the end. Hence saving an
+        unmodified object reproduces the file exactly, provided that it uses a single line ending
+        style (see :attr:`newlines`); mixed line endings are all written as ``'\n'``. Changes to
+        comments, macro definitions and the preamble are not written.
+
+        The file is written to a temporary file which then atomically replaces `path`. If `path`
+        is :attr:`filename`, this object is updated to the new file contents afterwards. If an
+        entry's field values cannot be written as valid BibTeX, e.g. because their braces do not
+        balance, a :class:`DatabaseFormatError` is raised and `path` is left unchanged.
+        """
+        if path is None:
+            path = self.filename
+        fd, tmpName = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), suffix='.tmp')
+        try:
+            with io.open(fd, 'wt', encoding='UTF-8', newline=self.newlines or '\n') as stream:
+                self._write(stream)
+            if os.path.exists(path):
+                shutil.copymode(path, tmpName)
+            os.replace(tmpName, path)
+        except BaseException:
+            os.remove(tmpName)
+            raise
+        if path == self.filename:
+            self._load(path)
+
+    def _write(self, stream):
+        source = self.source
+        last = dict((citekey, index) for index, (citekey, _) in enumerate(self._sourceEntries))
+        position = 0  # start of the source text not yet written
+        for index, (citekey, original) in enumerate(self._sourceEntries):
+            if last[citekey] != index:
+                continue  # the entry is shadowed by a later one with the same citekey
+            entry = self.get(citekey)
+            if entry is original and not entry.modified:
+                continue
+            stream.write(source[position:original._offset])
+            position = original._offset + original._length
+            if entry is None:
+                position = _WHITESPACE.match(source, position).end()
+            else:
+                stream.write(self._serialize(entry))
+        stream.write(source[position:])
+        added = [entry for citekey, entry in self.items() if citekey not in last]
+        if added and source and not source.endswith('\n'):
+            stream.write('\n')
+        for entry in added:
+            stream.write('\n' + self._serialize(entry) + '\n')
+
+    def _serialize(self, entry):
+        """Return the source of `entry` (see :meth:`Entry.toBibtex`), after checking that it
+        parses again, such that :meth:`save` never writes a malformed file.
+        """
+        from . import parser
+        text = entry.toBibtex()
+        try:
+            parsed = parser.parseBibstring(text, self.backend)
+        except DatabaseFormatError as error:
+            raise DatabaseFormatError('Entry "{}" cannot be saved: {}'.format(entry.citekey,
+                                                                            error))
+        if [item.citekey for item in parsed if isinstance(item, Entry)] != [entry.citekey]:
+            raise DatabaseFormatError('Entry "{}" cannot be saved: its source\n{}\nis '
+                                      'malformed'.format(entry.citekey, text))
+        return text
+
+
+BibFileChanges = namedtuple('BibFileChanges', 'added removed modified')
+BibFileChanges.__doc__ = """Citekeys of added, removed and modified entries, as returned by
+:meth:`BibFile.reload`."""
+
+
+_WHITESPACE = re.compile(r'\s*')
 
 
 class DatabaseFormatError(Exception):
@@ -60,6 +297,7 @@ class DatabaseFormatError(Exception):
 
 class DatabaseElement:
     """Base class for database elements (Entries, Comments, Macros)."""
+    __slots__ = ()
 
     @classmethod
     def fromParseResult(cls, toks):
@@ -86,6 +324,8 @@ class MacroDefinition(DatabaseElement):
         The substitution string of the macro definition.
     """
 
+    __slots__ = ('key', 'value')
+
     def __init__(self, macro, definition):
         self.key = macro
         self.value = definition
@@ -101,9 +341,24 @@ class MacroDefinition(DatabaseElement):
 
 
 class MacroReference(DatabaseElement):
-    """ Class to encapsulate undefined macro references."""
+    """ Class to encapsulate undefined macro references.
+
+    Macro references are immutable, since a :class:`BibFile` shares a single object between all
+    uses of a macro (see :attr:`BibFile.macroReferences`).
+    """
+    __slots__ = ('name',)
+
     def __init__(self, name):
-        self.name = name
+        object.__setattr__(self, 'name', name)
+
+    def __setattr__(self, name, value):
+        raise AttributeError('MacroReference objects are immutable')
+
+    def __reduce__(self):
+        return self.__class__, (self.name,)
+
+    def __hash__(self):
+        return hash(self.name)
 
     def __repr__(self):
         return 'MacroReference("{}")'.format(self.name)
@@ -121,17 +376,95 @@ class MacroReference(DatabaseElement):
         return [cls(toks[0])]
 
 
-class Entry(DatabaseElement, OrderedDict):
+def _internMacros(value, macros):
+    """Return `value` with all (top-level) :class:`MacroReference` objects replaced by the ones in
+    the dictionary `macros`, to which unknown references are added.
+    """
+    if isinstance(value, MacroReference):
+        return macros.setdefault(value.name, value)
+    if isinstance(value, list) or hasattr(value, 'asList'):  # concatenation or ParseResults
+        for index, part in enumerate(value):
+            if isinstance(part, MacroReference):
+                value[index] = macros.setdefault(part.name, part)
+    return value
+
+
+#: Field layouts of entries: maps tuples of field names to dictionaries mapping each of these
+#: names to its index. Entries with the same fields share both the layout and the field names.
+_layouts = {}
+
+
+def _layout(keys):
+    """Return the shared layout for the field names `keys` (a tuple)."""
+    try:
+        return _layouts[keys]
+    except KeyError:
+        keys = tuple(sys.intern(key) for key in keys)
+        layout = _layouts[keys] = dict((key, index) for index, key in enumerate(keys))
+        return layout
+
+
+class Entry(DatabaseElement, MutableMapping):
     """A BibTeX entry.
+
+    An entry is an ordered mapping of (lower-case) field names to field values. To save memory,
+    it does not use a dictionary of its own: the values are stored in a list, and the field names
+    and their positions are shared by all entries with the same fields.
+
+    The source text of the entry, :attr:`bibsrc`, is either an own string or, for entries of a
+    :class:`BibFile`, a slice of the file's :attr:`BibFile.source` (see :meth:`shareSource`).
+
+    .. attribute:: modified
+
+        Whether the entry has been changed through the mapping interface or assigned to a
+        :class:`BibFile`, i.e., whether :attr:`bibsrc` may be out of date.
     """
+    __slots__ = ('entrytype', 'citekey', 'modified', '_layout', '_values', '_buffer', '_offset',
+                 '_length', '_macros', '_assigned')
 
     def __init__(self, entrytype, citekey, fields, src):
-        OrderedDict.__init__(self)
+        self._layout = _layout(tuple(fields))
+        self._values = list(fields.values())
+        self._macros = None
+        self._assigned = None  # names of the fields assigned since parsing
+        self.modified = False
         self.bibsrc = src
-        for key, val in fields.items():
-            self[key] = val
         self.citekey = citekey
-        self.entrytype = entrytype
+        self.entrytype = sys.intern(entrytype)
+
+    def __getitem__(self, key):
+        return self._values[self._layout[key]]
+
+    def __setitem__(self, key, value):
+        self.modified = True
+        if self._assigned is None:
+            self._assigned = set()
+        self._assigned.add(key)
+        try:
+            self._values[self._layout[key]] = value
+        except KeyError:
+            self._layout = _layout(tuple(self._layout) + (key,))
+            self._values.append(value)
+
+    def __delitem__(self, key):
+        index = self._layout[key]
+        self.modified = True
+        keys = tuple(self._layout)
+        self._layout = _layout(keys[:index] + keys[index + 1:])
+        del self._values[index]
+
+    def __contains__(self, key):
+        return key in self._layout
+
+    def __iter__(self):
+        return iter(self._layout)
+
+    def __len__(self):
+        return len(self._values)
+
+    def __repr__(self):
+        return '{}({!r}, {!r}, {!r})'.format(self.__class__.__name__, self.entrytype,
+                                             self.citekey, list(self.items()))
 
     @classmethod
     def fromParseResult(cls, toks):
@@ -154,6 +487,63 @@ class Entry(DatabaseElement, OrderedDict):
                 fields[key] = formatValue(val)
         return [Entry(entrytype=entrytype, citekey=citekey, fields=fields, src=bibsrc)]
 
+    @property
+    def bibsrc(self):
+        """The source text of this entry in the bib file."""
+        if self._offset == 0 and self._length == len(self._buffer):
+            return self._buffer
+        return self._buffer[self._offset:self._offset + self._length]
+
+    @bibsrc.setter
+    def bibsrc(self, src):
+        self._buffer, self._offset, self._length = src, 0, len(src)
+
+    def shareSource(self, buffer, offset):
+        """Replace the own copy of :attr:`bibsrc` by a reference to the string `buffer`, which
+        contains the same text at position `offset`.
+        """
+        self._buffer, self._offset = buffer, offset
+
+    def internMacros(self, macros):
+        """Replace the :class:`MacroReference` objects in the field values by the shared ones in
+        the dictionary `macros` (see :attr:`BibFile.macroReferences`). Unknown references are
+        added to `macros`.
+        """
+        self._macros = macros
+        for index, value in enumerate(self._values):
+            self._values[index] = _internMacros(value, macros)
+
+    def __reduce__(self):
+        # needed for pickling (e.g. when parsing in worker processes) since __init__ requires
+        # arguments. A shared buffer is pickled only once for all entries.
+        # Field values are pickled as they are, i.e., undecoded for a :class:`LazyEntry`.
+        return (self.__class__, (self.entrytype, self.citekey,
+                                 OrderedDict(zip(self._layout, self._values)), self._buffer),
+                (None, {'_offset': self._offset, '_length': self._length,
+                        '_macros': self._macros, '_assigned': self._assigned,
+                        'modified': self.modified}))
+
+    def toBibtex(self):
+        """Return the BibTeX source of this entry, built from its current field values.
+
+        Fields which have not been assigned since the entry was parsed are written exactly as in
+        :attr:`bibsrc`, since decoding a value loses information such as the braces protecting
+        words from case changes or the word "and" in names from being split.
+        """
+        from bibtexvcs.parser import fieldSources
+        try:
+            sources = fieldSources(self.bibsrc)
+        except DatabaseFormatError:
+            sources = {}
+        assigned = self._assigned or ()
+        fields = []
+        for key in self:
+            if key in sources and key not in assigned:
+                fields.append(',\n  {} = {}'.format(key, sources[key]))
+            else:
+                fields.append(',\n  {} = {}'.format(key, _formatValue(self[key])))
+        return '@{}{{{}{}\n}}'.format(self.entrytype, self.citekey, ''.join(fields))
+
     def filename(self):
         """Returns the filename referenced in the BibTeX ``file`` field in `JabRef`_'s format.
 
@@ -194,8 +584,58 @@ class Entry(DatabaseElement, OrderedDict):
         return "{}({}) by {}".format(self.entrytype, self.citekey, self.get("author"))
 
 
+def _formatValue(value):
+    """Return the BibTeX source of a field value."""
+    if isinstance(value, MacroReference):
+        return value.name
+    if isinstance(value, Name):
+        return '{' + value.toBibtex() + '}'
+    if isinstance(value, list):
+        if all(isinstance(part, Name) for part in value):
+            return '{' + ' and '.join(name.toBibtex() for name in value) + '}'
+        return ' # '.join(_formatValue(part) for part in value)
+    return '{' + value + '}'
+
+
+class FieldSpan:
+    """Position of a field value, which is not yet decoded, in the source of a
+    :class:`LazyEntry`.
+    """
+    __slots__ = ('start', 'end')
+
+    def __init__(self, start, end):
+        self.start = start
+        self.end = end
+
+
+class LazyEntry(Entry):
+    """An :class:`Entry` whose fields are (partly) decoded on first access.
+
+    Instead of some field values, the parser only records their :class:`FieldSpan` in
+    :attr:`bibsrc`. When such a field is accessed through the mapping interface, its value is
+    decoded (see :func:`bibtexvcs.parser.decodeField`) and stored in place of the span. The
+    ``'fast'`` parser backend does this for the ``author`` and ``editor`` fields, the ``'lazy'``
+    backend for all fields.
+    """
+
+    __slots__ = ()
+
+    def __getitem__(self, key):
+        index = self._layout[key]
+        value = self._values[index]
+        if isinstance(value, FieldSpan):
+            from bibtexvcs.parser import decodeField
+            value = decodeField(self._buffer, key, value, self._offset)
+            if self._macros is not None:
+                value = _internMacros(value, self._macros)
+            self._values[index] = value
+        return value
+
+
 class Comment(DatabaseElement):
     """Represents a comment @COMMENT{<text>}"""
+    __slots__ = ('comment',)
+
     def __init__(self, comment):
         self.comment = comment
 
@@ -209,10 +649,12 @@ class Comment(DatabaseElement):
 
 class ImplicitComment(Comment):
     """Implicit comment in the bib file (everything before the first "@" symbol)."""
-    pass
+    __slots__ = ()
 
 
 class Preamble(DatabaseElement):
+    __slots__ = ('contents',)
+
     def __init__(self, contents):
         self.contents = contents
 
@@ -222,11 +664,35 @@ class Preamble(DatabaseElement):
 
 
 class Name:
+    """A person's name, as contained in the ``author`` and ``editor`` fields.
+
+    Names are immutable, since the parser shares a single :class:`Name` object between all
+    occurrences of the same name.
+    """
+    __slots__ = ('first', 'nobility', 'last', 'suffix')
+
     def __init__(self, last, nobility=None, first=None, suffix=None):
-        self.first = first
-        self.nobility = nobility
-        self.last = last
-        self.suffix = suffix
+        object.__setattr__(self, 'first', first)
+        object.__setattr__(self, 'nobility', nobility)
+        object.__setattr__(self, 'last', last)
+        object.__setattr__(self, 'suffix', suffix)
+
+    def __setattr__(self, name, value):
+        raise AttributeError('Name objects are immutable')
+
+    def __reduce__(self):
+        return self.__class__, (self.last, self.nobility, self.first, self.suffix)
+
+    def __eq__(self, other):
+        return isinstance(other, Name) and \
+            (self.first, self.nobility, self.last, self.suffix) == \
+            (other.first, other.nobility, other.last, other.suffix)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash((self.first, self.nobility, self.last, self.suffix))
 
     def __str__(self):
         return self.last
@@ -237,6 +703,45 @@ class Name:
         """
         return ' '.join((part for part in (self.nobility, self.last, self.suffix) if part))
 
+    def toBibtex(self):
+        """Return the name in BibTeX's ``von Last, Jr, First`` form.
+
+        Parts that would be split differently when parsed again, such as the words of a corporate
+        name, are enclosed in braces.
+        """
+        if self.first is None and self.nobility is None and self.suffix is None:
+            return _protectNamePart(self.last, _LITERAL_NAME_SEPARATOR)
+        parts = [' '.join(part for part in (self.nobility, self.last) if part)]
+        if self.suffix:
+            parts.append(self.suffix)
+        if self.first:
+            parts.append(self.first)
+        return ', '.join(_protectNamePart(part, _NAME_PART_SEPARATOR) for part in parts)
+
+
+#: Text that splits a name in ``von Last, Jr, First`` form or a list of names, and additionally a
+#: name consisting only of a last name, when contained in a name part outside of braces.
+_NAME_PART_SEPARATOR = re.compile(r',|\band\b', re.IGNORECASE)
+_LITERAL_NAME_SEPARATOR = re.compile(r',|\s|\band\b', re.IGNORECASE)
+
+
+def _protectNamePart(part, separator):
+    """Return `part` enclosed in braces if it contains `separator` outside of braces."""
+    depth = 0
+    topLevel = []  # part with each braced group replaced by a single character
+    for char in part:
+        if char == '{':
+            if depth == 0:
+                topLevel.append('_')
+            depth += 1
+        elif char == '}':
+            depth -= 1
+        elif depth == 0:
+            topLevel.append(char)
+    if separator.search(''.join(topLevel)):
+        return '{' + part + '}'
+    return part
+
 
 MONTHS = dict((month[:3].lower(), MacroDefinition(month[:3].lower(), month)) for month in
           ("January", "February", "March", "April", "May", "June", "July", "August",
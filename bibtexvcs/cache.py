@@ -0,0 +1,104 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+# Copyright 2014-2015 Michael Helmling
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 3 as
+# published by the Free Software Foundation
+
+"""The :mod:`cache <bibtexvcs.cache>` module stores parsed bib files on disk, such that an
+unchanged ``.bib`` file does not need to be parsed again by the next process reading it.
+
+A cache file contains two pickles: first the key of the cached bib file (see :func:`cacheKey`),
+then the :class:`BibFile` object itself. Cache files are replaced atomically, so concurrent
+processes (e.g. the GUI and the command line script) never read a partially written cache.
+"""
+from __future__ import division, print_function, unicode_literals
+import hashlib, io, os, pickle, tempfile
+
+import bibtexvcs
+from bibtexvcs.bibfile import BibFile
+
+
+def cacheKey(path, data, backend):
+    """Return the key which a cache of the bib file at `path`, whose contents are the bytes
+    `data`, must match in order to be valid.
+
+    The key consists of the size, modification time and SHA-1 hash of the file, the version of
+    BibTeX VCS and the parser backend.
+    """
+    stat = os.stat(path)
+    return (stat.st_size, stat.st_mtime_ns, hashlib.sha1(data).hexdigest(),
+            bibtexvcs.__version__, backend)
+
+
+def cacheFilename(path, backend, cacheDir):
+    """Return the path of the cache file for the bib file at `path` within `cacheDir`."""
+    pathHash = hashlib.sha1(os.path.abspath(path).encode('UTF-8')).hexdigest()
+    return os.path.join(cacheDir, '{}-{}.pickle'.format(pathHash, backend))
+
+
+def readCache(cacheFile, key):
+    """Return the :class:`BibFile` stored in `cacheFile` if its key equals `key`, and ``None``
+    otherwise (also if the cache file does not exist or can not be read).
+    """
+    try:
+        with io.open(cacheFile, 'rb') as stream:
+            if pickle.load(stream) != key:
+                return None
+            return pickle.load(stream)
+    except Exception:
+        # missing, truncated, or written by an incompatible version
+        return None
+
+
+def writeCache(cacheFile, key, bibfile):
+    """Atomically write `bibfile` with the given `key` to `cacheFile`.
+
+    Failures (e.g. a read-only cache directory) are ignored, since the cache is optional.
+    """
+    cacheDir = os.path.dirname(cacheFile)
+    try:
+        if not os.path.exists(cacheDir):
+            os.makedirs(cacheDir)
+        fd, tmpName = tempfile.mkstemp(dir=cacheDir, suffix='.tmp')
+        try:
+            with io.open(fd, 'wb') as stream:
+                pickle.dump(key, stream, pickle.HIGHEST_PROTOCOL)
+                pickle.dump(bibfile, stream, pickle.HIGHEST_PROTOCOL)
+            os.replace(tmpName, cacheFile)
+        except BaseException:
+            os.remove(tmpName)
+            raise
+    except (OSError, pickle.PicklingError):
+        pass
+
+
+def loadBibFile(path, backend='pyparsing', workers=1, cacheDir=None):
+    """Return a :class:`BibFile` for the ``.bib`` file at `path`, using a cached version if it is
+    still valid.
+
+    On a cache miss, the file is parsed and the result is written to the cache.
+
+    :param backend: The parser backend to use (see :data:`bibtexvcs.parser.BACKENDS`).
+    :param workers: Number of processes used to parse large files.
+    :param cacheDir: Directory of the cache files. Defaults to
+        :func:`bibtexvcs.config.getCachePath`.
+    """
+    if cacheDir is None:
+        from bibtexvcs.config import getCachePath
+        cacheDir = getCachePath()
+    with io.open(path, 'rb') as stream:
+        data = stream.read()
+    key = cacheKey(path, data, backend)
+    cacheFile = cacheFilename(path, backend, cacheDir)
+    bibfile = readCache(cacheFile, key)
+    if bibfile is None:
+        # parse the bytes which were hashed, with the newline handling of text mode files
+        text = io.TextIOWrapper(io.BytesIO(data), encoding='UTF-8')
+        bibfile = BibFile(text, backend=backend, workers=workers)
+        bibfile.filename = path
+        writeCache(cacheFile, key, bibfile)
+    else:
+        bibfile.filename = path
+    return bibfile
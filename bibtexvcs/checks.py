@@ -32,37 +32,682 @@ ensuring that every *journal* or *inproceedings* entry is a macro::
                 if field in entry and not isinstance(entry[field], MacroReference):
                     yield CheckFailed('Entry "{}" has a non-macro {} field "{}"'
                                       .format(entry.citekey, field, entry[field]))
+
+Checks that look at each entry separately should rather be decorated with :func:`entryCheck`.
+Such a check takes the database and a single entry as arguments, and all entry checks are run
+in a single pass over the entries of the bib file. The above example then reads::
+
+    @entryCheck('only macros in journals', inputs=())
+    def checkMacrosInJournals(database, entry):
+        for field in ('inproceedings', 'journal'):
+            if field in entry and not isinstance(entry[field], MacroReference):
+                yield CheckFailed('Entry "{}" has a non-macro {} field "{}"'
+                                  .format(entry.citekey, field, entry[field]))
+
+The ``inputs`` argument declares that the results only depend on the entry itself, so they are
+cached and the check is only run again for entries that have changed (see
+:func:`performDatabaseCheck`). Checks without declared inputs are always run.
+
+Checks must only read the database. A check that exceeds a time limit is abandoned, but may
+continue in the background for a while (see :func:`performDatabaseCheck`); checks that take long
+between two results should therefore return once :func:`isAbandoned` is true.
 """
 
 
 from __future__ import division, print_function, unicode_literals
+import concurrent.futures
+import cProfile
+import io
 import os.path
 import sys
 import inspect
 import imp
-from bibtexvcs.bibfile import MacroReference, MONTHS
-
-
-def performDatabaseCheck(database, exclude=[]):
+import hashlib
+import itertools
+import json
+import marshal
+import multiprocessing
+import pickle
+import struct
+import threading
+import time
+from collections import defaultdict, namedtuple
+
+import bibtexvcs
+from bibtexvcs.bibfile import MacroReference, MONTHS, Name
+from bibtexvcs.cache import cacheFilename, writeCache
+
+
+def loadChecks(database):
+    """Return a dict mapping check names to the check functions defined in this module and in the
+    local ``checks.py`` file of `database`. Local checks replace built-in ones of the same name.
+    """
     me = sys.modules[__name__]
     checks = {fun.checkName: fun for fname, fun in inspect.getmembers(me, inspect.isfunction)
                                  if hasattr(fun, 'checkName')}
     if os.path.exists(database.checksPath):
+        # load a fresh module, such that checks removed from the file do not linger
+        sys.modules.pop('checks', None)
         localChecks = imp.load_source('checks', database.checksPath)
         for fname, fun in inspect.getmembers(localChecks, inspect.isfunction):
             if hasattr(fun, 'checkName'):
                 checks[fun.checkName] = fun
-    errors = []
-    warnings = []
+    return checks
+
+
+#: Minimum number of entries for which the entry checks are distributed over several processes
+#: by :func:`performDatabaseCheck`.
+PARALLEL_CHECK_THRESHOLD = 2000
+
+#: Functions returning the global inputs that checks can declare (see :func:`databaseCheck`) as
+#: strings, from which the keys of cached check results are computed.
+CHECK_INPUTS = {
+    'bibfile': lambda database: database.bibfile.source,
+    'macros': lambda database: json.dumps(sorted(database.macros.items())),
+    'journals': lambda database: json.dumps([list(journal)
+                                             for journal in database.journals.values()]),
+    'documents': lambda database: '\n'.join(sorted(database.existingDocuments())),
+    'config': lambda database: _readFile(database.configPath),
+}
+
+
+def _readFile(path):
+    with io.open(path, 'rt', encoding='UTF-8') as stream:
+        return stream.read()
+
+
+def _digest(text):
+    return hashlib.sha1(text.encode('UTF-8')).hexdigest()
+
+
+def _checkDigest(check):
+    """Return a digest of the source code of the module defining `check` (or of the check's byte
+    code if the source is not available), such that changing a check, or the constants and
+    helper functions of its module, invalidates its cached results.
+    """
+    try:
+        return _digest(inspect.getsource(sys.modules[check.__module__]))
+    except (KeyError, OSError, TypeError):
+        return hashlib.sha1(marshal.dumps(check.__code__)).hexdigest()
+
 
+CheckProfile = namedtuple('CheckProfile', 'name wallTime cpuTime entries results')
+CheckProfile.__doc__ = """Resource usage of a check, as returned by :func:`performDatabaseCheck`:
+the wall and CPU time in seconds, the number of entries the check was run on (``None`` for
+database checks) and the number of its results."""
+
+
+class CheckResults(namedtuple('CheckResults', 'errors warnings')):
+    """Results of :func:`performDatabaseCheck`: the lists of :class:`CheckFailed` and
+    :class:`CheckWarning` results.
+
+    .. attribute:: profiles
+
+        If the check run was profiled, the list of :class:`CheckProfile` objects in check order;
+        otherwise ``None``.
+    """
+    profiles = None
+
+
+def _runCheck(check, database, profiler=None):
+    """Run the database check `check` and return its results together with the wall and CPU time
+    it took. If given, `profiler` (a :class:`cProfile.Profile`) is enabled while it runs.
+    """
+    wallTime, cpuTime = time.perf_counter(), time.thread_time()
+    if profiler is not None:
+        profiler.enable()
+    try:
+        results = list(check(database))
+    finally:
+        if profiler is not None:
+            profiler.disable()
+    return results, time.perf_counter() - wallTime, time.thread_time() - cpuTime
+
+
+class _Limits(object):
+    """Time limits and fail-fast state of a check run (see :func:`performDatabaseCheck`), shared
+    by the threads running the checks.
+    """
+
+    def __init__(self, timeout, budget, maxErrors):
+        self.timeout = timeout
+        self.budget = budget
+        self.end = None if budget is None else time.perf_counter() + budget
+        self.maxErrors = maxErrors
+        self.errors = 0
+        self.failFast = False
+        self.elapsed = defaultdict(float)
+        self.timedOut = set()
+        self.lock = threading.Lock()
+
+    def overBudget(self):
+        return self.end is not None and time.perf_counter() > self.end
+
+    @property
+    def stopped(self):
+        """Whether no more checks should be run."""
+        return self.failFast or self.overBudget()
+
+    def active(self, checkName):
+        """Whether the check `checkName` should continue."""
+        return checkName not in self.timedOut and not self.stopped
+
+    def record(self, checkName, elapsed, results):
+        """Record that the check `checkName` took another `elapsed` seconds and produced
+        `results`.
+        """
+        with self.lock:
+            self.errors += sum(1 for ans in results if isinstance(ans, CheckFailed))
+            if self.maxErrors is not None and self.errors >= self.maxErrors:
+                self.failFast = True
+            self.elapsed[checkName] += elapsed
+            if self.timeout is not None and self.elapsed[checkName] > self.timeout:
+                self.timedOut.add(checkName)
+
+
+#: Thread-local state of the check runs; ``run`` is the :class:`_CheckRun` or :class:`_EntryPass`
+#: running in the current thread, if any.
+_threadState = threading.local()
+
+
+def isAbandoned():
+    """Return whether the check running in the current thread has been abandoned because of the
+    limits of :func:`performDatabaseCheck`.
+
+    An abandoned check is stopped when it yields its next result, but keeps running in the
+    background until then. Checks that take a long time between two results should call this
+    function regularly and return as soon as it returns ``True``.
+    """
+    run = getattr(_threadState, 'run', None)
+    return run is not None and run.abandoned.is_set()
+
+
+class _CheckRun(object):
+    """A database check running in its own thread under :class:`_Limits`."""
+
+    def __init__(self, name, check):
+        self.name = name
+        self.check = check
+        self.results = []
+        self.started = None
+        self.complete = False
+        self.error = None
+        self.wallTime = self.cpuTime = 0
+        self.finished = threading.Event()
+        self.abandoned = threading.Event()
+
+    def start(self, database, limits, profiler=None):
+        self.started = time.perf_counter()
+        thread = threading.Thread(target=self._run, name='check ' + self.name, daemon=True,
+                                  args=(database, limits, profiler))
+        thread.start()
+
+    def _run(self, database, limits, profiler):
+        _threadState.run = self
+        last = self.started
+        cpuTime = time.thread_time()
+        if profiler is not None:
+            profiler.enable()
+        try:
+            for ans in self.check(database):
+                if self.abandoned.is_set():
+                    break
+                self.results.append(ans)
+                now = time.perf_counter()
+                limits.record(self.name, now - last, [ans])
+                last = now
+                self.wallTime = now - self.started
+                self.cpuTime = time.thread_time() - cpuTime
+                if not limits.active(self.name):
+                    break
+            else:
+                self.complete = True
+        except BaseException as error:
+            self.error = error
+        finally:
+            if profiler is not None:
+                profiler.disable()
+            self.wallTime = time.perf_counter() - self.started
+            self.cpuTime = time.thread_time() - cpuTime
+            self.finished.set()
+
+
+def _scheduleChecks(database, runs, parallel, limits, profilers):
+    """Start the :class:`_CheckRun` objects `runs`, at most `parallel` at a time, and wait until
+    each has finished or is abandoned: because it exceeded the timeout, or because `limits` are
+    stopped. An abandoned check stops at its next result, and its results up to then are used.
+    """
+    pending = list(runs)
+    active = []
+    while pending or active:
+        now = time.perf_counter()
+        for run in list(active):
+            if run.finished.is_set():
+                active.remove(run)
+            elif limits.timeout is not None and now - run.started > limits.timeout:
+                limits.timedOut.add(run.name)
+                run.wallTime = now - run.started
+                run.abandoned.set()
+                active.remove(run)
+        if limits.stopped:
+            for run in active:
+                run.abandoned.set()
+            return
+        while pending and len(active) < max(parallel, 1):
+            run = pending.pop(0)
+            run.start(database, limits, profilers.get(run.name))
+            active.append(run)
+        if active:
+            active[0].finished.wait(0.02)
+
+
+def _runLimited(database, databaseChecks, work, parallel, limits, timings, profilers):
+    """Run the checks like :func:`performDatabaseCheck` does, but within `limits`.
+
+    Database checks run in daemon threads (at most `parallel` at a time), such that a check that
+    exceeds its time limit can be abandoned without blocking. Entry checks run in another daemon
+    thread (see :func:`_checkEntriesLimited`). If checks are profiled, the entry checks only start
+    once the database checks have finished or have been abandoned.
+
+    :returns: A list of (name, (results, wall time, CPU time)) pairs for the database checks, the
+        entry check results as returned by :func:`_checkEntries`, and the set of names of the
+        database checks that did not complete.
+    """
+    # load everything lazily loaded before the threads access the database concurrently
+    database.macros
+    database.existingDocuments()
+    runs = [_CheckRun(name, check) for name, check in databaseChecks]
+    scheduler = threading.Thread(target=_scheduleChecks, name='check scheduler', daemon=True,
+                                 args=(database, runs, parallel, limits, profilers))
+    scheduler.start()
+    if profilers:
+        scheduler.join()
+    computed = _checkEntriesLimited(database, work, timings, profilers, limits)
+    scheduler.join()
+    incomplete = set()
+    databaseResults = []
+    for run in runs:
+        if run.finished.is_set() and run.error is not None:
+            raise run.error
+        if not (run.finished.is_set() and run.complete):
+            incomplete.add(run.name)
+        databaseResults.append((run.name, (list(run.results), run.wallTime, run.cpuTime)))
+    return databaseResults, computed, incomplete
+
+
+def _checkEntries(database, work, timings=None, profilers={}, limits=None, run=None):
+    """Run the entry checks on the entries given by `work`, a list of pairs of an entry and a list
+    of (name, check) pairs, in a single pass. Returns a dict mapping (check name, citekey) pairs
+    to lists of results.
+
+    If `timings` is a dict, the wall time, CPU time and number of entries of each check are added
+    to the list ``timings[name]`` (which is created if necessary), and checks with a profiler in
+    `profilers` are profiled. If `limits` (see :class:`_Limits`) is given, a check is not run on
+    further entries once it is no longer active. If `run` (an :class:`_EntryPass`) is given, the
+    results are stored in its dict, its current check is recorded, and the pass stops once it is
+    abandoned; the results of a call during which it was abandoned are dropped.
+    """
+    results = {} if run is None else run.results
+    for entry, entryChecks in work:
+        if limits is not None and limits.stopped:
+            break
+        for checkName, check in entryChecks:
+            if limits is not None and not limits.active(checkName):
+                continue
+            if timings is None and limits is None:
+                results[checkName, entry.citekey] = list(check(database, entry))
+                continue
+            profiler = profilers.get(checkName)
+            wallTime, cpuTime = time.perf_counter(), time.thread_time()
+            if run is not None:
+                run.current = checkName, wallTime
+            if profiler is not None:
+                profiler.enable()
+            try:
+                checkResults = list(check(database, entry))
+            finally:
+                if profiler is not None:
+                    profiler.disable()
+            if run is not None:
+                if run.abandoned.is_set():
+                    return results
+                run.current = None
+            results[checkName, entry.citekey] = checkResults
+            wallTime = time.perf_counter() - wallTime
+            if limits is not None:
+                limits.record(checkName, wallTime, checkResults)
+            if timings is not None:
+                timing = timings.setdefault(checkName, [0, 0, 0])
+                timing[0] += wallTime
+                timing[1] += time.thread_time() - cpuTime
+                timing[2] += 1
+    return results
+
+
+class _EntryPass(object):
+    """A pass of :func:`_checkEntries` over `work` running in its own thread under
+    :class:`_Limits`, which stores its results in the dict `results`.
+
+    .. attribute:: current
+
+        Pair of the name of the entry check currently running and the time it was called, or
+        ``None``.
+    """
+
+    def __init__(self, work, results):
+        self.work = work
+        self.results = results
+        self.current = None
+        self.error = None
+        self.finished = threading.Event()
+        self.abandoned = threading.Event()
+
+    def start(self, database, timings, profilers, limits):
+        thread = threading.Thread(target=self._run, name='entry checks', daemon=True,
+                                  args=(database, timings, profilers, limits))
+        thread.start()
+
+    def _run(self, database, timings, profilers, limits):
+        _threadState.run = self
+        try:
+            _checkEntries(database, self.work, timings, profilers, limits, self)
+        except BaseException as error:
+            self.error = error
+        finally:
+            self.finished.set()
+
+
+def _checkEntriesLimited(database, work, timings, profilers, limits):
+    """Like :func:`_checkEntries` with `limits`, but run the checks in a daemon thread, such that
+    a single call of an entry check that exceeds the check's timeout, or the budget, is abandoned
+    as well. After a check has been abandoned, the remaining entry checks continue in a new
+    thread.
+    """
+    results = {}
+    while work:
+        run = _EntryPass(work, results)
+        run.start(database, timings, profilers, limits)
+        while not run.finished.wait(0.02):
+            current = run.current
+            if limits.stopped:
+                break
+            if current is not None and limits.timeout is not None:
+                checkName, started = current
+                if limits.elapsed[checkName] + time.perf_counter() - started > limits.timeout:
+                    limits.timedOut.add(checkName)
+                    break
+        if run.finished.is_set():
+            if run.error is not None:
+                raise run.error
+            break
+        run.abandoned.set()
+        work = [(entry, [(checkName, check) for checkName, check in entryChecks
+                         if limits.active(checkName) and (checkName, entry.citekey) not in results])
+                for entry, entryChecks in work]
+        work = [(entry, entryChecks) for entry, entryChecks in work if entryChecks]
+    return dict(results)
+
+
+#: The database whose entries a worker process of :func:`_checkEntriesParallel` checks.
+_workerDatabase = None
+
+
+def _initCheckWorker(database):
+    global _workerDatabase
+    _workerDatabase = database
+
+
+def _checkShard(work, profile):
+    """Run the entry checks on the shard `work` of the worker's database, which is given as a list
+    of pairs of a citekey and a list of check names. Runs in a worker process.
+
+    :returns: The results and, if `profile` is set, the timings (see :func:`_checkEntries`).
+    """
+    database = _workerDatabase
+    checks = loadChecks(database)
+    timings = {} if profile else None
+    results = _checkEntries(database, [(database.bibfile[citekey],
+                                        [(name, checks[name]) for name in names])
+                                       for citekey, names in work], timings)
+    return results, timings
+
+
+def _checkEntriesParallel(database, work, workers, timings=None):
+    """Like :func:`_checkEntries`, but distribute the entries over `workers` processes if there
+    are at least :data:`PARALLEL_CHECK_THRESHOLD` of them.
+
+    Each process receives a copy of `database` as loaded in memory, and runs the checks on a
+    contiguous slice of its entries. The processes are started with the ``spawn`` method, since
+    forking a process while other threads are running (e.g. those running the database checks, or
+    those of the GUI) is unsafe.
+    """
+    if len(work) < PARALLEL_CHECK_THRESHOLD:
+        return _checkEntries(database, work, timings)
+    work = [(entry.citekey, [name for name, _ in entryChecks]) for entry, entryChecks in work]
+    size = -(-len(work) // workers)
+    shards = [work[start:start + size] for start in range(0, len(work), size)]
+    results = {}
+    with concurrent.futures.ProcessPoolExecutor(workers, multiprocessing.get_context('spawn'),
+                                                _initCheckWorker, (database,)) as executor:
+        for shardResults, shardTimings in executor.map(_checkShard, shards,
+                                                       [timings is not None] * len(shards)):
+            results.update(shardResults)
+            for checkName, shardTiming in (shardTimings or {}).items():
+                timing = timings.setdefault(checkName, [0, 0, 0])
+                for i, value in enumerate(shardTiming):
+                    timing[i] += value
+    return results
+
+
+def _readResultCache(cacheFile):
+    try:
+        with io.open(cacheFile, 'rb') as stream:
+            if pickle.load(stream) == bibtexvcs.__version__:
+                return pickle.load(stream)
+    except Exception:
+        pass
+    return {}
+
+
+def performDatabaseCheck(database, exclude=[], parallel=None, cacheDir=None, profile=False,
+                         profileDir=None, timeout=None, budget=None, maxErrors=None):
+    """Run all checks (see :func:`loadChecks`) whose names are not in `exclude` on `database`.
+
+    Database checks are run one after the other, whereas all entry checks are run together in a
+    single pass over the entries.
+
+    If `parallel` is larger than 1, up to `parallel` database checks, which are typically I/O
+    bound, run concurrently in a thread pool, while the entries of a large bib file are
+    distributed over a pool of `parallel` processes for the entry checks (see
+    :data:`PARALLEL_CHECK_THRESHOLD`). `parallel` defaults to the database's
+    :attr:`checkWorkers <bibtexvcs.database.Database.checkWorkers>`.
+
+    If the database's :attr:`parseCache <bibtexvcs.database.Database.parseCache>` is set, the
+    results of checks that declare their inputs (see :func:`databaseCheck`) are cached in
+    `cacheDir` (defaults to :func:`bibtexvcs.config.getCachePath`). A cached result is reused as
+    long as the source code of the check's module and its declared inputs, as well as the source
+    of the entry for entry checks, are unchanged. Hence usually only the entries changed since the last
+    run are checked again.
+
+    If `profile` is set, the resource usage of each check is measured (see :class:`CheckProfile`).
+    If additionally `profileDir` is given, each check that is run is profiled with
+    :mod:`cProfile`, and the statistics are written to the file ``<profileDir>/<check
+    name>.pstats``, which can be read with :mod:`pstats`. Since :mod:`cProfile` can only profile
+    the current thread, the checks then run one after the other; only a check abandoned due to
+    the limits below may still be running in the background. No statistics are written for checks
+    that have not been run, e.g. because the time budget was used up before. When profiling, cached
+    results are not used, such that all checks are measured; the cache is updated as usual.
+
+    The run can be limited by a `timeout` in seconds per check, a time `budget` in seconds for
+    all checks, and a maximum number `maxErrors` of :class:`CheckFailed` results (fail-fast mode);
+    they default to the database's :attr:`checkTimeout
+    <bibtexvcs.database.Database.checkTimeout>`, :attr:`checkBudget
+    <bibtexvcs.database.Database.checkBudget>` and :attr:`checkMaxErrors
+    <bibtexvcs.database.Database.checkMaxErrors>`. A check exceeding its timeout, or still
+    running when the budget is used up, is abandoned: its results so far are kept and a
+    :class:`CheckAbandoned` warning is reported. The checks then run in separate threads, such
+    that even a check that hangs, on the whole database or on a single entry, does not block. An
+    abandoned check may keep running in the background until its next result, or until it
+    notices through :func:`isAbandoned` that it has been abandoned, i.e., possibly after this
+    function has returned and while the database is changed. Hence checks must not modify the
+    database. After `maxErrors` failures, all checks are stopped and at most `maxErrors` failures
+    are returned. The limits must be positive; ``None`` means no limit.
+
+    :returns: The lists of the :class:`CheckFailed` and :class:`CheckWarning` results, ordered by
+        check and, within entry checks, by entry.
+    :rtype: :class:`CheckResults`
+    """
+    if parallel is None:
+        parallel = database.checkWorkers
+    if timeout is None:
+        timeout = database.checkTimeout
+    if budget is None:
+        budget = database.checkBudget
+    if maxErrors is None:
+        maxErrors = database.checkMaxErrors
+    for name, value in ('timeout', timeout), ('budget', budget), ('maxErrors', maxErrors):
+        if value is not None and value <= 0:
+            raise ValueError('{} must be positive, not {}'.format(name, value))
+    if profileDir is not None:
+        parallel = 1
+    checks = {name: check for name, check in loadChecks(database).items()
+              if name not in exclude}
+    cached, newCache, cacheFile = {}, {}, None
+    if database.parseCache:
+        if cacheDir is None:
+            from bibtexvcs.config import getCachePath
+            cacheDir = getCachePath()
+        cacheFile = cacheFilename(database.directory, 'checks', cacheDir)
+        if not profile and profileDir is None:
+            cached = _readResultCache(cacheFile)
+    inputDigests = {}
+    keys = {}  # check name -> cache key prefix, or None if the check is not cached
+    for checkName, check in checks.items():
+        inputs = getattr(check, 'checkInputs', None)
+        if cacheFile is None or inputs is None:
+            keys[checkName] = None
+            continue
+        for name in inputs:
+            if name not in inputDigests:
+                inputDigests[name] = _digest(CHECK_INPUTS[name](database))
+        keys[checkName] = (checkName, _checkDigest(check),
+                           tuple(inputDigests[name] for name in sorted(inputs)))
+
+    results = {}
+    databaseChecks = []
+    entryChecks = []
     for checkName, check in checks.items():
-        if checkName not in exclude:
-            for ans in check(database):
-                if isinstance(ans, CheckFailed):
-                    errors.append(ans)
-                else:
-                    warnings.append(ans)
-    return errors, warnings
+        if keys[checkName] in cached:
+            results[checkName] = newCache[keys[checkName]] = cached[keys[checkName]]
+        elif getattr(check, 'isEntryCheck', False):
+            entryChecks.append((checkName, check))
+        else:
+            databaseChecks.append((checkName, check))
+    # find the entry checks that need to be run for each entry
+    entryResults = {}
+    work = []
+    entryDigests = {}
+    if entryChecks:
+        for entry in database.bibfile.values():
+            pending = []
+            for checkName, check in entryChecks:
+                if keys[checkName] is not None:
+                    if entry.citekey not in entryDigests:
+                        entryDigests[entry.citekey] = _digest(entry.bibsrc)
+                    key = keys[checkName] + (entryDigests[entry.citekey],)
+                    if key in cached:
+                        entryResults[checkName, entry.citekey] = newCache[key] = cached[key]
+                        continue
+                pending.append((checkName, check))
+            if pending:
+                work.append((entry, pending))
+
+    timings = {} if profile or profileDir is not None else None
+    profilers = {}
+    if profileDir is not None:
+        profilers = {name: cProfile.Profile() for name, _ in databaseChecks + entryChecks}
+    incomplete = set()
+    limits = None
+    if timeout is not None or budget is not None or maxErrors is not None:
+        limits = _Limits(timeout, budget, maxErrors)
+        databaseResults, computed, incomplete = _runLimited(database, databaseChecks, work,
+                                                            parallel, limits, timings, profilers)
+    elif parallel > 1:
+        # load everything lazily loaded before the threads access the database concurrently
+        database.macros
+        database.existingDocuments()
+        with concurrent.futures.ThreadPoolExecutor(parallel) as executor:
+            futures = [(name, executor.submit(_runCheck, check, database))
+                       for name, check in databaseChecks]
+            computed = _checkEntriesParallel(database, work, parallel, timings)
+            databaseResults = [(name, future.result()) for name, future in futures]
+    else:
+        databaseResults = [(name, _runCheck(check, database, profilers.get(name)))
+                           for name, check in databaseChecks]
+        computed = _checkEntries(database, work, timings, profilers)
+    for checkName, (checkResults, wallTime, cpuTime) in databaseResults:
+        results[checkName] = checkResults
+        if timings is not None:
+            timings[checkName] = [wallTime, cpuTime, None]
+    entryResults.update(computed)
+
+    for checkName, _ in databaseChecks:
+        if keys[checkName] is not None and checkName not in incomplete:
+            newCache[keys[checkName]] = results[checkName]
+    for (checkName, citekey), checkResults in computed.items():
+        if keys[checkName] is not None:
+            newCache[keys[checkName] + (entryDigests[citekey],)] = checkResults
+    if cacheFile is not None and newCache.keys() != cached.keys():
+        writeCache(cacheFile, bibtexvcs.__version__, newCache)
+
+    for checkName, _ in entryChecks:
+        results[checkName] = [ans for citekey in database.bibfile
+                              for ans in entryResults.get((checkName, citekey), ())]
+    incomplete.update(checkName for entry, pending in work for checkName, _ in pending
+                      if (checkName, entry.citekey) not in computed)
+    errors = []
+    warnings = []
+    for checkName in checks:
+        for ans in results[checkName]:
+            if isinstance(ans, CheckFailed):
+                errors.append(ans)
+            else:
+                warnings.append(ans)
+    if limits is not None:
+        # results replayed from the cache are not counted while checking; reaching maxErrors
+        # only stops the run if some checks are left unfinished
+        stopped = limits.failFast and bool(incomplete - limits.timedOut)
+        if stopped or (maxErrors is not None and len(errors) > maxErrors):
+            del errors[maxErrors:]
+            warnings.append(CheckAbandoned('Stopped checking after {} failed check(s).'
+                                           .format(maxErrors)))
+        for checkName in checks:
+            if checkName in limits.timedOut:
+                warnings.append(CheckAbandoned('The check "{}" exceeded its time limit of {} '
+                                               'seconds and was abandoned.'
+                                               .format(checkName, timeout)))
+            elif checkName in incomplete and not limits.failFast:
+                warnings.append(CheckAbandoned('The check "{}" was abandoned because the time '
+                                               'budget of {} seconds was used up.'
+                                               .format(checkName, budget)))
+    if profileDir is not None:
+        if not os.path.exists(profileDir):
+            os.makedirs(profileDir)
+        for checkName, profiler in profilers.items():
+            if not profiler.getstats():
+                continue  # the check has not been run
+            fileName = checkName.replace('/', '_').replace(os.sep, '_') + '.pstats'
+            profiler.dump_stats(os.path.join(profileDir, fileName))
+    checkResults = CheckResults(errors, warnings)
+    if profile:
+        checkResults.profiles = []
+        for checkName, check in checks.items():
+            wallTime, cpuTime, entries = timings.get(checkName, (0, 0, 0))
+            if entries == 0 and not getattr(check, 'isEntryCheck', False):
+                entries = None
+            checkResults.profiles.append(CheckProfile(checkName, wallTime, cpuTime, entries,
+                                                      len(results[checkName])))
+    return checkResults
 
 
 class CheckFailed(Exception):
@@ -73,35 +718,61 @@ class CheckWarning(Warning):
     pass
 
 
-def databaseCheck(name):
-    """Function decorator for database checks.
+class CheckAbandoned(CheckWarning):
+    """Warning reported when checks have been stopped before completion due to time limits or
+    fail-fast mode (see :func:`performDatabaseCheck`), such that the results are incomplete.
+    """
+    pass
+
+
+def databaseCheck(name, inputs=None):
+    """Function decorator for database checks, which take the database as argument.
 
     :param name: a (unique) description text for the check.
+    :param inputs: If given, the names of the inputs (keys of :data:`CHECK_INPUTS`) that the
+        results of the check depend on. The results are then cached and the check is only run
+        again when one of those inputs changes (see :func:`performDatabaseCheck`).
     """
     def wrap(func):
         func.checkName = name
+        func.checkInputs = inputs
+        func.isEntryCheck = False
         return func
     return wrap
 
 
-@databaseCheck('macro references')
-def checkMacros(database):
-    """Check if all macros referenced in the database exist in its journals file."""
-    bib = database.bibfile
-    for entry in bib.values():
-        for field, value in entry.items():
-            if isinstance(value, MacroReference):
-                if value.name in bib.macroDefinitions or value.name in database.journals:
-                    continue
-                if value.name in MONTHS:
-                    continue
-                yield CheckFailed("The macro '{m}' used for field '{f}' in bibtex "
-                                  "entry '{e}' is defined neither in the database nor "
-                                  "in the journals file."
-                                  .format(f=field, m=value.name, e=entry.citekey))
-
-
-@databaseCheck('file links')
+def entryCheck(name, inputs=None):
+    """Function decorator for entry checks, which take the database and a single entry of its bib
+    file as arguments.
+
+    :param name: a (unique) description text for the check.
+    :param inputs: Like for :func:`databaseCheck`, but the results for an entry additionally
+        depend on the entry itself. Use ``()`` for checks that depend on the entry only.
+    """
+    def wrap(func):
+        func.checkName = name
+        func.checkInputs = inputs
+        func.isEntryCheck = True
+        return func
+    return wrap
+
+
+@entryCheck('macro references', inputs=('macros',))
+def checkMacros(database, entry):
+    """Check if all macros referenced in the entry exist in the database or its journals file."""
+    for field, value in entry.items():
+        if isinstance(value, MacroReference):
+            if value.name in database.bibfile.macroDefinitions or value.name in database.journals:
+                continue
+            if value.name in MONTHS:
+                continue
+            yield CheckFailed("The macro '{m}' used for field '{f}' in bibtex "
+                              "entry '{e}' is defined neither in the database nor "
+                              "in the journals file."
+                              .format(f=field, m=value.name, e=entry.citekey))
+
+
+@databaseCheck('file links', inputs=('bibfile', 'documents'))
 def checkFileLinks(database):
     """Check that the files linked to in the database match those existing in the `documents`
     directory. Additionally, check that all documents are contained in the `documents` directory.
@@ -120,7 +791,7 @@ def checkFileLinks(database):
                           .format("\n".join(fsFilesSet - dbFilesSet)))
 
 
-@databaseCheck('ASCII filenames')
+@databaseCheck('ASCII filenames', inputs=('documents',))
 def checkASCIIFilenames(database):
     """Check that all file names are ASCII. This is sensible because non-ASCII file names lead
     to problems with most VCS systems.
@@ -132,40 +803,47 @@ def checkASCIIFilenames(database):
             yield CheckFailed('The file name "{}" contains non-ASCII characters.'.format(filename))
 
 
-@databaseCheck('month macros')
-def checkMonthMacros(database):
+@databaseCheck('duplicate documents')
+def checkDuplicateDocuments(database):
+    """Check that no two files in the `documents` directory have the same contents."""
+    for paths in database.duplicateDocuments():
+        yield CheckWarning('The following files in the documents directory are identical:\n{}'
+                           .format('\n'.join(paths)))
+
+
+@entryCheck('month macros', inputs=())
+def checkMonthMacros(database, entry):
     """Checks that the ``month`` field only contains (proper) macros."""
-    for entry in database.bibfile.values():
-        if 'month' not in entry:
-            continue
-        month = entry['month']
-        if isinstance(month, str):
-            yield CheckFailed("Month field in entry '{e}' contains the string '{s}' instead "
-                              "of a month macro.".format(e=entry.citekey, s=month))
-        elif isinstance(month, MacroReference):
-            if month.name not in MONTHS:
-                yield CheckFailed("Invalid month macro '{}' used in entry '{}'"
-                                 .format(month.name, entry.citekey))
-        else:
-            #  must be a list of macros
-            if len(month) % 2 != 1:
-                yield CheckFailed("Invalid month definition '{}' in '{}': Must be either a single "
-                                 "month macro or of the format 'mar / apr'."
-                                 .format(month, entry.citekey))
-                continue
-            separators = [ month[i] for i in range(1, len(month), 2) ]
-            macros = [ month[i] for i in range(0, len(month), 2) ]
-            for separator in separators:
-                if separator.strip() != '/':
-                    yield CheckFailed("Invalid month definition '{}' in '{}': Expected '/' but got "
-                                      "'{}".format(month, entry.citekey, separator.strip()))
-            for macro in macros:
-                if not isinstance(macro, MacroReference) or macro.name not in MONTHS:
-                    yield CheckFailed("Invalid month definition '{}' in '{}'"
-                                      .format(month, entry.citekey))
-
-
-@databaseCheck('jabref file directory')
+    if 'month' not in entry:
+        return
+    month = entry['month']
+    if isinstance(month, str):
+        yield CheckFailed("Month field in entry '{e}' contains the string '{s}' instead "
+                          "of a month macro.".format(e=entry.citekey, s=month))
+    elif isinstance(month, MacroReference):
+        if month.name not in MONTHS:
+            yield CheckFailed("Invalid month macro '{}' used in entry '{}'"
+                             .format(month.name, entry.citekey))
+    else:
+        #  must be a list of macros
+        if len(month) % 2 != 1:
+            yield CheckFailed("Invalid month definition '{}' in '{}': Must be either a single "
+                             "month macro or of the format 'mar / apr'."
+                             .format(month, entry.citekey))
+            return
+        separators = [ month[i] for i in range(1, len(month), 2) ]
+        macros = [ month[i] for i in range(0, len(month), 2) ]
+        for separator in separators:
+            if separator.strip() != '/':
+                yield CheckFailed("Invalid month definition '{}' in '{}': Expected '/' but got "
+                                  "'{}".format(month, entry.citekey, separator.strip()))
+        for macro in macros:
+            if not isinstance(macro, MacroReference) or macro.name not in MONTHS:
+                yield CheckFailed("Invalid month definition '{}' in '{}'"
+                                  .format(month, entry.citekey))
+
+
+@databaseCheck('jabref file directory', inputs=('bibfile', 'config'))
 def checkJabrefFileDirectory(database):
     identifier = 'jabref-meta: fileDirectory:'
     for comment in database.bibfile.comments:
@@ -175,47 +853,132 @@ def checkJabrefFileDirectory(database):
                                   'the configured one.')
 
 
-@databaseCheck('required BibTeX fields')
-def checkRequiredFields(database):
+#: Fields required by :func:`checkRequiredFields` for each entry type. A tuple of fields means
+#: that one of them is required.
+REQUIRED_FIELDS = {
+    'article'      : ('author', 'title', 'journal', 'year'),
+    'book'         : (('author', 'editor'), 'title', 'publisher', 'year'),
+    'booklet'      : ('title',),
+    'incollection' : ('author', 'title', 'booktitle', 'publisher', 'year'),
+    'inproceedings': ('author', 'title', 'booktitle', 'year'),
+    'mastersthesis': ('author', 'title', 'school', 'year'),
+    'phdthesis'    : ('author', 'title', 'school', 'year'),
+    'misc'         : (),
+    'techreport'   : ('author', 'title', 'institution', 'year'),
+    'unpublished'  : ('author', 'title', 'note'),
+    'online'       : (('author', 'editor'), 'title', 'year', 'url')
+}
+
+
+@entryCheck('required BibTeX fields', inputs=())
+def checkRequiredFields(database, entry):
     """Checks that all required fields exist for each entry."""
-    requiredFields = {
-        'article'      : ('author', 'title', 'journal', 'year'),
-        'book'         : (('author', 'editor'), 'title', 'publisher', 'year'),
-        'booklet'      : ('title',),
-        'incollection' : ('author', 'title', 'booktitle', 'publisher', 'year'),
-        'inproceedings': ('author', 'title', 'booktitle', 'year'),
-        'mastersthesis': ('author', 'title', 'school', 'year'),
-        'phdthesis'    : ('author', 'title', 'school', 'year'),
-        'misc'         : (),
-        'techreport'   : ('author', 'title', 'institution', 'year'),
-        'unpublished'  : ('author', 'title', 'note'),
-        'online'       : (('author', 'editor'), 'title', 'year', 'url')
-    }
-    for entry in database.bibfile.values():
-        if entry.entrytype not in requiredFields:
-            yield CheckWarning('Entry "{}": Required fields for type "{}" unknown'
-                               .format(entry.citekey, entry.entrytype))
+    if entry.entrytype not in REQUIRED_FIELDS:
+        yield CheckWarning('Entry "{}": Required fields for type "{}" unknown'
+                           .format(entry.citekey, entry.entrytype))
+    else:
+        for req in REQUIRED_FIELDS[entry.entrytype]:
+            if isinstance(req, tuple):
+                if not any(subReq in entry for subReq in req):
+                    yield CheckFailed('Entry "{}" of type "{}" requires one of the fields: {}'
+                                      .format(entry.citekey, entry.entrytype, ', '.join(req)))
+            elif req not in entry:
+                yield CheckFailed('Entry "{}" of type "{}" requires field "{}"'
+                                  .format(entry.citekey, entry.entrytype, req))
+
+
+@entryCheck('entry owners', inputs=())
+def checkOwnerExists(database, entry):
+    if 'owner' not in entry:
+        yield CheckFailed('Entry "{}" has no owner.'.format(entry.citekey))
+
+
+@entryCheck('marked entries', inputs=())
+def checkNoMarkedEntry(database, entry):
+    if '__markedentry' in entry:
+        yield CheckFailed('Entry "{}" is marked in jabref:\n{}'
+                          .format(entry.citekey, entry['__markedentry']))
+
+
+#: Minimum similarity (Jaccard index of the sets of title words) of two entries reported by
+#: :func:`checkDuplicates`.
+DUPLICATE_THRESHOLD = 0.8
+
+#: Buckets of candidates larger than this are not compared pairwise; only entries with identical
+#: titles are reported in them, in order to keep the running time of :func:`checkDuplicates`
+#: near-linear.
+MAX_BUCKET_SIZE = 100
+
+#: Number of bands and rows per band of the MinHash signatures used by :func:`checkDuplicates`.
+#: Their product must be 16. Two entries whose similarity is :data:`DUPLICATE_THRESHOLD` agree in
+#: at least one band with probability 1 - (1 - 0.8^2)^8, i.e., more than 99.9%.
+MINHASH_BANDS, MINHASH_ROWS = 8, 2
+
+
+def _wordHashes(word, cache):
+    """Return 16 independent 32 bit hash values of `word`."""
+    try:
+        return cache[word]
+    except KeyError:
+        digest = hashlib.blake2b(word.encode('UTF-8'), digest_size=64).digest()
+        hashes = cache[word] = struct.unpack('<16I', digest)
+        return hashes
+
+
+def _blockingKey(database, entry):
+    """Return the (lower-case) last name of the first author and the year of `entry`, or ``None``
+    if one of them is missing.
+    """
+    authors = entry.get('author')
+    if isinstance(authors, list) and authors:
+        authors = authors[0]
+    if isinstance(authors, Name) and 'year' in entry:
+        return authors.lastName().lower(), database.strval(entry['year'])
+
+
+@databaseCheck('duplicate entries', inputs=('bibfile', 'macros'))
+def checkDuplicates(database):
+    """Warns about entries whose titles are almost equal (see :data:`DUPLICATE_THRESHOLD`).
+
+    In order to avoid comparing all pairs of entries, candidate pairs are found by
+    locality-sensitive hashing: entries are compared only if they agree in one band of their
+    MinHash signatures, or if they have the same first author and year (see also
+    :data:`MAX_BUCKET_SIZE`).
+    """
+    from bibtexvcs.search import fieldText, tokenize
+    titles = {}
+    buckets = defaultdict(list)
+    hashCache = {}
+    for citekey, entry in database.bibfile.items():
+        words = frozenset(tokenize(fieldText(entry.get('title', ''))))
+        if not words:
+            continue
+        titles[citekey] = words
+        signature = [min(hashes) for hashes in zip(*(_wordHashes(word, hashCache)
+                                                      for word in words))]
+        for band in range(MINHASH_BANDS):
+            buckets[band, tuple(signature[band * MINHASH_ROWS:(band + 1) * MINHASH_ROWS])] \
+                .append(citekey)
+        blockingKey = _blockingKey(database, entry)
+        if blockingKey is not None:
+            buckets[blockingKey].append(citekey)
+    reported = set()
+    for bucket in buckets.values():
+        if isAbandoned():
+            return
+        if len(bucket) > MAX_BUCKET_SIZE:
+            sameTitle = defaultdict(list)
+            for citekey in bucket:
+                sameTitle[titles[citekey]].append(citekey)
+            pairs = ((group[0], other) for group in sameTitle.values() for other in group[1:])
         else:
-            for req in requiredFields[entry.entrytype]:
-                if isinstance(req, tuple):
-                    if not any(subReq in entry for subReq in req):
-                        yield CheckFailed('Entry "{}" of type "{}" requires one of the fields: {}'
-                                          .format(entry.citekey, entry.entrytype, ', '.join(req)))
-                elif req not in entry:
-                    yield CheckFailed('Entry "{}" of type "{}" requires field "{}"'
-                                      .format(entry.citekey, entry.entrytype, req))
-
-
-@databaseCheck('entry owners')
-def checkOwnerExists(database):
-    for entry in database.bibfile.values():
-        if 'owner' not in entry:
-            yield CheckFailed('Entry "{}" has no owner.'.format(entry.citekey))
-
-
-@databaseCheck('marked entries')
-def checkNoMarkedEntry(database):
-    for entry in database.bibfile.values():
-        if '__markedentry' in entry:
-            yield CheckFailed('Entry "{}" is marked in jabref:\n{}'
-                              .format(entry.citekey, entry['__markedentry']))
\ No newline at end of file
+            pairs = itertools.combinations(bucket, 2)
+        for first, second in pairs:
+            pair = (first, second) if first < second else (second, first)
+            if pair in reported:
+                continue
+            similarity = len(titles[first] & titles[second]) / len(titles[first] | titles[second])
+            if similarity >= DUPLICATE_THRESHOLD:
+                reported.add(pair)
+                yield CheckWarning('Entries "{}" and "{}" might be duplicates (title similarity '
+                                   '{:.0%}).'.format(pair[0], pair[1], similarity))
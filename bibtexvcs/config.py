@@ -32,6 +32,20 @@ def getConfigPath():
         confighome = os.path.join(os.environ['HOME'], '.config')
     return os.path.join(confighome, 'bibtexvcs')
 
+
+def getCachePath():
+    """Return the directory for cached data. Defaults to ``~/.cache/bibtexvcs`` on Unix,
+    ``%LOCALAPPDATA%/bibtexvcs`` on Windows, but also respects the ``XDG_CACHE_HOME`` environment
+    variable.
+    """
+    if 'LOCALAPPDATA' in os.environ:
+        cachehome = os.environ['LOCALAPPDATA']
+    elif 'XDG_CACHE_HOME' in os.environ:
+        cachehome = os.environ['XDG_CACHE_HOME']
+    else:
+        cachehome = os.path.join(os.environ['HOME'], '.cache')
+    return os.path.join(cachehome, 'bibtexvcs')
+
 _config = None
 
 
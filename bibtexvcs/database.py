@@ -10,17 +10,29 @@
 database, which consists of a config file, a bib file, a documents directory, and a journals file.
 """
 from __future__ import division, print_function, unicode_literals
-import configparser, io, os, subprocess
+import configparser, hashlib, io, os, shutil, subprocess, tempfile, time
 from collections import OrderedDict
 from os.path import join, exists, relpath
 
 from pkg_resources import resource_string, resource_filename
 
-from bibtexvcs.bibfile import BibFile, MacroReference
+from bibtexvcs.bibfile import BibFile, BibFileChanges, MacroReference, MONTHS
+from bibtexvcs.cache import loadBibFile
+from bibtexvcs.parser import BACKENDS
 from bibtexvcs.vcs import VCSInterface
 
 BTVCSCONF = 'bibtexvcs.conf'  # name of the configuration file
 
+#: Files modified less than this number of seconds before being read by :meth:`Database.reload`
+#: are compared by content on the next reload, since a modification time is not precise enough
+#: to detect later changes within the same interval.
+RACY_INTERVAL = 2
+
+
+#: First line of the generated journal macro files, containing the SHA-1 digest of the journals
+#: file they were generated from.
+JOURNALS_HEADER = '% Generated by bibtexvcs from journals file {}. Do not edit.\n'
+
 
 class DatabaseFormatError(Exception):
     """Raised on any problem in the database layout (unparsable config-file, non-existing
@@ -50,11 +62,41 @@ class Database:
     bibfileName : str
         Name of the main bibtex database file.
     bibfile : :class:`BibFile`
-        :class:`BibFile` object parsed from the bibtex file.
+        :class:`BibFile` object parsed from the bibtex file. It is loaded on first access, so
+        operations that do not need the entries (like :meth:`runJabref`) do not parse it.
     journalsName : str
         Name of the journals file.
     journals : :class:`JournalsFile`
-        :class:`JournalsFile` object read from the journals file.
+        :class:`JournalsFile` object read from the journals file (on first access).
+    parserBackend : str
+        Name of the parser backend used to read the bib file (see
+        :data:`bibtexvcs.parser.BACKENDS`).
+    parserWorkers : int
+        Number of processes used to parse a large bib file.
+    checkWorkers : int
+        Number of threads and processes used to run the database checks (see
+        :func:`bibtexvcs.checks.performDatabaseCheck`).
+    checkTimeout : float
+        Number of seconds after which a single check is abandoned, or ``None``.
+    checkBudget : float
+        Number of seconds after which all remaining checks are abandoned, or ``None``.
+    checkMaxErrors : int
+        Number of failed checks after which checking stops, or ``None``.
+    parseCache : bool
+        Whether the parsed bib file is cached on disk (see :mod:`bibtexvcs.cache`).
+    sqlMirror : bool
+        Whether the SQLite mirror of the database (see :mod:`bibtexvcs.sqlmirror`) is updated on
+        every :meth:`reload`, instead of only when :meth:`sql` is called.
+    macros : dict
+        Maps macro names to their fully expanded values. Contains the month macros, the journals
+        of the journals file and the macros defined in the bib file (in increasing priority).
+    bibfileChanges : :class:`BibFileChanges`
+        Citekeys of the entries added, removed and modified by the last :meth:`reload`. On the
+        first load, all entries count as added.
+    refreshed : frozenset
+        The parts of the database that were refreshed by the last :meth:`reload` because their
+        input files had changed: a subset of ``{'config', 'bibfile', 'journals'}``. Parts that
+        have not been loaded yet are never refreshed.
     name : str
         Name of the database.
     documents : str
@@ -72,18 +114,158 @@ class Database:
         else:
             self.vcsType = 'local'
         self._vcs = vcs
+        self._inputStates = {}  # path -> ((size, mtime, inode), SHA-1 digest, racy)
+        self._bibfile = self._bibfileChanges = self._journals = self._macros = None
+        self._manifest = self._documents = self._fingerprints = None
         self.reload()
 
     def reload(self):
-        """(Re-)loads the database from filesystem."""
-        parser = configparser.ConfigParser()
+        """(Re-)loads the database from filesystem.
+
+        The configuration is read immediately, whereas the bib and journals files are only loaded
+        on first access of :attr:`bibfile` and :attr:`journals`, respectively. Once loaded, they
+        are refreshed only if they have changed since the last call (see :attr:`refreshed`), and
+        only the changed definitions of the bib file are parsed again (see
+        :meth:`BibFile.reload`).
+
+        :returns: The changes of the bib file's entries (see :attr:`bibfileChanges`); empty if
+            the bib file has not been loaded yet.
+        """
+        try:
+            return self._refresh()
+        except BaseException:
+            # the recorded file states might not match the loaded data, so check all files again
+            self._inputStates.clear()
+            raise
+
+    def _refresh(self):
         try:
-            with io.open(self.configPath, encoding='UTF-8') as f:
-                confFile = f.read()
-        except IOError:
+            configChanged = self._inputChanged(self.configPath)
+        except (IOError, OSError):
             raise DatabaseFormatError('Invalid BibTeX VCS directory "{}": '
                                       'Configuration file bibtexvcs.conf not found.'
                                       .format(self.directory))
+        if configChanged:
+            self._readConfig()
+
+        for path in self.bibfilePath, self.journalsPath:
+            if not exists(path):
+                open(path, 'a').close()
+                self.vcs.add(relpath(path, self.directory))
+        # the bib and journals files are only refreshed if they have been loaded before
+        bibfile = self._bibfile
+        changes = BibFileChanges(added=[], removed=[], modified=[])
+        bibChanged = journalsChanged = False
+        if bibfile is not None:
+            if bibfile.filename == self.bibfilePath and bibfile.backend == self.parserBackend:
+                bibfile.workers = self.parserWorkers
+                bibChanged = self._inputChanged(self.bibfilePath)
+                if bibChanged:
+                    changes = bibfile.reload()
+            else:
+                bibChanged = True
+                self._loadBibfile()
+                changes = self._bibfileChanges
+            self._bibfileChanges = changes
+        if self._journals is not None:
+            journalsChanged = self._inputChanged(self.journalsPath) or configChanged
+            if journalsChanged:
+                self._journals = JournalsFile(self.journalsPath)
+        if bibChanged or journalsChanged:
+            self._macros = None
+
+        self.makeJournalBibfiles()  # ensure these are up-to-date
+
+        if not exists(self.documentsPath):
+            os.mkdir(self.documentsPath)
+        self._documents = None  # scan the documents directory again on next access
+        if self.sqlMirror:
+            from bibtexvcs import sqlmirror
+            sqlmirror.synchronize(self)
+        self.refreshed = frozenset(name for name, changed in (('config', configChanged),
+                                                              ('bibfile', bibChanged),
+                                                              ('journals', journalsChanged))
+                                   if changed)
+        return changes
+
+    def _loadBibfile(self):
+        self._inputChanged(self.bibfilePath)  # record the state of the file to be read
+        if self.parseCache:
+            self._bibfile = loadBibFile(self.bibfilePath, backend=self.parserBackend,
+                                        workers=self.parserWorkers)
+        else:
+            self._bibfile = BibFile(self.bibfilePath, backend=self.parserBackend,
+                                    workers=self.parserWorkers)
+        self._bibfileChanges = BibFileChanges(added=list(self._bibfile), removed=[], modified=[])
+        self._macros = None
+
+    @property
+    def bibfile(self):
+        """The :class:`BibFile`, which is parsed on first access."""
+        if self._bibfile is None:
+            self._loadBibfile()
+        return self._bibfile
+
+    @property
+    def bibfileChanges(self):
+        """The changes of the bib file by the last :meth:`reload`."""
+        if self._bibfile is None:
+            self._loadBibfile()
+        return self._bibfileChanges
+
+    @property
+    def journals(self):
+        """The :class:`JournalsFile`, which is read on first access."""
+        if self._journals is None:
+            self._inputChanged(self.journalsPath)  # record the state of the file to be read
+            self._journals = JournalsFile(self.journalsPath)
+        return self._journals
+
+    @journals.setter
+    def journals(self, journals):
+        self._journals = journals
+        self._macros = None
+
+    @property
+    def macros(self):
+        """The expanded macros (see :meth:`resolveMacros`), computed on first access."""
+        if self._macros is None:
+            self._macros = self.resolveMacros()
+        return self._macros
+
+    def inputState(self, path):
+        """Return the size and modification time (in nanoseconds) that the input file at `path`
+        had when it was last read, or ``None`` if it has not been read yet. Unlike the current
+        state of the file, this describes the loaded data even if the file has changed since.
+        """
+        state = self._inputStates.get(path)
+        if state is not None:
+            return list(state[0][:2])
+
+    def _inputChanged(self, path):
+        """Return whether the file at `path` has changed since the last call for that path.
+
+        A file is considered unchanged if its size, modification time and inode are the same.
+        Otherwise, and if the file has been modified shortly before the last call (such that a
+        further modification might not have changed its modification time), the SHA-1 hash of its
+        contents is compared.
+        """
+        stat = os.stat(path)
+        key = (stat.st_size, stat.st_mtime_ns, stat.st_ino)
+        previous = self._inputStates.get(path)
+        if previous is not None and previous[0] == key and not previous[2]:
+            return False
+        with io.open(path, 'rb') as stream:
+            digest = hashlib.sha1(stream.read()).digest()
+        racy = time.time() - stat.st_mtime_ns / 1e9 < RACY_INTERVAL
+        self._inputStates[path] = (key, digest, racy)
+        return previous is None or previous[1] != digest
+
+    def _readConfig(self):
+        """Read the configuration file and set the corresponding attributes."""
+        parser = configparser.ConfigParser()
+        with io.open(self.configPath, encoding='UTF-8') as f:
+            confFile = f.read()
         # workaround because ConfigParser does not support sectionless entries
         try:
             parser.read_string("[root]\n" + confFile)
@@ -94,23 +276,45 @@ class Database:
 
         self.bibfileName = config.get('bibfile', 'references.bib')
         self.journalsName = config.get('journals', 'journals.txt')
-
-        for path in self.bibfilePath, self.journalsPath:
-            if not exists(path):
-                open(path, 'a').close()
-                self.vcs.add(relpath(path, self.directory))
-
-        self.bibfile = BibFile(join(self.directory, self.bibfileName))
-        self.journals = JournalsFile(join(self.directory, self.journalsName))
-
+        self.parserBackend = config.get('parser', 'pyparsing')
+        if self.parserBackend not in BACKENDS:
+            raise DatabaseFormatError("Invalid parser '{}' in configuration file '{}'. Possible "
+                                      "values are: {}".format(self.parserBackend, BTVCSCONF,
+                                                              ', '.join(BACKENDS)))
+        try:
+            self.parserWorkers = config.getint('parserWorkers', 1)
+        except ValueError:
+            raise DatabaseFormatError("Invalid parserWorkers '{}' in configuration file '{}'"
+                                      .format(config.get('parserWorkers'), BTVCSCONF))
+        try:
+            self.checkWorkers = config.getint('checkWorkers', 1)
+        except ValueError:
+            raise DatabaseFormatError("Invalid checkWorkers '{}' in configuration file '{}'"
+                                      .format(config.get('checkWorkers'), BTVCSCONF))
+        for option, convert in (('checkTimeout', config.getfloat),
+                                ('checkBudget', config.getfloat),
+                                ('checkMaxErrors', config.getint)):
+            try:
+                value = convert(option, None)
+                if value is not None and value <= 0:
+                    raise ValueError(value)
+                setattr(self, option, value)
+            except ValueError:
+                raise DatabaseFormatError("Invalid {} '{}' in configuration file '{}'"
+                                          .format(option, config.get(option), BTVCSCONF))
+        try:
+            self.parseCache = config.getboolean('parseCache', True)
+        except ValueError:
+            raise DatabaseFormatError("Invalid parseCache '{}' in configuration file '{}'"
+                                      .format(config.get('parseCache'), BTVCSCONF))
+        try:
+            self.sqlMirror = config.getboolean('sqlMirror', False)
+        except ValueError:
+            raise DatabaseFormatError("Invalid sqlMirror '{}' in configuration file '{}'"
+                                      .format(config.get('sqlMirror'), BTVCSCONF))
         self.name = config.get('name', "Untitled Bibtex Database")
         self.documents = config.get('documents', 'Documents')
-
-        self.makeJournalBibfiles()  # ensure these are up-to-date
-
         self.publicLink = config.get('publicLink', None)
-        if not exists(self.documentsPath):
-            os.mkdir(self.documentsPath)
 
     def setDefault(self):
         """Set this database as default in config."""
@@ -160,23 +364,94 @@ class Database:
         return docs
 
     def existingDocuments(self):
-        """Walks recursively through the :attr:`documents` directory and return the paths of all
-        files contained in there, relative to :attr:`documentsPath`.
+        """Return the paths of all files contained in the :attr:`documents` directory, relative to
+        :attr:`documentsPath`.
+
+        The directory is scanned incrementally with a :class:`DocumentsManifest
+        <bibtexvcs.documents.DocumentsManifest>`, which is cached on disk if :attr:`parseCache` is
+        set. The scan happens once after each :meth:`reload`; subsequent calls (e.g. by the
+        different checks of a check run) return the same snapshot.
+        """
+        if self._documents is None:
+            from bibtexvcs.documents import DocumentsManifest
+            if self._manifest is None or self._manifest.root != self.documentsPath:
+                if self.parseCache:
+                    self._manifest = DocumentsManifest.load(self.documentsPath)
+                else:
+                    self._manifest = DocumentsManifest(self.documentsPath)
+            self._documents = tuple(self._manifest.refresh())
+        return self._documents
+
+    def duplicateDocuments(self):
+        """Return groups of files in the :attr:`documents` directory that have identical contents,
+        each as a sorted list of paths relative to :attr:`documentsPath`.
+
+        The files are compared by a :class:`FingerprintIndex
+        <bibtexvcs.documents.FingerprintIndex>`, which is cached on disk if :attr:`parseCache` is
+        set, so that only new or modified files are hashed.
+        """
+        from bibtexvcs.documents import FingerprintIndex
+        if self._fingerprints is None or self._fingerprints.root != self.documentsPath:
+            if self.parseCache:
+                self._fingerprints = FingerprintIndex.load(self.documentsPath)
+            else:
+                self._fingerprints = FingerprintIndex(self.documentsPath)
+        return self._fingerprints.duplicates(self.existingDocuments())
+
+    def resolveMacros(self):
+        """Return the :attr:`macros` table for the current bib and journals file.
+
+        Macro definitions referring to other macros (possibly concatenated with ``#``) are
+        expanded completely. References to undefined macros are expanded to their string
+        representation.
+        """
+        macros = dict((name, month.value) for name, month in MONTHS.items())
+        macros.update((name, journal.full) for name, journal in self.journals.items())
+        definitions = self.bibfile.macroDefinitions
+        expanded = {}
+
+        def expand(value, seen):
+            if isinstance(value, MacroReference):
+                name = value.name
+                if name in expanded:
+                    return expanded[name]
+                if name in definitions and name not in seen:
+                    expanded[name] = expand(definitions[name].value, seen | {name})
+                    return expanded[name]
+                return macros.get(name, str(value))
+            if isinstance(value, str):
+                return value
+            return ''.join(expand(part, seen) for part in value)
+
+        for name in definitions:
+            expand(MacroReference(name), frozenset())
+        macros.update(expanded)
+        return macros
+
+    def sql(self, statement, parameters=()):
+        """Execute the SQL `statement` (with optional `parameters`) on the SQLite mirror of the
+        database, which is brought up to date first. See :mod:`bibtexvcs.sqlmirror` for the
+        tables of the mirror. The mirror is read-only.
+
+        :returns: A pair ``(columns, rows)`` of the list of column names and the list of result
+            rows.
         """
-        for dirpath, _, filenames in os.walk(self.documentsPath):
-            for file in filenames:
-                if file != '.DS_Store':
-                    yield relpath(join(dirpath, file), self.documentsPath)
+        from bibtexvcs import sqlmirror
+        return sqlmirror.query(sqlmirror.synchronize(self), statement, parameters)
 
     def strval(self, value):
-        """Returns a string value for *value*. If *value* is a :class:`MacroReference`, substitutes
-        the value (if known).
+        """Returns a string value for *value*. If *value* is a :class:`MacroReference` or a
+        concatenation containing macro references, substitutes their values (if known; see
+        :attr:`macros`).
         """
         if isinstance(value, MacroReference):
-            if value.name in self.bibfile.macroDefinitions:
-                return self.bibfile.macroDefinitions[value.name]
-            if value.name in self.journals:
-                return self.journals[value.name].full
+            try:
+                return self.macros[value.name]
+            except KeyError:
+                return str(value)
+        if isinstance(value, list) and all(isinstance(part, (str, MacroReference))
+                                           for part in value):
+            return ''.join(self.strval(part) for part in value)
         return str(value)
 
     @property
@@ -192,12 +467,18 @@ class Database:
     def makeJournalBibfiles(self):
         """Creates or updates the files containing journal macro definitions in full and
         abbreviated form, respectively.
+
+        Both files record the SHA-1 digest of the journals file they were generated from (see
+        :data:`JOURNALS_HEADER`). They are regenerated only if that digest differs from the one of
+        the current journals file, so that modification times, which are unreliable after a VCS
+        update, do not matter.
         """
-        abbr, full = [join(self.directory, name) for name in
-                      (self.abbrJournalsName, self.fullJournalsName)]
-        if not exists(full) or not exists(abbr) or \
-                        os.path.getmtime(self.journalsPath) > os.path.getmtime(abbr):
-            self.journals.writeBibfiles(self.bibfilePath[:-4])
+        with io.open(self.journalsPath, 'rb') as stream:
+            digest = hashlib.sha1(stream.read()).hexdigest()
+        for name in self.abbrJournalsName, self.fullJournalsName:
+            if journalsDigest(join(self.directory, name)) != digest:
+                self.journals.writeBibfiles(self.bibfilePath[:-4], digest)
+                break
 
     def runJabref(self):
         """Tries to open this database's ``.bib`` file with `JabRef`_. Will do the following:
@@ -308,7 +589,7 @@ class JournalsFile(OrderedDict):
     :type journals: iterable
     """
 
-    def __init__(self, filename=None, journals=None):
+    def __init__(self, filename=None, journals=()):
         super(JournalsFile, self).__init__()
 
         if filename:
@@ -335,16 +616,57 @@ class JournalsFile(OrderedDict):
         with io.open(filename, 'w', encoding='UTF-8', newline='\n') as journalfile:
             config.write(journalfile)
 
-    def writeBibfiles(self, basepath):
+    def writeBibfiles(self, basepath, digest=None):
         """Creates two ``.bib`` files that contain macro definitions for all journals defined in
         this file, resolving to the full and abbreviated journal names, respectively.
 
         `basename` is the base path of the output files, which will have the file names
-        ``<basename>_full.bib`` and ``<basename>_abbr.bib``, respectively.
+        ``<basename>_full.bib`` and ``<basename>_abbr.bib``, respectively. If given, `digest` is the
+        SHA-1 digest of the journals file, which is recorded in the first line of both files (see
+        :data:`JOURNALS_HEADER`).
+
+        Both files are generated in memory and compared to the existing ones by hash. Only files
+        whose contents differ are written to a temporary file which then atomically replaces the
+        existing one, so unchanged files keep their modification time.
+
+        :returns: The list of paths of the files that have been written.
         """
+        written = []
+        header = JOURNALS_HEADER.format(digest) if digest else ''
         for jrnlType in 'full', 'abbr':
             outFile = '{}_{}.bib'.format(basepath, jrnlType)
-            with io.open(outFile, 'w', encoding='UTF-8') as bibfile:
-                for journal in self.values():
-                    bibfile.write('@STRING{' + journal.macro + ' = {' + getattr(journal, jrnlType)
-                                  + '}}\n')
+            data = (header + ''.join('@STRING{' + journal.macro + ' = {'
+                                     + getattr(journal, jrnlType) + '}}\n'
+                                     for journal in self.values())).encode('UTF-8')
+            if exists(outFile):
+                with io.open(outFile, 'rb') as stream:
+                    if hashlib.sha1(stream.read()).digest() == hashlib.sha1(data).digest():
+                        continue
+            fd, tmpName = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(outFile)),
+                                           suffix='.tmp')
+            try:
+                with io.open(fd, 'wb') as stream:
+                    stream.write(data)
+                if exists(outFile):
+                    shutil.copymode(outFile, tmpName)
+                os.replace(tmpName, outFile)
+            except BaseException:
+                os.remove(tmpName)
+                raise
+            written.append(outFile)
+        return written
+
+
+def journalsDigest(path):
+    """Return the digest of the journals file that the journal macro file at `path` was
+    generated from, or ``None`` if the file does not exist or has no such header.
+    """
+    try:
+        with io.open(path, 'rt', encoding='UTF-8', newline='') as stream:
+            line = stream.readline()
+    except (IOError, UnicodeDecodeError):
+        return None
+    prefix, suffix = JOURNALS_HEADER.split('{}')
+    if line.startswith(prefix) and line.endswith(suffix):
+        return line[len(prefix):-len(suffix)]
+    return None
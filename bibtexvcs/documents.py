@@ -0,0 +1,265 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+# Copyright 2014-2015 Michael Helmling
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 3 as
+# published by the Free Software Foundation
+
+"""The :mod:`documents <bibtexvcs.documents>` module keeps a manifest of the files in a database's
+documents directory, such that the (possibly large and remote) directory tree does not need to be
+listed completely each time it is scanned.
+
+The manifest stores the listing of each directory together with the directory's modification time.
+Since adding, removing or renaming a file changes the modification time of its directory, only
+directories whose modification time has changed are listed again. The manifest is stored in the
+cache directory (see :func:`bibtexvcs.config.getCachePath`), so it is reused by later processes.
+
+Additionally, a :class:`FingerprintIndex` finds documents with identical contents, which are
+typically the same PDF committed twice under different names.
+"""
+from __future__ import division, print_function, unicode_literals
+import hashlib, io, os, pickle, time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+import bibtexvcs
+from bibtexvcs.cache import cacheFilename, writeCache
+from bibtexvcs.database import RACY_INTERVAL
+
+#: Names of files in the documents directory that are not considered documents.
+IGNORED_FILES = frozenset(['.DS_Store'])
+
+#: Number of bytes at the beginning of a document that are hashed to tell apart documents of the
+#: same size before hashing them completely.
+PARTIAL_HASH_SIZE = 64 * 1024
+
+#: Number of threads hashing documents concurrently.
+HASH_WORKERS = 8
+
+
+class DocumentsManifest(object):
+    """Manifest of the files contained in the directory tree at `root`.
+
+    .. attribute:: root
+
+        Path of the documents directory.
+    .. attribute:: directories
+
+        Maps the path of each directory, relative to :attr:`root`, to a tuple
+        ``(mtime, racy, files, subdirectories)`` describing its last listing, where `racy` tells
+        whether the directory was modified shortly before it was listed (see
+        :data:`bibtexvcs.database.RACY_INTERVAL`). Racy directories are listed again on the next
+        :meth:`refresh`.
+    .. attribute:: cacheFile
+
+        File the manifest is written to after a :meth:`refresh` that changed it, or ``None``.
+    """
+
+    def __init__(self, root, cacheFile=None):
+        self.root = root
+        self.directories = {}
+        self.cacheFile = cacheFile
+
+    @classmethod
+    def load(cls, root, cacheDir=None):
+        """Return the manifest of `root` stored in the cache, or an empty one if there is no valid
+        cached manifest. The returned manifest is written back to the cache when it changes.
+        """
+        if cacheDir is None:
+            from bibtexvcs.config import getCachePath
+            cacheDir = getCachePath()
+        cacheFile = cacheFilename(root, 'documents', cacheDir)
+        manifest = None
+        try:
+            with io.open(cacheFile, 'rb') as stream:
+                if pickle.load(stream) == bibtexvcs.__version__:
+                    manifest = pickle.load(stream)
+        except Exception:
+            pass
+        if manifest is None or manifest.root != root:
+            manifest = cls(root)
+        manifest.cacheFile = cacheFile
+        return manifest
+
+    def refresh(self):
+        """Update the manifest to the current state of the directory tree and return the paths of
+        all files, relative to :attr:`root`.
+
+        Directories whose modification time is unchanged are not listed again; their
+        subdirectories are still visited, since changes within a subdirectory do not affect the
+        modification time of its parent.
+        """
+        directories = {}
+        changed = self._scan('', directories)
+        if changed or directories.keys() != self.directories.keys():
+            self.directories = directories
+            if self.cacheFile is not None:
+                writeCache(self.cacheFile, bibtexvcs.__version__, self)
+        return self.files()
+
+    def _scan(self, directory, directories):
+        """Add the listing of `directory` and its subdirectories to `directories`, reusing the
+        previous listing if it is still valid. Returns whether any directory was listed again.
+        """
+        path = os.path.join(self.root, directory)
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except OSError:
+            return False
+        listing = self.directories.get(directory)
+        changed = listing is None or listing[0] != mtime or listing[1]
+        if changed:
+            files, subdirectories = [], []
+            try:
+                with os.scandir(path) as entries:
+                    for entry in entries:
+                        # like os.walk, do not descend into symbolic links to directories
+                        if entry.is_dir():
+                            if not entry.is_symlink():
+                                subdirectories.append(entry.name)
+                        elif entry.name not in IGNORED_FILES:
+                            files.append(entry.name)
+            except OSError:
+                return False
+            racy = time.time() - mtime / 1e9 < RACY_INTERVAL
+            listing = (mtime, racy, sorted(files), sorted(subdirectories))
+        directories[directory] = listing
+        for name in listing[3]:
+            if self._scan(os.path.join(directory, name), directories):
+                changed = True
+        return changed
+
+    def files(self):
+        """Return the paths of all files in the manifest, relative to :attr:`root`."""
+        return [os.path.join(directory, name)
+                for directory, listing in sorted(self.directories.items())
+                for name in listing[2]]
+
+
+def _hashFile(path, size=None):
+    """Return the SHA-1 digest of the first `size` bytes of the file at `path` (all if `size` is
+    ``None``).
+    """
+    digest = hashlib.sha1()
+    with io.open(path, 'rb') as stream:
+        if size is None:
+            for block in iter(lambda: stream.read(1024 * 1024), b''):
+                digest.update(block)
+        else:
+            digest.update(stream.read(size))
+    return digest.digest()
+
+
+class FingerprintIndex(object):
+    """Index of content fingerprints of the documents in the directory at `root`.
+
+    Duplicates are found in three stages: documents are grouped by size, then by a hash of their
+    first :data:`PARTIAL_HASH_SIZE` bytes, and only documents that still share a group are hashed
+    completely. Hashing happens in a pool of :data:`HASH_WORKERS` threads. Hashes are stored
+    together with the size and modification time of each document, such that unchanged documents
+    are not hashed again.
+
+    .. attribute:: fingerprints
+
+        Maps paths relative to :attr:`root` to tuples ``(size, mtime, partial, full)``, where
+        `partial` and `full` are the partial and full hash, or ``None`` if not computed.
+
+    Documents that cannot be read, e.g. because they are deleted while the index is updated, are
+    left out.
+    """
+
+    def __init__(self, root, cacheFile=None):
+        self.root = root
+        self.fingerprints = {}
+        self.cacheFile = cacheFile
+
+    @classmethod
+    def load(cls, root, cacheDir=None):
+        """Return the fingerprint index of `root` stored in the cache, or an empty one. The
+        returned index is written back to the cache when it changes.
+        """
+        if cacheDir is None:
+            from bibtexvcs.config import getCachePath
+            cacheDir = getCachePath()
+        cacheFile = cacheFilename(root, 'fingerprints', cacheDir)
+        index = None
+        try:
+            with io.open(cacheFile, 'rb') as stream:
+                if pickle.load(stream) == bibtexvcs.__version__:
+                    index = pickle.load(stream)
+        except Exception:
+            pass
+        if index is None or index.root != root:
+            index = cls(root)
+        index.cacheFile = cacheFile
+        return index
+
+    def duplicates(self, files):
+        """Return groups of documents with identical contents among `files` (paths relative to
+        :attr:`root`), each as a sorted list of paths. Empty files are not considered duplicates.
+        """
+        fingerprints = {}
+        bySize = defaultdict(list)
+        for path in files:
+            try:
+                stat = os.stat(os.path.join(self.root, path))
+            except OSError:
+                continue
+            old = self.fingerprints.get(path)
+            if old is not None and old[:2] == (stat.st_size, stat.st_mtime_ns):
+                fingerprints[path] = old
+            else:
+                fingerprints[path] = (stat.st_size, stat.st_mtime_ns, None, None)
+            if stat.st_size > 0:
+                bySize[stat.st_size].append(path)
+        candidates = [path for group in bySize.values() if len(group) > 1 for path in group]
+        self._hash(fingerprints, candidates, 2, PARTIAL_HASH_SIZE)
+        byPartial = defaultdict(list)
+        for path in candidates:
+            if path not in fingerprints:
+                continue
+            size, _, partial, _ = fingerprints[path]
+            byPartial[size, partial].append(path)
+        groups = [group for group in byPartial.values() if len(group) > 1]
+        # for small files, the partial hash covers the whole file
+        candidates = [path for group in groups if fingerprints[group[0]][0] > PARTIAL_HASH_SIZE
+                      for path in group]
+        self._hash(fingerprints, candidates, 3, None)
+        duplicates = []
+        for group in groups:
+            byFull = defaultdict(list)
+            for path in group:
+                if path in fingerprints:
+                    byFull[fingerprints[path][3]].append(path)
+            duplicates.extend(sorted(paths) for paths in byFull.values() if len(paths) > 1)
+        duplicates.sort()
+        if fingerprints != self.fingerprints:
+            self.fingerprints = fingerprints
+            if self.cacheFile is not None:
+                writeCache(self.cacheFile, bibtexvcs.__version__, self)
+        return duplicates
+
+    def _hash(self, fingerprints, paths, position, size):
+        """Compute the hash of the first `size` bytes of those `paths` whose fingerprint lacks it,
+        and store it at `position` in their fingerprint. The fingerprints of documents that cannot
+        be read are removed.
+        """
+        paths = [path for path in paths if fingerprints[path][position] is None]
+        if not paths:
+            return
+
+        def hashDocument(path):
+            try:
+                return _hashFile(os.path.join(self.root, path), size)
+            except OSError:
+                return None  # the document has been removed or cannot be read
+
+        with ThreadPoolExecutor(HASH_WORKERS) as executor:
+            for path, digest in zip(paths, executor.map(hashDocument, paths)):
+                if digest is None:
+                    del fingerprints[path]
+                    continue
+                fingerprint = list(fingerprints[path])
+                fingerprint[position] = digest
+                fingerprints[path] = tuple(fingerprint)
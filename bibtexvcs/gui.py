@@ -321,19 +321,31 @@ class BtVCSGui(QtWidgets.QWidget):
         return checks.performDatabaseCheck(self._database)
 
     def runChecks_handle(self):
+        from bibtexvcs import checks
         self.reload()
         errors, warnings = self.future.result()
+        abandoned = any(isinstance(war, checks.CheckAbandoned) for war in warnings)
         if len(errors) > 0:
             title = "Database Check Failed"
             text = 'One or more database checks failed. Please fix, then try again.'
+            if abandoned:
+                text += ('\n\nSome checks were stopped early (see details), so further problems '
+                         'might exist.')
+                errors = errors + [war for war in warnings
+                                   if isinstance(war, checks.CheckAbandoned)]
             detailed = "\n\n".join(err.args[0] for err in errors)
             box = QtWidgets.QMessageBox(QtWidgets.QMessageBox.Critical, title, text, parent=self)
             box.setDetailedText(detailed)
             box.setStandardButtons(box.Close)
             box.exec_()
         elif len(warnings) > 0:
-            box = QtWidgets.QMessageBox(QtWidgets.QMessageBox.Warning, 'Warning',
-                    'All checks passed, but some warnings occured. Proceed anyway?', parent=self)
+            if abandoned:
+                text = ('No check failed, but some checks were stopped early, so the results are '
+                        'incomplete. Proceed anyway?')
+            else:
+                text = 'All checks passed, but some warnings occured. Proceed anyway?'
+            box = QtWidgets.QMessageBox(QtWidgets.QMessageBox.Warning, 'Warning', text,
+                                        parent=self)
             box.setDetailedText("\n\n".join(war.args[0] for war in warnings))
             box.setStandardButtons(box.Yes | box.No)
             if box.exec_() == box.Yes:
@@ -474,8 +486,6 @@ class JournalsWidget(QtWidgets.QWidget):
         journals = []
         for i in range(self.table.rowCount()):
             macro, abbr, full = [self.table.item(i, j).text() for j in (0, 1, 2)]
-            if sys.version_info.major == 2 and not isinstance(full, unicode):
-                full, abbr, macro = [unicode(s) for s in (full, abbr, macro)]
             journals.append(Journal(full=full, abbr=abbr, macro=macro))
         self.db.journals = JournalsFile(journals=journals)
         self.db.journals.write(self.db.journalsPath)
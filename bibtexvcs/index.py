@@ -0,0 +1,148 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+# Copyright 2014-2015 Michael Helmling
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 3 as
+# published by the Free Software Foundation
+
+"""The :mod:`index <bibtexvcs.index>` module contains the secondary indexes used by
+:meth:`BibFile.find <bibtexvcs.bibfile.BibFile.find>`.
+"""
+from __future__ import division, print_function, unicode_literals
+import bisect
+from collections import defaultdict
+
+from bibtexvcs.bibfile import DatabaseFormatError, MacroReference, Name
+
+
+def authorKeys(entry):
+    """Normalized (lower-case) last names of the entry's authors (see :meth:`Name.lastName`)."""
+    authors = entry.get('author')
+    if isinstance(authors, Name):
+        authors = [authors]
+    if isinstance(authors, list):
+        return set(name.lastName().lower() for name in authors if isinstance(name, Name))
+    if isinstance(authors, str):
+        return {authors.lower()}
+    return set()
+
+
+def yearKeys(entry):
+    """The year of the entry as integer, if it has a numeric ``year`` field."""
+    year = entry.get('year')
+    if isinstance(year, str) and year.strip().isdigit():
+        return {int(year)}
+    return set()
+
+
+def entrytypeKeys(entry):
+    return {entry.entrytype.lower()}
+
+
+def journalKeys(entry):
+    """Names of the macros used as ``journal`` or ``booktitle`` of the entry."""
+    return set(entry[field].name for field in ('journal', 'booktitle')
+               if isinstance(entry.get(field), MacroReference))
+
+
+def doiKeys(entry):
+    doi = entry.get('doi')
+    if isinstance(doi, str) and doi.strip():
+        return {doi.strip().lower()}
+    return set()
+
+
+def filenameKeys(entry):
+    """The document file name of the entry (see :meth:`Entry.filename`)."""
+    try:
+        filename = entry.filename()
+    except (DatabaseFormatError, AttributeError, TypeError):
+        return set()
+    return {filename} if filename else set()
+
+
+#: Functions computing the keys of an entry for each index, by criterion of :meth:`EntryIndex.find`.
+INDEXES = dict(author=authorKeys, year=yearKeys, entrytype=entrytypeKeys, journal=journalKeys,
+               doi=doiKeys, filename=filenameKeys)
+
+
+class EntryIndex:
+    """Secondary indexes over the entries of a bib file.
+
+    For each criterion in :data:`INDEXES`, a hash index maps the normalized keys to the citekeys
+    of the entries having them. Additionally, the years are kept in a sorted list in order to
+    answer range queries.
+
+    :param entries: Mapping of citekeys to :class:`Entry` objects to index, in file order.
+    """
+
+    def __init__(self, entries):
+        self.hashes = dict((name, defaultdict(set)) for name in INDEXES)
+        self.years = []  # sorted list of (year, citekey)
+        self.keys = {}  # citekey -> {criterion: keys}, needed for removal
+        self.positions = {}  # citekey -> rank in file order
+        for citekey, entry in entries.items():
+            self.add(citekey, entry)
+
+    def add(self, citekey, entry):
+        """Add (or replace) the entry with the given citekey. New citekeys are ordered last."""
+        if citekey in self.keys:
+            self.remove(citekey, keepPosition=True)
+        else:
+            self.positions[citekey] = len(self.positions)
+        keys = self.keys[citekey] = {}
+        for name, function in INDEXES.items():
+            keys[name] = function(entry)
+            for key in keys[name]:
+                self.hashes[name][key].add(citekey)
+        for year in keys['year']:
+            bisect.insort(self.years, (year, citekey))
+
+    def remove(self, citekey, keepPosition=False):
+        """Remove the entry with the given citekey from all indexes."""
+        keys = self.keys.pop(citekey)
+        for name, nameKeys in keys.items():
+            hashIndex = self.hashes[name]
+            for key in nameKeys:
+                hashIndex[key].discard(citekey)
+                if not hashIndex[key]:
+                    del hashIndex[key]
+        for year in keys['year']:
+            del self.years[bisect.bisect_left(self.years, (year, citekey))]
+        if not keepPosition:
+            del self.positions[citekey]
+
+    def reorder(self, citekeys):
+        """Set the file order of the indexed entries to that of the iterable `citekeys`."""
+        self.positions = dict((citekey, rank) for rank, citekey in enumerate(citekeys))
+
+    def find(self, yearRange=None, **criteria):
+        """Return the citekeys of all entries matching all given criteria, in file order.
+
+        :param criteria: Keys to look up in the indexes, by criterion (see :data:`INDEXES`).
+            Author names are matched case-insensitively, as are DOIs.
+        :param yearRange: Pair ``(first, last)`` of years (inclusive).
+        """
+        results = []
+        for name, key in criteria.items():
+            if name == 'author':
+                key = key.lower()
+            elif name == 'doi':
+                key = key.strip().lower()
+            elif name == 'entrytype':
+                key = key.lower()
+            elif name not in INDEXES:
+                raise TypeError('Unknown search criterion "{}"'.format(name))
+            results.append(self.hashes[name].get(key, set()))
+        if yearRange is not None:
+            first, last = yearRange
+            start = bisect.bisect_left(self.years, (first,))
+            end = bisect.bisect_left(self.years, (last + 1,))
+            results.append(set(citekey for _, citekey in self.years[start:end]))
+        if not results:
+            matches = self.keys
+        else:
+            results.sort(key=len)
+            matches = results[0].intersection(*results[1:])
+        return sorted(matches, key=self.positions.__getitem__)
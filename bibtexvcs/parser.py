@@ -9,17 +9,31 @@
 """:mod:`bibtexvcs.parser` implements a parser for ``bibtex`` files. It is partially based on
 the btpyparse_ package by Matthew Brett, 2010, Simplified BSD license.
 
+There are two parser backends: the default one is a pyparsing_ grammar, the ``'fast'`` one is a
+hand-written scanner that parses large files considerably faster. The latter can also be used in
+``'lazy'`` mode, which postpones decoding of the entries' field values until they are accessed. Use :func:`iterparse` or
+:func:`parseBibstring` to parse with either of them.
+
 .. _btpyparse: https://github.com/matthew-brett/btpyparse
+.. _pyparsing: http://pyparsing.wikispaces.com
 """
 
 from __future__ import division, print_function, unicode_literals
+import collections
+import concurrent.futures
+import hashlib
+import io
+import itertools
 import re
+from collections import OrderedDict
 
 from pyparsing import (Regex, Suppress, ZeroOrMore, OneOrMore, Group, Optional, Forward,
-                       SkipTo, CaselessLiteral, Dict, originalTextFor, delimitedList)
+                       SkipTo, CaselessLiteral, Dict, originalTextFor, delimitedList,
+                       ParseException)
 
 from bibtexvcs.bibfile import (Entry, Comment, ImplicitComment, MacroReference,
-                               MacroDefinition, Name, Preamble)
+                               MacroDefinition, Name, Preamble, DatabaseFormatError,
+                               LazyEntry, FieldSpan)
 
 LCURLY = Suppress('{')
 RCURLY = Suppress('}')
@@ -101,10 +115,14 @@ literalName = OneOrMore(namePart).setParseAction(labelLiteralName)
 
 def makeName(toks):
     """Create a :class:`.Name` object from the parse result of either a csName or a literalName."""
+    suffix = toks.get("suffix")
+    if suffix is not None and not isinstance(suffix, str):
+        # newer pyparsing versions wrap the named namePart alternative in a ParseResults
+        suffix = suffix[0]
     return Name(first=toks.get("firstname"),
                 nobility=toks.get("nobility"),
                 last=toks.get("lastname"),
-                suffix=toks.get("suffix"))
+                suffix=suffix)
 
 name = (csName | literalName).setParseAction(makeName)
 NAME_SEP = Regex(r'and[^}]', flags=re.IGNORECASE).suppress()
@@ -133,3 +151,691 @@ icomment = SkipTo('@').setResultsName("comment").setParseAction(ImplicitComment.
 
 definitions = comment | preamble | macro | entry
 bibfile = Optional(icomment) + ZeroOrMore(definitions)
+
+
+# The "fast" backend: a hand-written, single-pass recursive-descent parser that accepts the same
+# language as the pyparsing grammar above and creates the same objects. Each function takes the
+# source string and a position and returns the parsed result along with the position after it.
+# Instead of building a token tree which is then transformed by parse actions, the objects are
+# created directly while scanning, which avoids the backtracking cost of the grammar.
+
+BACKENDS = ('pyparsing', 'fast', 'lazy')
+
+
+class _Mismatch(Exception):
+    """Raised by the fast backend if the input does not match the expected syntax at `pos`."""
+    def __init__(self, pos):
+        Exception.__init__(self, pos)
+        self.pos = pos
+
+
+# pyparsing's default whitespace characters; the remaining patterns equal those of the grammar
+_WHITESPACE = re.compile(r'[ \t\n\r]*')
+_CHARS_NO_CURLY = re.compile(charsNoCurly.pattern)
+_CHARS_NO_QUOTECURLY = re.compile(charsNoQuotecurly.pattern)
+_NUMBER = re.compile(number.pattern)
+_ANY_NAME = re.compile(anyName.pattern)
+_NOT_DIGNAME = re.compile(notDigname.pattern)
+_NAME_PART = re.compile(r'(?!\band\b)[^\s\.,{}]+\.?')
+_NOBILITY = re.compile(r'[a-z]\w+\.?(\s[a-z]\w+\.?)*')
+_NAME_SEP = re.compile(r'and[^}]', flags=re.IGNORECASE)
+
+
+def _skip(s, pos):
+    return _WHITESPACE.match(s, pos).end()
+
+
+def _expect(s, pos, char):
+    """Skip whitespace, then consume `char`."""
+    pos = _skip(s, pos)
+    if s.startswith(char, pos):
+        return pos + 1
+    raise _Mismatch(pos)
+
+
+def _matchName(s, pos, regex=_NOT_DIGNAME):
+    pos = _skip(s, pos)
+    match = regex.match(s, pos)
+    if match is None:
+        raise _Mismatch(pos)
+    return match.group(), match.end()
+
+
+def _curlyString(s, pos):
+    """Parse a braced string starting at `s[pos] == '{'`. Nested braced strings are returned as
+    nested lists.
+    """
+    items = []
+    pos += 1
+    while True:
+        match = _CHARS_NO_CURLY.match(s, pos)
+        if match:
+            items.append(match.group())
+            pos = match.end()
+        char = s[pos:pos + 1]
+        if char == '{':
+            group, pos = _curlyString(s, pos)
+            items.append(group)
+        elif char == '}':
+            return items, pos + 1
+        else:
+            raise _Mismatch(pos)
+
+
+def _quotedString(s, pos):
+    """Parse a quoted string starting at `s[pos] == '"'`."""
+    items = []
+    pos += 1
+    while True:
+        match = _CHARS_NO_QUOTECURLY.match(s, pos)
+        if match:
+            items.append(match.group())
+            pos = match.end()
+        char = s[pos:pos + 1]
+        if char == '{':
+            group, pos = _curlyString(s, pos)
+            items.append(group)
+        elif char == '"':
+            return items, pos + 1
+        else:
+            raise _Mismatch(pos)
+
+
+def _string(s, pos):
+    pos = _skip(s, pos)
+    match = _NUMBER.match(s, pos)
+    if match:
+        return [match.group()], match.end()
+    match = _NOT_DIGNAME.match(s, pos)
+    if match:
+        return [MacroReference(match.group())], match.end()
+    char = s[pos:pos + 1]
+    if char == '"':
+        return _quotedString(s, pos)
+    if char == '{':
+        return _curlyString(s, pos)
+    raise _Mismatch(pos)
+
+
+def _fieldValue(s, pos):
+    """Parse a (possibly ``#``-concatenated) value and return its list of tokens."""
+    tokens, pos = _string(s, pos)
+    while True:
+        hashPos = _skip(s, pos)
+        if not s.startswith('#', hashPos):
+            return tokens, pos
+        try:
+            more, hashPos = _string(s, hashPos + 1)
+        except _Mismatch:
+            return tokens, pos
+        tokens.extend(more)
+        pos = hashPos
+
+
+def _joinGroup(group):
+    return "".join(_joinGroup(item) if isinstance(item, list) else item for item in group)
+
+
+def _formatValue(tokens):
+    """Turn the tokens of a field value into the value stored in an :class:`Entry`, exactly
+    like :func:`Dict` and :func:`Entry.fromParseResult` do for the pyparsing backend.
+    """
+    if len(tokens) == 1 and not isinstance(tokens[0], list):
+        return tokens[0]
+    parts = [_joinGroup(token) if isinstance(token, list) else token for token in tokens]
+    if all(isinstance(part, str) for part in parts):
+        return "".join(parts)
+    return parts
+
+
+def _namePart(s, pos):
+    """Parse a single name part; returns its tokens together with its start and end position."""
+    pos = _skip(s, pos)
+    match = _NAME_PART.match(s, pos)
+    if match:
+        return [match.group()], pos, match.end()
+    if s.startswith('{', pos):
+        tokens, end = _curlyString(s, pos)
+        return tokens, pos, end
+    raise _Mismatch(pos)
+
+
+def _spacedNames(s, pos):
+    """Parse one or more name parts and return their original text."""
+    _, start, pos = _namePart(s, pos)
+    while True:
+        try:
+            _, _, pos = _namePart(s, pos)
+        except _Mismatch:
+            return s[start:pos], pos
+
+
+def _csName(s, pos):
+    pos = _skip(s, pos)
+    nobility = None
+    match = _NOBILITY.match(s, pos)
+    if match:
+        nobility = match.group()
+        pos = match.end()
+    last, pos = _spacedNames(s, pos)
+    pos = _expect(s, pos, ',')
+    suffix = None
+    try:
+        tokens, _, suffixEnd = _namePart(s, pos)
+        pos = _expect(s, suffixEnd, ',')
+        suffix = tokens[0] if tokens else None
+    except _Mismatch:
+        pass
+    first, pos = _spacedNames(s, pos)
+    return Name(first=first, nobility=nobility, last=last, suffix=suffix), pos
+
+
+def _literalName(s, pos):
+    tokens, _, pos = _namePart(s, pos)
+    while True:
+        try:
+            more, _, pos = _namePart(s, pos)
+        except _Mismatch:
+            break
+        tokens.extend(more)
+    tokens = [_joinGroup(token) if isinstance(token, list) else token for token in tokens]
+    if not tokens:
+        raise _Mismatch(pos)
+    first = " ".join(tokens[:-1]) if len(tokens) > 1 else None
+    return Name(first=first, last=tokens[-1]), pos
+
+
+def _name(s, pos):
+    try:
+        return _csName(s, pos)
+    except _Mismatch:
+        return _literalName(s, pos)
+
+
+#: Fields containing a list of names.
+NAME_FIELDS = ('author', 'editor')
+
+#: Maximum number of entries in the cache of parsed names.
+NAME_CACHE_SIZE = 2 ** 14
+
+_nameCache = OrderedDict()
+
+# A name without braces and not starting with a nobility part, followed by a separating " and "
+# or the end of the names list. Parsing such a name does not depend on its context, so the
+# resulting :class:`Name` can be reused for any occurrence of the same text.
+_SIMPLE_NAME = re.compile(r'[^\sa-z{}][^{}]*?(?=[ \t\n\r]+and[ \t\n\r]|[ \t\n\r]*})')
+
+
+def _cachedName(s, pos):
+    """Like :func:`_name`, but shares the :class:`Name` objects of identical simple names."""
+    pos = _skip(s, pos)
+    match = _SIMPLE_NAME.match(s, pos)
+    if match:
+        name = _nameCache.get(match.group())
+        if name is not None:
+            return name, match.end()
+    name, end = _name(s, pos)
+    if match and match.end() == end:
+        if len(_nameCache) >= NAME_CACHE_SIZE:
+            _nameCache.popitem(last=False)
+        _nameCache[match.group()] = name
+    return name, end
+
+
+def _namesList(s, pos):
+    pos = _expect(s, pos, '{')
+    name, pos = _cachedName(s, pos)
+    names = [name]
+    while True:
+        match = _NAME_SEP.match(s, _skip(s, pos))
+        if match is None:
+            break
+        try:
+            name, sepEnd = _cachedName(s, match.end())
+        except _Mismatch:
+            break
+        names.append(name)
+        pos = sepEnd
+    pos = _expect(s, pos, '}')
+    return names, pos
+
+
+def _comment(s, pos):
+    pos = _expect(s, pos, '{')
+    match = _CHARS_NO_CURLY.match(s, pos)
+    if match is None:
+        raise _Mismatch(pos)
+    return Comment(match.group()), _expect(s, match.end(), '}')
+
+
+def _preamble(s, pos):
+    pos = _expect(s, pos, '{')
+    tokens, pos = _fieldValue(s, pos)
+    return Preamble(tokens), _expect(s, pos, '}')
+
+
+def _macro(s, pos):
+    pos = _expect(s, pos, '{')
+    key, pos = _matchName(s, pos)
+    pos = _expect(s, pos, '=')
+    tokens, pos = _fieldValue(s, pos)
+    return MacroDefinition(key.lower(), tokens), _expect(s, pos, '}')
+
+
+_SPECIAL_DEFINITIONS = {'comment': _comment, 'preamble': _preamble, 'string': _macro}
+
+
+def _definition(s, start, lazy=False):
+    """Parse the definition starting at `s[start] == '@'`."""
+    kind, pos = _matchName(s, start + 1)
+    special = _SPECIAL_DEFINITIONS.get(kind.lower())
+    if special is not None:
+        try:
+            return special(s, pos)
+        except _Mismatch:
+            pass  # like the pyparsing grammar, try to parse it as an entry instead
+    return _entry(s, start, lazy)
+
+
+# Field values which are decoded on first access (by :func:`decodeField`) are only skipped by the
+# parser. The fast backend does this for name fields, the lazy backend for all fields.
+
+_QUOTE_OR_CURLY = re.compile(r'["{}]')
+_FLAT_CURLY = re.compile(r'{[^{}]*}')
+_FIELD_START = re.compile(r'[ \t\n\r]*(' + notDigname.pattern + r')[ \t\n\r]*=')
+
+
+def _skipCurly(s, pos):
+    match = _FLAT_CURLY.match(s, pos)  # shortcut for the common case without nested braces
+    if match:
+        return match.end()
+    end, _ = _matchBraces(s, pos, 0)
+    if end < 0:
+        raise _Mismatch(pos)
+    return end
+
+
+def _skipString(s, pos):
+    """Return the end position of the string that :func:`_string` would parse."""
+    pos = _skip(s, pos)
+    match = _NUMBER.match(s, pos) or _NOT_DIGNAME.match(s, pos)
+    if match:
+        return match.end()
+    char = s[pos:pos + 1]
+    if char == '{':
+        return _skipCurly(s, pos)
+    if char != '"':
+        raise _Mismatch(pos)
+    pos += 1
+    while True:
+        match = _QUOTE_OR_CURLY.search(s, pos)
+        if match is None:
+            raise _Mismatch(len(s))
+        char = match.group()
+        if char == '"':
+            return match.end()
+        if char == '}':
+            raise _Mismatch(match.start())
+        pos = _skipCurly(s, match.start())
+
+
+def _skipValue(s, pos):
+    """Return the end position of the value that :func:`_fieldValue` would parse."""
+    pos = _skipString(s, pos)
+    while True:
+        hashPos = _skip(s, pos)
+        if not s.startswith('#', hashPos):
+            return pos
+        try:
+            pos = _skipString(s, hashPos + 1)
+        except _Mismatch:
+            return pos
+
+
+def _entry(s, start, lazy=False):
+    """Parse an entry. The values of name fields (and of all fields, if `lazy` is set) are not
+    decoded but only located by a :class:`FieldSpan`.
+    """
+    entrytype, pos = _matchName(s, start + 1)
+    pos = _expect(s, pos, '{')
+    citekey, pos = _matchName(s, pos, _ANY_NAME)
+    pos = _expect(s, pos, ',')
+    fields = OrderedDict()
+    while True:
+        match = _FIELD_START.match(s, pos)
+        if match is None:
+            break
+        key = match.group(1).lower()
+        try:
+            if lazy or key in NAME_FIELDS:
+                valueEnd = _skipValue(s, match.end())
+                value = FieldSpan(match.end() - start, valueEnd - start)
+            else:
+                tokens, valueEnd = _fieldValue(s, match.end())
+                value = _formatValue(tokens)
+        except _Mismatch:
+            break
+        fields[key] = value
+        pos = valueEnd
+        commaPos = _skip(s, pos)
+        if not s.startswith(',', commaPos):
+            break
+        pos = commaPos + 1
+    pos = _expect(s, pos, '}')
+    return LazyEntry(entrytype=entrytype.lower(), citekey=citekey, fields=fields,
+                     src=s[start:pos]), pos
+
+
+def fieldSources(bibsrc):
+    """Return an :class:`OrderedDict` mapping the (lower-case) field names of the entry whose
+    source text is `bibsrc` to the source texts of their values, as written in the file.
+
+    Raises :class:`DatabaseFormatError` if `bibsrc` is not a well-formed entry.
+    """
+    try:
+        _, pos = _matchName(bibsrc, _expect(bibsrc, 0, '@'))
+        pos = _expect(bibsrc, pos, '{')
+        _, pos = _matchName(bibsrc, pos, _ANY_NAME)
+        pos = _expect(bibsrc, pos, ',')
+    except _Mismatch as mismatch:
+        raise _formatError(bibsrc, mismatch.pos, 1)
+    sources = OrderedDict()
+    while True:
+        match = _FIELD_START.match(bibsrc, pos)
+        if match is None:
+            break
+        try:
+            valueEnd = _skipValue(bibsrc, match.end())
+        except _Mismatch:
+            break
+        sources[match.group(1).lower()] = bibsrc[_skip(bibsrc, match.end()):valueEnd]
+        pos = _skip(bibsrc, valueEnd)
+        if not bibsrc.startswith(',', pos):
+            break
+        pos += 1
+    return sources
+
+
+def decodeField(bibsrc, key, span, offset=0):
+    """Decode the value of the field `key` of an entry, located at the :class:`FieldSpan`
+    `span` of the entry's source text, which starts at position `offset` of `bibsrc`.
+
+    The result is the same as that of the fast backend, except for malformed ``author`` or
+    ``editor`` fields which are concatenated with ``#``: these are decoded as ordinary values
+    instead of raising an error.
+    """
+    if key in NAME_FIELDS:
+        try:
+            names, end = _namesList(bibsrc, offset + span.start)
+            if end == offset + span.end:
+                return names[0] if len(names) == 1 else names
+        except _Mismatch:
+            pass
+    tokens, _ = _fieldValue(bibsrc, offset + span.start)
+    return _formatValue(tokens)
+
+
+def _formatError(text, pos, line, detail=None):
+    """Create a :class:`DatabaseFormatError` for position `pos` of `text`, which begins in line
+    `line` of the parsed file.
+    """
+    line += text.count('\n', 0, pos)
+    column = pos - text.rfind('\n', 0, pos)
+    return DatabaseFormatError('Malformed BibTeX input in line {}, column {}{}'
+                               .format(line, column, ': ' + detail if detail else ''))
+
+
+#: Number of characters read at once by :func:`iterdefinitions`.
+BLOCK_SIZE = 2 ** 16
+
+_BRACE = re.compile(r'[{}]')
+
+
+def _matchBraces(buf, pos, depth):
+    """Continue brace matching in `buf` at `pos` with the given nesting `depth`.
+
+    Returns the position after the closing brace that decreases the depth to zero, or -1 and the
+    current depth if `buf` ends before.
+    """
+    if depth == 0:
+        pos = buf.find('{', pos)
+        if pos < 0:
+            return -1, 0
+    for match in _BRACE.finditer(buf, pos):
+        if match.group() == '{':
+            depth += 1
+        else:
+            depth -= 1
+            if depth == 0:
+                return match.end(), 0
+    return -1, depth
+
+
+def iterdefinitions(source, blockSize=BLOCK_SIZE):
+    """Generate the source texts of the top-level elements of a BibTeX file, one at a time.
+
+    The file is read in blocks of `blockSize` characters, so memory usage is bounded by the size
+    of the largest single element. Definitions (entries, comments, macros and the preamble) are
+    located by brace matching only. If the file contains text before the first ``@``, the first
+    generated text is that implicit comment; all others start with ``@``.
+
+    :param source: Path or text file object of the ``.bib`` file.
+    :returns: Generator of ``(line, text)`` tuples, where `line` is the number of the line in which
+        `text` starts.
+    :raises DatabaseFormatError: if something else than whitespace is found between definitions
+        or the braces of a definition are not balanced.
+    """
+    for _, line, text in _iterdefinitions(source, blockSize):
+        yield line, text
+
+
+def _iterdefinitions(source, blockSize):
+    """Like :func:`iterdefinitions`, but generate ``(offset, line, text)`` tuples, where
+    `offset` is the position of `text` in the file.
+    """
+    if isinstance(source, str):
+        with io.open(source, 'rt', encoding='UTF-8') as stream:
+            for item in _iterdefinitions(stream, blockSize):
+                yield item
+        return
+    buf = ''
+    while '@' not in buf:
+        block = source.read(blockSize)
+        if not block:
+            break
+        buf += block
+    pos = _skip(buf, 0)
+    at = buf.find('@')
+    if at < 0:
+        if pos < len(buf):
+            raise _formatError(buf, pos, 1)
+        return
+    yield pos, 1 + buf.count('\n', 0, pos), buf[pos:at]
+    pos = at
+    line, linePos = 1 + buf.count('\n', 0, pos), pos  # line number at buf[linePos]
+    offset = 0  # position of buf in the file
+    eof = False
+    while True:
+        pos = _skip(buf, pos)
+        if pos == len(buf):
+            if eof:
+                return
+            line += buf.count('\n', linePos)
+            offset += len(buf)
+            buf, pos, linePos = source.read(blockSize), 0, 0
+            eof = not buf
+            continue
+        if buf[pos] != '@':
+            raise _formatError(buf[linePos:], pos - linePos, line)
+        end, depth = _matchBraces(buf, pos, 0)
+        while end < 0:
+            block = '' if eof else source.read(blockSize)
+            if not block:
+                raise _formatError(buf[linePos:], pos - linePos, line, 'unbalanced braces')
+            line += buf.count('\n', linePos, pos)
+            scanned = len(buf) - pos
+            offset += pos
+            buf, pos, linePos = buf[pos:] + block, 0, 0
+            end, depth = _matchBraces(buf, scanned, depth)
+        line += buf.count('\n', linePos, pos)
+        linePos = pos
+        yield offset + pos, line, buf[pos:end]
+        pos = end
+
+
+class StringSource:
+    """Read-only text file object for the string `text`.
+
+    In contrast to :class:`io.StringIO`, the string is not copied, and :meth:`read` returns
+    slices of it.
+    """
+
+    def __init__(self, text):
+        self.text = text
+        self.pos = 0
+
+    def read(self, size=-1):
+        start = self.pos
+        self.pos = len(self.text) if size < 0 else min(start + size, len(self.text))
+        return self.text[start:self.pos]
+
+
+def _parseDefinition(line, text, backend):
+    """Parse a single text generated by :func:`iterdefinitions`."""
+    if not text.startswith('@'):
+        return ImplicitComment(text)
+    if backend != 'pyparsing':
+        try:
+            item, end = _definition(text, 0, backend == 'lazy')
+            if end != len(text):
+                raise _Mismatch(end)
+        except _Mismatch as mismatch:
+            raise _formatError(text, mismatch.pos, line)
+        return item
+    try:
+        return definitions.parseString(text, parseAll=True)[0]
+    except ParseException as e:
+        raise _formatError(text, e.loc, line, e.msg)
+
+
+def _parseDefinitions(texts, backend):
+    return [_parseDefinition(line, text, backend) for line, text in texts]
+
+
+#: Minimum size (in characters) of a BibTeX file for which :func:`iterparse` uses multiple
+#: processes.
+PARALLEL_THRESHOLD = 2 ** 19
+
+#: Size (in characters) of the chunks of definitions handed to a worker process.
+CHUNK_SIZE = 2 ** 17
+
+
+def _chunks(texts):
+    chunk, size = [], 0
+    for item in texts:
+        chunk.append(item)
+        size += len(item[1])
+        if size >= CHUNK_SIZE:
+            yield chunk
+            chunk, size = [], 0
+    if chunk:
+        yield chunk
+
+
+def _iterparseParallel(texts, backend, workers):
+    head, size = [], 0
+    for item in texts:
+        head.append(item)
+        size += len(item[1])
+        if size >= PARALLEL_THRESHOLD:
+            break
+    else:
+        # small file: the process pool would not pay off
+        for line, text in head:
+            yield _parseDefinition(line, text, backend)
+        return
+    with concurrent.futures.ProcessPoolExecutor(workers) as executor:
+        pending = collections.deque()
+        for chunk in _chunks(itertools.chain(head, texts)):
+            pending.append(executor.submit(_parseDefinitions, chunk, backend))
+            if len(pending) > 2 * workers:
+                for item in pending.popleft().result():
+                    yield item
+        while pending:
+            for item in pending.popleft().result():
+                yield item
+
+
+def iterparse(source, backend='pyparsing', workers=1, blockSize=BLOCK_SIZE):
+    """Parse a BibTeX file and generate its elements (:class:`ImplicitComment`, :class:`Entry`,
+    :class:`Comment`, :class:`MacroDefinition` and :class:`Preamble` objects) in file order, each
+    as soon as it has been read completely.
+
+    :param source: Path or text file object of the ``.bib`` file.
+    :param backend: The parser engine to use; one of :data:`BACKENDS`. ``'pyparsing'`` uses the
+        grammar defined in this module, ``'fast'`` the hand-written parser. Both produce
+        identical results on well-formed input, with the exception that the contents of
+        :class:`Preamble` and :class:`MacroDefinition` objects are plain (nested) lists instead
+        of :class:`pyparsing.ParseResults` for the fast backend. ``'lazy'`` is the fast parser
+        creating :class:`LazyEntry` objects, which decode their fields on first access.
+    :param workers: If larger than 1 and the file is at least :data:`PARALLEL_THRESHOLD`
+        characters long, its definitions are parsed in chunks by that many processes. The result
+        is the same as for serial parsing.
+    :raises DatabaseFormatError: if the file is malformed.
+    """
+    if backend not in BACKENDS:
+        raise ValueError('Unknown parser backend "{}"'.format(backend))
+    return _parse(iterdefinitions(source, blockSize), backend, workers)
+
+
+def _parse(texts, backend, workers):
+    if workers > 1:
+        return _iterparseParallel(texts, backend, workers)
+    return (_parseDefinition(line, text, backend) for line, text in texts)
+
+
+def fingerprint(text):
+    """Return the fingerprint of a definition text, as generated by :func:`iterdefinitions`."""
+    return hashlib.sha1(text.encode('UTF-8')).digest()
+
+
+def iterparseIncremental(source, known=None, backend='pyparsing', workers=1,
+                         blockSize=BLOCK_SIZE):
+    """Parse a BibTeX file like :func:`iterparse`, but reuse elements parsed before.
+
+    :param known: Dictionary mapping :func:`fingerprint` values of definition texts to the elements
+        that were parsed from these texts (with the same `backend`). Known definitions are not
+        parsed again; instead, the element from `known` is generated.
+    :returns: Generator of ``(fingerprint, offset, element)`` tuples in file order, where `offset`
+        is the position of the element's source text in the file.
+    :raises DatabaseFormatError: if the file is malformed.
+    """
+    if backend not in BACKENDS:
+        raise ValueError('Unknown parser backend "{}"'.format(backend))
+    if known is None:
+        known = {}
+    # (fingerprint, offset, known element or None) of all texts read, but not yet generated
+    pending = collections.deque()
+
+    def unknownTexts():
+        for offset, line, text in _iterdefinitions(source, blockSize):
+            key = fingerprint(text)
+            pending.append((key, offset, known.get(key)))
+            if key not in known:
+                yield line, text
+
+    for item in _parse(unknownTexts(), backend, workers):
+        while pending[0][2] is not None:
+            yield pending.popleft()
+        key, offset, _ = pending.popleft()
+        yield key, offset, item
+    while pending:
+        yield pending.popleft()
+
+
+def parseBibstring(bibstring, backend='pyparsing', workers=1):
+    """Parse the BibTeX database `bibstring` and return a list of the contained elements.
+
+    See :func:`iterparse` for the parameters.
+    """
+    return list(iterparse(io.StringIO(bibstring), backend, workers))
@@ -28,25 +28,82 @@ def export(args):
 
 def check(args):
     from bibtexvcs import checks
-    errors, warnings = checks.performDatabaseCheck(args.db)
-    for err in errors:
+    profile = args.profile or args.profile_dir is not None
+    result = checks.performDatabaseCheck(args.db, parallel=args.jobs, profile=profile,
+                                         profileDir=args.profile_dir, timeout=args.timeout,
+                                         budget=args.budget, maxErrors=args.max_errors)
+    for err in result.errors:
         print('FAIL: {}'.format(err))
-    for warn in warnings:
+    for warn in result.warnings:
         print('WARN: {}'.format(warn))
+    if result.profiles is not None:
+        printProfiles(result.profiles)
+
+
+def printProfiles(profiles):
+    """Print a table of the :class:`CheckProfile <bibtexvcs.checks.CheckProfile>` objects in
+    `profiles`, slowest check first.
+    """
+    width = max([len(profile.name) for profile in profiles] + [5])
+    print('{:<{}}  {:>9}  {:>9}  {:>7}  {:>7}'.format('check', width, 'wall [s]', 'CPU [s]',
+                                                     'entries', 'results'))
+    for profile in sorted(profiles, key=lambda profile: -profile.wallTime):
+        entries = '-' if profile.entries is None else profile.entries
+        print('{:<{}}  {:>9.3f}  {:>9.3f}  {:>7}  {:>7}'.format(
+            profile.name, width, profile.wallTime, profile.cpuTime, entries, profile.results))
+
+
+def positive(convert):
+    """Return an argument type for :mod:`argparse` that converts with `convert` and only accepts
+    positive values.
+    """
+    def convertPositive(text):
+        value = convert(text)
+        if value <= 0:
+            raise argparse.ArgumentTypeError('{} is not positive'.format(text))
+        return value
+    return convertPositive
+
+
+def search(args):
+    from bibtexvcs.search import loadIndex
+    index = loadIndex(args.db)
+    for citekey, _ in index.search(args.output, limit=args.limit):
+        entry = args.db.bibfile[citekey]
+        print('{}: {}'.format(citekey, entry.get('title', '')))
+
+
+def sql(args):
+    """Run an SQL query on the database's mirror. If the mirror is up to date, the database is
+    not loaded at all.
+    """
+    from bibtexvcs import config, sqlmirror
+    directory = args.database or config.getDefaultDirectory()
+    path = directory and sqlmirror.freshMirror(directory)
+    if path:
+        columns, rows = sqlmirror.query(path, args.output)
+    else:
+        db = Database(directory) if directory else Database.getDefault()
+        columns, rows = db.sql(args.output)
+    if columns:
+        print('\t'.join(columns))
+    for row in rows:
+        print('\t'.join('' if value is None else str(value) for value in row))
 
 
 def script():
     """Command-line script that allows to export a database and run checks."""
     desc = ('Command-line interface to the BibTeX VCS package. Can be used to run the GUI, run '
             'JabRef configured for a specified BibTeX VCS database, export a database using '
-            'templates (e.g. HTML output), or run database sanity checks.')
+            'templates (e.g. HTML output), run database sanity checks, search the titles, '
+            'abstracts and keywords of the entries, or query the database with SQL.')
     parser = argparse.ArgumentParser(description=desc)
     parser.add_argument(
         '-d', '--database', metavar='DB',
         help='specify database root directory. If left out, the default database is used'
     )
 
-    parser.add_argument('mode', choices=('gui', 'jabref', 'export', 'check'),
+    parser.add_argument('mode', choices=('gui', 'jabref', 'export', 'check', 'search', 'sql'),
                         help='choose mode of operation (default: gui)',
                         default='gui',
                         nargs='?')
@@ -54,12 +111,43 @@ def script():
     exportGroup = parser.add_argument_group('exporting options (only in "export" mode)')
     exportGroup.add_argument('--template', help='template file')
     exportGroup.add_argument('--docs', help='documents root path')
-    exportGroup.add_argument('output', nargs='?', help='output file')
+    exportGroup.add_argument('output', nargs='?',
+                             help='output file (in "export" mode) or query (in "search" and '
+                                  '"sql" mode)')
+
+    checkGroup = parser.add_argument_group('check options (only in "check" mode)')
+    checkGroup.add_argument('-j', '--jobs', type=int,
+                            help='number of checks run in parallel (default: the checkWorkers '
+                                 'option of the database, or 1)')
+    checkGroup.add_argument('--timeout', type=positive(float), metavar='SECONDS',
+                            help='abandon a check after this time (default: the checkTimeout '
+                                 'option of the database)')
+    checkGroup.add_argument('--budget', type=positive(float), metavar='SECONDS',
+                            help='abandon all checks after this time (default: the checkBudget '
+                                 'option of the database)')
+    checkGroup.add_argument('--max-errors', type=positive(int), metavar='N',
+                            help='stop after N failed checks (default: the checkMaxErrors option '
+                                 'of the database)')
+    checkGroup.add_argument('--profile', action='store_true',
+                            help='print the time taken by each check (cached check results '
+                                 'are not used)')
+    checkGroup.add_argument('--profile-dir', metavar='DIR',
+                            help='write cProfile statistics of each check to DIR/<check>.pstats '
+                                 '(implies --profile; checks are run serially)')
+
+    searchGroup = parser.add_argument_group('search options (only in "search" mode)')
+    searchGroup.add_argument('--limit', type=int, default=20,
+                             help='maximum number of results (default: 20)')
 
     args = parser.parse_args()
+    if args.mode in ('search', 'sql') and not args.output:
+        parser.error('the "{}" mode requires a query'.format(args.mode))
     if args.mode == 'gui':
         import bibtexvcs.gui
         bibtexvcs.gui.run(args.database)
+    elif args.mode == 'sql':
+        # loads the database only if its SQL mirror is out of date
+        sql(args)
     else:
         # load database. We don't load it before starting the GUI because the GUI will display
         # a progress bar while loading the database by itself.
@@ -73,6 +161,8 @@ def script():
             args.db.runJabref()
         elif args.mode == 'check':
             check(args)
+        elif args.mode == 'search':
+            search(args)
 
 if __name__ == '__main__':
     script()
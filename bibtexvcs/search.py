@@ -0,0 +1,188 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+# Copyright 2014-2015 Michael Helmling
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 3 as
+# published by the Free Software Foundation
+
+"""The :mod:`search <bibtexvcs.search>` module implements full-text search over the titles,
+abstracts and keywords of a database's entries.
+
+The :class:`SearchIndex` is an inverted index ranking results by BM25_. It is stored in the user's
+cache directory (see :func:`bibtexvcs.config.getCachePath`) and synchronized with the bib file on
+load, re-indexing only entries that have changed.
+
+.. _BM25: https://en.wikipedia.org/wiki/Okapi_BM25
+"""
+from __future__ import division, print_function, unicode_literals
+import hashlib, heapq, io, math, pickle, re, unicodedata
+
+import bibtexvcs
+from bibtexvcs.cache import cacheFilename, writeCache
+
+#: Entry fields whose contents are indexed.
+FIELDS = ('title', 'abstract', 'keywords')
+
+#: BM25 parameters.
+K1 = 1.2
+B = 0.75
+
+_LATEX_COMMAND = re.compile(r'\\([a-zA-Z]+|.)')
+#: LaTeX commands for special letters, by the text they are indexed as.
+_LATEX_LETTERS = {'ss': 'ss', 'o': 'o', 'O': 'o', 'ae': 'ae', 'AE': 'ae', 'oe': 'oe',
+                  'OE': 'oe', 'aa': 'a', 'AA': 'a', 'l': 'l', 'L': 'l', 'i': 'i', 'j': 'j'}
+_WORD = re.compile(r'\w+', re.UNICODE)
+
+
+def _replaceCommand(match):
+    name = match.group(1)
+    if name in _LATEX_LETTERS:
+        return _LATEX_LETTERS[name]
+    # one-character commands are accents (\"o, \v{s}), others separate words (\emph{x})
+    return '' if len(name) == 1 else ' '
+
+
+def tokenize(text):
+    """Split `text` into a list of normalized words.
+
+    LaTeX commands and braces are removed (except for commands denoting special letters, like
+    ``\\ss``), accents are stripped, and everything is converted to lower case.
+    """
+    text = _LATEX_COMMAND.sub(_replaceCommand, text)
+    text = unicodedata.normalize('NFKD', text.replace('{', '').replace('}', ''))
+    text = ''.join(char for char in text if not unicodedata.combining(char))
+    return _WORD.findall(text.lower())
+
+
+def fieldText(value):
+    """Return the text of a field value, ignoring macro references in concatenations."""
+    if isinstance(value, str):
+        return value
+    if isinstance(value, list):
+        return ' '.join(part for part in value if isinstance(part, str))
+    return ''
+
+
+def entryFingerprint(entry):
+    return hashlib.sha1(entry.bibsrc.encode('UTF-8')).digest()
+
+
+class SearchIndex:
+    """Inverted index over the :data:`FIELDS` of a set of entries.
+
+    .. attribute:: postings
+
+        Maps each word to a dictionary mapping the citekeys of the entries containing it to the
+        number of occurrences.
+    """
+
+    def __init__(self):
+        self.postings = {}
+        self.lengths = {}  # citekey -> number of words
+        self.fingerprints = {}  # citekey -> entryFingerprint
+        self.totalLength = 0
+
+    def add(self, citekey, entry):
+        """Index `entry` under `citekey`, replacing a previously indexed entry."""
+        if citekey in self.lengths:
+            self.remove([citekey])
+        words = []
+        for field in FIELDS:
+            if field in entry:
+                words.extend(tokenize(fieldText(entry[field])))
+        for word in words:
+            posting = self.postings.setdefault(word, {})
+            posting[citekey] = posting.get(citekey, 0) + 1
+        self.lengths[citekey] = len(words)
+        self.fingerprints[citekey] = entryFingerprint(entry)
+        self.totalLength += len(words)
+
+    def remove(self, citekeys):
+        """Remove the entries indexed under the given citekeys (in a single pass over the
+        postings).
+        """
+        citekeys = set(citekeys)
+        for citekey in citekeys:
+            self.totalLength -= self.lengths.pop(citekey)
+            del self.fingerprints[citekey]
+        for word in list(self.postings):
+            posting = self.postings[word]
+            for citekey in citekeys.intersection(posting):
+                del posting[citekey]
+            if not posting:
+                del self.postings[word]
+
+    def synchronize(self, bibfile):
+        """Update the index to contain exactly the entries of `bibfile`.
+
+        Only entries that are new or whose source text has changed are (re-)indexed.
+
+        :returns: The number of (re-)indexed and removed entries.
+        """
+        stale = [citekey for citekey, fingerprint in self.fingerprints.items()
+                 if citekey not in bibfile or entryFingerprint(bibfile[citekey]) != fingerprint]
+        if stale:
+            self.remove(stale)
+        added = [citekey for citekey in bibfile if citekey not in self.lengths]
+        for citekey in added:
+            self.add(citekey, bibfile[citekey])
+        return len(added) + len(set(stale).difference(added))
+
+    def search(self, query, limit=None):
+        """Return a list of ``(citekey, score)`` pairs of the entries containing all words of
+        `query`, sorted by decreasing BM25 score.
+
+        The candidates are found by intersecting the postings, starting with the rarest word, so
+        the cost depends on the number of entries containing it rather than on the database size.
+        """
+        words = set(tokenize(query))
+        if not words or not self.lengths:
+            return []
+        postings = sorted((self.postings.get(word, {}) for word in words), key=len)
+        candidates = [citekey for citekey in postings[0]
+                      if all(citekey in posting for posting in postings[1:])]
+        count = len(self.lengths)
+        averageLength = self.totalLength / count or 1
+        idfs = [math.log(1 + (count - len(posting) + .5) / (len(posting) + .5))
+                for posting in postings]
+        scores = []
+        for citekey in candidates:
+            norm = K1 * (1 - B + B * self.lengths[citekey] / averageLength)
+            score = 0
+            for idf, posting in zip(idfs, postings):
+                frequency = posting[citekey]
+                score += idf * frequency * (K1 + 1) / (frequency + norm)
+            scores.append((score, citekey))
+        key = lambda item: (-item[0], item[1])
+        if limit is None:
+            scores.sort(key=key)
+        else:
+            scores = heapq.nsmallest(limit, scores, key=key)
+        return [(citekey, score) for score, citekey in scores]
+
+
+def loadIndex(database, cacheDir=None):
+    """Return the :class:`SearchIndex` for the entries of `database`.
+
+    The index is read from the cache, updated if the bib file has changed, and written back.
+    """
+    if cacheDir is None:
+        from bibtexvcs.config import getCachePath
+        cacheDir = getCachePath()
+    cacheFile = cacheFilename(database.bibfilePath, 'search', cacheDir)
+    contentHash = hashlib.sha1(database.bibfile.source.encode('UTF-8')).hexdigest()
+    index = None
+    try:
+        with io.open(cacheFile, 'rb') as stream:
+            version, indexedHash = pickle.load(stream)
+            if version == bibtexvcs.__version__:
+                index = pickle.load(stream)
+    except Exception:
+        pass
+    if index is None:
+        index, indexedHash = SearchIndex(), None
+    if indexedHash != contentHash:
+        index.synchronize(database.bibfile)
+        writeCache(cacheFile, (bibtexvcs.__version__, contentHash), index)
+    return index
@@ -0,0 +1,259 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+# Copyright 2014-2015 Michael Helmling
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 3 as
+# published by the Free Software Foundation
+
+"""The :mod:`sqlmirror <bibtexvcs.sqlmirror>` module mirrors a database into an SQLite_ file
+which can be queried with SQL (see :meth:`bibtexvcs.database.Database.sql`).
+
+The mirror is stored in the user's cache directory (see :func:`bibtexvcs.config.getCachePath`)
+and contains the following tables:
+
+``entries(citekey, entrytype, position, hash, source)``
+    One row per entry, in file order (``position``), with its source text and the SHA-1 hash of
+    that text.
+``fields(citekey, name, value)``
+    The field values of the entries, with macros expanded and names in ``Last, First`` form.
+``names(citekey, field, position, first, nobility, last, suffix)``
+    The names of the ``author`` and ``editor`` fields.
+``macros(name, value)``
+    The (expanded) macros defined in the bib file.
+``journals(macro, abbr, full)``
+    The journals of the journals file.
+``documents(citekey, filename)``
+    The documents referenced by the entries. The ``filename`` is ``NULL`` if the ``file`` field
+    of an entry is not in the expected format (see :meth:`bibtexvcs.bibfile.Entry.filename`).
+
+When synchronizing, only entries whose hash has changed are written, unless the macros have
+changed. The mirror also records the size and modification time that the files it was built from
+had when the database read them, such that :func:`freshMirror` can tell without parsing anything
+whether it is up to date.
+
+.. _SQLite: https://www.sqlite.org
+"""
+from __future__ import division, print_function, unicode_literals
+import hashlib, json, os, sqlite3
+from urllib.request import pathname2url
+
+import bibtexvcs
+from bibtexvcs.bibfile import DatabaseFormatError, MacroReference, Name
+
+SCHEMA = """
+CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE entries (citekey TEXT PRIMARY KEY, entrytype TEXT, position INTEGER, hash TEXT,
+                      source TEXT);
+CREATE TABLE fields (citekey TEXT, name TEXT, value TEXT, PRIMARY KEY (citekey, name));
+CREATE TABLE names (citekey TEXT, field TEXT, position INTEGER, first TEXT, nobility TEXT,
+                    last TEXT, suffix TEXT, PRIMARY KEY (citekey, field, position));
+CREATE TABLE macros (name TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE journals (macro TEXT PRIMARY KEY, abbr TEXT, full TEXT);
+CREATE TABLE documents (citekey TEXT PRIMARY KEY, filename TEXT);
+CREATE INDEX namesLast ON names (last);
+CREATE INDEX fieldsName ON fields (name, value);
+"""
+
+#: Tables holding one or more rows per entry.
+ENTRY_TABLES = ('entries', 'fields', 'names', 'documents')
+
+#: Fields whose names are stored in the ``names`` table.
+NAME_FIELDS = ('author', 'editor')
+
+
+def mirrorFilename(directory, cacheDir=None):
+    """Return the path of the SQLite mirror of the database in `directory`."""
+    if cacheDir is None:
+        from bibtexvcs.config import getCachePath
+        cacheDir = getCachePath()
+    pathHash = hashlib.sha1(os.path.abspath(directory).encode('UTF-8')).hexdigest()
+    return os.path.join(cacheDir, '{}.sqlite'.format(pathHash))
+
+
+def fileStats(database):
+    """Return the size and modification time of the files the mirror of `database` is built
+    from, as they were when `database` read them (see :meth:`Database.inputState`). The bib and
+    journals files are loaded if necessary.
+    """
+    database.bibfile, database.journals
+    return [[os.path.abspath(path)] + (database.inputState(path) or [None, None])
+            for path in (database.configPath, database.bibfilePath, database.journalsPath)]
+
+
+def contentHash(database):
+    """Return a hash of the data of `database` the mirror is built from. It differs from the hash
+    of the files if the loaded data has been changed without reloading the database, for instance
+    by :meth:`BibFile.save`.
+    """
+    digest = hashlib.sha1(database.bibfile.source.encode('UTF-8'))
+    digest.update(json.dumps([list(journal) for journal in database.journals.values()])
+                  .encode('UTF-8'))
+    return digest.hexdigest()
+
+
+def _readMeta(connection):
+    try:
+        return dict(connection.execute('SELECT key, value FROM meta'))
+    except sqlite3.Error:
+        return {}
+
+
+def _isFresh(meta, stats):
+    if meta.get('version') != bibtexvcs.__version__:
+        return False
+    try:
+        return json.loads(meta['files']) == stats
+    except (KeyError, ValueError):
+        return False
+
+
+def freshMirror(directory, cacheDir=None):
+    """Return the path of the mirror of the database in `directory` if it exists and the files it
+    was built from are unchanged, and ``None`` otherwise.
+
+    This only reads the mirror and the file system, so it is much faster than loading the
+    database.
+    """
+    path = mirrorFilename(directory, cacheDir)
+    if not os.path.exists(path):
+        return None
+    connection = sqlite3.connect(path)
+    try:
+        meta = _readMeta(connection)
+    finally:
+        connection.close()
+    try:
+        stats = []
+        for statPath, _, _ in json.loads(meta['files']):
+            stat = os.stat(statPath)
+            stats.append([statPath, stat.st_size, stat.st_mtime_ns])
+    except (KeyError, ValueError, OSError):
+        return None
+    return path if _isFresh(meta, stats) else None
+
+
+def _fieldValue(database, value):
+    """Return the text stored for a field value. Unlike :meth:`Database.strval`, this expands
+    undefined macros to their names.
+    """
+    if isinstance(value, Name):
+        return value.toBibtex()
+    if isinstance(value, MacroReference):
+        return database.macros.get(value.name, value.name)
+    if isinstance(value, list):
+        if all(isinstance(part, Name) for part in value):
+            return ' and '.join(name.toBibtex() for name in value)
+        return ''.join(_fieldValue(database, part) for part in value)
+    return str(value)
+
+
+def _entryRows(database, position, entry, entryHash):
+    """Return the rows of the :data:`ENTRY_TABLES` for an entry, by table."""
+    rows = dict((table, []) for table in ENTRY_TABLES)
+    citekey = entry.citekey
+    rows['entries'].append((citekey, entry.entrytype, position, entryHash, entry.bibsrc))
+    for name, value in entry.items():
+        rows['fields'].append((citekey, name, _fieldValue(database, value)))
+        if name in NAME_FIELDS:
+            names = [value] if isinstance(value, Name) else value
+            rows['names'].extend((citekey, name, index, person.first, person.nobility,
+                                  person.last, person.suffix)
+                                 for index, person in enumerate(names)
+                                 if isinstance(person, Name))
+    try:
+        filename = entry.filename()
+    except (DatabaseFormatError, AttributeError, TypeError):
+        # the file field is not a file name, e.g. a macro reference or a concatenation
+        rows['documents'].append((citekey, None))
+    else:
+        if filename:
+            rows['documents'].append((citekey, filename))
+    return rows
+
+
+def _macrosHash(database):
+    return hashlib.sha1(json.dumps(sorted(database.macros.items())).encode('UTF-8')).hexdigest()
+
+
+def synchronize(database, cacheDir=None):
+    """Create or update the SQLite mirror of `database`.
+
+    Nothing is done if the loaded data of the database is unchanged since the last
+    synchronization.
+    Otherwise, only the entries that have been added, removed or changed are written, unless the
+    macros have changed, which may affect the values of all entries.
+
+    :returns: The path of the mirror.
+    """
+    path = mirrorFilename(database.directory, cacheDir)
+    if not os.path.exists(os.path.dirname(path)):
+        os.makedirs(os.path.dirname(path))
+    stats = fileStats(database)
+    content = contentHash(database)
+    connection = sqlite3.connect(path)
+    try:
+        meta = _readMeta(connection)
+        if _isFresh(meta, stats) and meta.get('content') == content:
+            return path
+        with connection:
+            if meta.get('version') != bibtexvcs.__version__:
+                for table in ('meta', 'macros', 'journals') + ENTRY_TABLES:
+                    connection.execute('DROP TABLE IF EXISTS {}'.format(table))
+                connection.executescript(SCHEMA)
+                meta = {}
+            macrosHash = _macrosHash(database)
+            if meta.get('macros') != macrosHash:
+                for table in ENTRY_TABLES:
+                    connection.execute('DELETE FROM {}'.format(table))
+            stored = dict((citekey, (entryHash, position)) for citekey, entryHash, position in
+                          connection.execute('SELECT citekey, hash, position FROM entries'))
+            removed = [(citekey,) for citekey in stored if citekey not in database.bibfile]
+            changed = []
+            moved = []
+            for position, (citekey, entry) in enumerate(database.bibfile.items()):
+                entryHash = hashlib.sha1(entry.bibsrc.encode('UTF-8')).hexdigest()
+                if citekey not in stored or stored[citekey][0] != entryHash:
+                    if citekey in stored:
+                        removed.append((citekey,))
+                    changed.append(_entryRows(database, position, entry, entryHash))
+                elif stored[citekey][1] != position:
+                    moved.append((position, citekey))
+            for table in ENTRY_TABLES:
+                connection.executemany('DELETE FROM {} WHERE citekey = ?'.format(table), removed)
+            for table in ENTRY_TABLES:
+                rows = [row for entryRows in changed for row in entryRows[table]]
+                if rows:
+                    connection.executemany('INSERT INTO {} VALUES ({})'.format(
+                        table, ', '.join('?' * len(rows[0]))), rows)
+            connection.executemany('UPDATE entries SET position = ? WHERE citekey = ?', moved)
+            connection.execute('DELETE FROM macros')
+            connection.executemany('INSERT INTO macros VALUES (?, ?)',
+                                   ((name, database.macros[name])
+                                    for name in database.bibfile.macroDefinitions))
+            connection.execute('DELETE FROM journals')
+            connection.executemany('INSERT INTO journals VALUES (?, ?, ?)',
+                                   ((journal.macro, journal.abbr, journal.full)
+                                    for journal in database.journals.values()))
+            connection.executemany('INSERT OR REPLACE INTO meta VALUES (?, ?)',
+                                   [('version', bibtexvcs.__version__),
+                                    ('macros', macrosHash),
+                                    ('content', content),
+                                    ('files', json.dumps(stats))])
+    finally:
+        connection.close()
+    return path
+
+
+def query(path, statement, parameters=()):
+    """Execute the SQL `statement` on the mirror at `path`, which is opened read-only.
+
+    :returns: A pair ``(columns, rows)`` of the list of column names and the list of result rows.
+    """
+    connection = sqlite3.connect('file:{}?mode=ro'.format(pathname2url(path)), uri=True)
+    try:
+        cursor = connection.execute(statement, parameters)
+        columns = [description[0] for description in cursor.description or ()]
+        return columns, cursor.fetchall()
+    finally:
+        connection.close()
@@ -6,7 +6,7 @@
 # it under the terms of the GNU General Public License version 3 as
 # published by the Free Software Foundation
 from __future__ import division, print_function, unicode_literals
-import io, re, os, sys
+import io, re, os
 
 from setuptools import setup, find_packages
 
@@ -24,10 +24,6 @@ with io.open(os.path.join(here, 'README.rst'), encoding='UTF-8') as f:
     long_description = f.read()
 
 requires = ['pyparsing']
-if sys.version_info.major == 2:
-    # depend on backported packages
-    requires.append('futures')
-    requires.append('configparser')
 
 
 setup(
@@ -43,13 +39,14 @@ setup(
       'Intended Audience :: Science/Research',
       'License :: OSI Approved :: GNU General Public License v3 or later (GPLv3+)',
       'Operating System :: OS Independent',
-      'Programming Language :: Python :: 2.7',
       'Programming Language :: Python :: 3',
+      'Programming Language :: Python :: 3 :: Only',
       'Topic :: Database :: Front-Ends',
     ],
     license='GPL3',
     keywords='bibliography bibtex jabref',
     packages=find_packages(),
+    python_requires='>=3.7',
     install_requires=requires,
     entry_points=dict(gui_scripts=['btvcs = bibtexvcs.script:script']),
     include_package_data=True,
@@ -1,6 +1,6 @@
 from os.path import abspath, join, dirname
 from contextlib import contextmanager
-import tempfile, shutil
+import atexit, os, tempfile, shutil
 
 from bibtexvcs import database, vcs
 
@@ -9,6 +9,12 @@ def datadir():
     return join(abspath(dirname(__file__)), 'data')
 
 
+# keep the caches written by the tests (see bibtexvcs.config.getCachePath) out of the user's cache
+_cachehome = tempfile.mkdtemp()
+os.environ.pop('LOCALAPPDATA', None)
+os.environ['XDG_CACHE_HOME'] = _cachehome
+atexit.register(shutil.rmtree, _cachehome, True)
+
 
 @contextmanager    
 def tmpDatabase():
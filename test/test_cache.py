@@ -0,0 +1,77 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+# Copyright 2014-2015 Michael Helmling
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 3 as
+# published by the Free Software Foundation
+
+from __future__ import division, print_function, unicode_literals
+import io, os, pickle, shutil, tempfile
+import unittest
+from os.path import join
+
+from bibtexvcs import cache
+from bibtexvcs.bibfile import BibFile
+from . import datadir
+
+
+class TestParseCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.cacheDir = join(self.tmpdir, 'cache')
+        self.path = join(self.tmpdir, 'sample.bib')
+        shutil.copy(join(datadir(), 'sampleDB', 'sample.bib'), self.path)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def cacheFile(self, backend):
+        return cache.cacheFilename(self.path, backend, self.cacheDir)
+
+    def assertSameBibFile(self, bib1, bib2):
+        self.assertEqual(list(bib1.keys()), list(bib2.keys()))
+        for key in bib1:
+            self.assertEqual(list(bib1[key].items()), list(bib2[key].items()))
+            self.assertEqual(bib1[key].bibsrc, bib2[key].bibsrc)
+        self.assertEqual(list(bib1.macroDefinitions), list(bib2.macroDefinitions))
+        self.assertEqual([c.comment for c in bib1.comments], [c.comment for c in bib2.comments])
+
+    def testHit(self):
+        for backend in 'pyparsing', 'lazy':
+            bib = cache.loadBibFile(self.path, backend, cacheDir=self.cacheDir)
+            self.assertTrue(os.path.exists(self.cacheFile(backend)))
+            with io.open(self.cacheFile(backend), 'rb') as stream:
+                key = pickle.load(stream)
+            cached = cache.readCache(self.cacheFile(backend), key)
+            self.assertIsNotNone(cached)
+            self.assertSameBibFile(bib, cached)
+            self.assertSameBibFile(bib, BibFile(self.path, backend=backend))
+            self.assertEqual(cache.loadBibFile(self.path, backend, cacheDir=self.cacheDir).filename,
+                             self.path)
+
+    def testSaveCached(self):
+        with io.open(self.path, 'rb') as stream:
+            data = stream.read()
+        for backend in 'pyparsing', 'fast', 'lazy':
+            cache.loadBibFile(self.path, backend, cacheDir=self.cacheDir)
+            bib = cache.loadBibFile(self.path, backend, cacheDir=self.cacheDir)
+            self.assertFalse(any(entry.modified for entry in bib.values()))
+            bib.save()
+            with io.open(self.path, 'rb') as stream:
+                self.assertEqual(stream.read(), data)
+
+    def testInvalidation(self):
+        cache.loadBibFile(self.path, cacheDir=self.cacheDir)
+        with io.open(self.path, 'at', encoding='UTF-8') as bibfile:
+            bibfile.write('@misc{NewKey, title = {New}}\n')
+        self.assertIn('NewKey', cache.loadBibFile(self.path, cacheDir=self.cacheDir))
+
+    def testCorruptCache(self):
+        cache.loadBibFile(self.path, cacheDir=self.cacheDir)
+        with io.open(self.cacheFile('pyparsing'), 'r+b') as stream:
+            stream.truncate(os.path.getsize(self.cacheFile('pyparsing')) // 2)
+        bib = cache.loadBibFile(self.path, cacheDir=self.cacheDir)
+        self.assertSameBibFile(bib, BibFile(self.path))
+        self.assertEqual(os.listdir(self.cacheDir), [os.path.basename(self.cacheFile('pyparsing'))])
@@ -0,0 +1,379 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+# Copyright 2014-2015 Michael Helmling
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 3 as
+# published by the Free Software Foundation
+
+from __future__ import division, print_function, unicode_literals
+import io, os, time
+import unittest
+
+from bibtexvcs import checks
+from bibtexvcs.database import DatabaseFormatError
+from . import tmpDatabase
+
+duplicates = """
+@article{Original,
+  author = {Helmling, Michael},
+  title = {Mathematical Programming Decoding of Binary Linear Codes},
+  year = {2014}
+}
+@article{Copy,
+  author = {M. Helmling},
+  title = {Mathematical programming decoding of binary linear codes},
+  year = {2015}
+}
+@article{Preprint,
+  author = {Helmling, Michael},
+  title = {Mathematical Programming Decoding of Binary Linear Codes Revisited},
+  year = {2014}
+}
+@article{Different,
+  author = {Helmling, Michael},
+  title = {Something completely different},
+  year = {2014}
+}
+"""
+
+
+class TestDuplicatesCheck(unittest.TestCase):
+
+    def testDuplicates(self):
+        with tmpDatabase() as db:
+            with io.open(db.bibfilePath, 'at', encoding='UTF-8') as bibfile:
+                bibfile.write(duplicates)
+            db.reload()
+            warnings = [str(warning) for warning in checks.checkDuplicates(db)]
+            self.assertFalse(any('Different' in warning for warning in warnings))
+            self.assertIn('Entries "Copy" and "Original" might be duplicates (title similarity '
+                          '100%).', warnings)
+            self.assertTrue(any('"Original" and "Preprint"' in warning for warning in warnings))
+
+    def testNearDuplicatesWithoutCommonAuthor(self):
+        # titles sharing 9 of 11 words (similarity 82%), by different authors
+        with tmpDatabase() as db:
+            with io.open(db.bibfilePath, 'at', encoding='UTF-8') as bibfile:
+                for i in range(30):
+                    words = ' '.join('word{}x{}'.format(i, j) for j in range(9))
+                    for key, last in ('A', 'Doe'), ('B', 'Roe'):
+                        bibfile.write('@misc{{{0}{1}, author = {{{2}, J.}}, year = {{2000}}, '
+                                      'title = {{{3} {0}{1}}}}}\n'.format(key, i, last, words))
+            db.reload()
+            warnings = [str(warning) for warning in checks.checkDuplicates(db)]
+            self.assertEqual(len(warnings), 30)
+
+    def testConcatenatedYear(self):
+        with tmpDatabase() as db:
+            with io.open(db.bibfilePath, 'at', encoding='UTF-8') as bibfile:
+                bibfile.write('@misc{First, author = {Doe, J.}, year = 2000 # jun, title = {A}}\n'
+                              '@misc{Second, author = {Doe, J.}, year = {2000June}, title = {A}}\n')
+            db.reload()
+            self.assertEqual([str(warning) for warning in checks.checkDuplicates(db)],
+                             ['Entries "First" and "Second" might be duplicates '
+                              '(title similarity 100%).'])
+
+    def testLargeBucket(self):
+        with tmpDatabase() as db:
+            with io.open(db.bibfilePath, 'at', encoding='UTF-8') as bibfile:
+                for i in range(checks.MAX_BUCKET_SIZE + 1):
+                    bibfile.write('@misc{{Key{}, author = {{Doe, J.}}, year = {{2000}}, '
+                                  'title = {{Title {}}}}}\n'.format(i, 'same' if i < 2 else i))
+            db.reload()
+            warnings = [str(warning) for warning in checks.checkDuplicates(db)]
+            self.assertEqual(warnings, ['Entries "Key0" and "Key1" might be duplicates '
+                                        '(title similarity 100%).'])
+
+
+localChecks = """
+from bibtexvcs.checks import CheckFailed, CheckWarning, databaseCheck, entryCheck
+
+@databaseCheck('entry count')
+def checkEntryCount(database):
+    yield CheckWarning('{} entries'.format(len(database.bibfile)))
+
+@entryCheck('entry owners')
+def checkTitle(database, entry):
+    if 'title' not in entry:
+        yield CheckFailed('Entry "{}" has no title.'.format(entry.citekey))
+"""
+
+
+class TestCheckEngine(unittest.TestCase):
+
+    def testEntryChecks(self):
+        with tmpDatabase() as db:
+            with io.open(db.bibfilePath, 'at', encoding='UTF-8') as bibfile:
+                bibfile.write('\n@misc{NoOwner, title={Title}, month="May"}\n')
+            db.reload()
+            errors, warnings = checks.performDatabaseCheck(db)
+            errors = [str(error) for error in errors]
+            self.assertIn('Entry "NoOwner" has no owner.', errors)
+            self.assertIn("Month field in entry 'NoOwner' contains the string 'May' instead of a "
+                          "month macro.", errors)
+            # results are ordered by check function name, then by entry
+            self.assertLess(errors.index("Month field in entry 'NoOwner' contains the string "
+                                         "'May' instead of a month macro."),
+                            errors.index('Entry "NoOwner" has no owner.'))
+            errors, _ = checks.performDatabaseCheck(db, exclude=['entry owners'])
+            self.assertNotIn('Entry "NoOwner" has no owner.', [str(error) for error in errors])
+
+    def testLocalChecks(self):
+        with tmpDatabase() as db:
+            with io.open(db.checksPath, 'wt', encoding='UTF-8') as checksFile:
+                checksFile.write(localChecks)
+            with io.open(db.bibfilePath, 'at', encoding='UTF-8') as bibfile:
+                bibfile.write('\n@misc{NoTitle, owner={me}}\n')
+            db.reload()
+            errors, warnings = checks.performDatabaseCheck(db)
+            errors = [str(error) for error in errors]
+            self.assertIn('Entry "NoTitle" has no title.', errors)
+            self.assertNotIn('Entry "NoTitle" has no owner.', errors)
+            self.assertIn('3 entries', [str(warning) for warning in warnings])
+
+    def testParallel(self):
+        with tmpDatabase() as db:
+            with io.open(db.checksPath, 'wt', encoding='UTF-8') as checksFile:
+                checksFile.write(localChecks)
+            with io.open(db.bibfilePath, 'at', encoding='UTF-8') as bibfile:
+                for i in range(30):
+                    bibfile.write('\n@misc{{Key{}, owner={{me}}, month={{{}}}}}\n'.format(i, i))
+            db.reload()
+            serial = checks.performDatabaseCheck(db)
+            # the workers check the loaded database, not the file on disk
+            with io.open(db.bibfilePath, 'wt', encoding='UTF-8') as bibfile:
+                bibfile.write('@misc{Other, title={Other}}\n')
+            threshold = checks.PARALLEL_CHECK_THRESHOLD
+            checks.PARALLEL_CHECK_THRESHOLD = 10
+            try:
+                parallel = checks.performDatabaseCheck(db, parallel=4)
+            finally:
+                checks.PARALLEL_CHECK_THRESHOLD = threshold
+            for serialResults, parallelResults in zip(serial, parallel):
+                self.assertEqual([str(result) for result in serialResults],
+                                 [str(result) for result in parallelResults])
+
+
+countingChecks = """
+import io, os, time
+from bibtexvcs.checks import CheckFailed, entryCheck
+
+@entryCheck('counting', inputs=('macros',))
+def checkCounting(database, entry):
+    with io.open(os.path.join(database.directory, 'calls.txt'), 'at') as calls:
+        calls.write(entry.citekey + ' ')
+    yield CheckFailed('Checked "{}".'.format(entry.citekey))
+"""
+
+
+class TestCheckCache(unittest.TestCase):
+
+    def calls(self, db):
+        path = os.path.join(db.directory, 'calls.txt')
+        if not os.path.exists(path):
+            return []
+        with io.open(path, 'rt') as calls:
+            result = calls.read().split()
+        os.remove(path)
+        return result
+
+    def testIncrementalCheck(self):
+        with tmpDatabase() as db:
+            cacheDir = os.path.join(db.directory, 'cache')
+            with io.open(db.checksPath, 'wt', encoding='UTF-8') as checksFile:
+                checksFile.write(countingChecks)
+            first = checks.performDatabaseCheck(db, cacheDir=cacheDir)
+            self.assertEqual(sorted(self.calls(db)), ['Authors2011', 'SomeKey'])
+            second = checks.performDatabaseCheck(db, cacheDir=cacheDir)
+            self.assertEqual(self.calls(db), [])
+            for firstResults, secondResults in zip(first, second):
+                self.assertEqual([str(result) for result in firstResults],
+                                 [str(result) for result in secondResults])
+            # only the new entry is checked
+            with io.open(db.bibfilePath, 'at', encoding='UTF-8') as bibfile:
+                bibfile.write('\n@misc{NewKey, owner={me}}\n')
+            db.reload()
+            errors, _ = checks.performDatabaseCheck(db, cacheDir=cacheDir)
+            self.assertEqual(self.calls(db), ['NewKey'])
+            self.assertIn('Checked "NewKey".', [str(error) for error in errors])
+            # changing a declared input invalidates all results
+            with io.open(db.journalsPath, 'at', encoding='UTF-8') as journalsFile:
+                journalsFile.write('\n[NEW_J]\nfull = New Journal\nabbr = New J.\n')
+            db.reload()
+            checks.performDatabaseCheck(db, cacheDir=cacheDir)
+            self.assertEqual(len(self.calls(db)), 3)
+
+    def testModuleChanges(self):
+        with tmpDatabase() as db:
+            cacheDir = os.path.join(db.directory, 'cache')
+            source = countingChecks.replace("'Checked ", "PREFIX + ' ") + 'PREFIX = "Checked"\n'
+            with io.open(db.checksPath, 'wt', encoding='UTF-8') as checksFile:
+                checksFile.write(source)
+            errors, _ = checks.performDatabaseCheck(db, cacheDir=cacheDir)
+            self.assertIn('Checked "SomeKey".', [str(error) for error in errors])
+            self.assertEqual(len(self.calls(db)), 2)
+            # changing module-level data used by a check invalidates its results
+            with io.open(db.checksPath, 'wt', encoding='UTF-8') as checksFile:
+                checksFile.write(source.replace('"Checked"', '"Visited"'))
+            errors, _ = checks.performDatabaseCheck(db, cacheDir=cacheDir)
+            self.assertIn('Visited "SomeKey".', [str(error) for error in errors])
+            self.assertEqual(len(self.calls(db)), 2)
+
+
+class TestCheckProfile(unittest.TestCase):
+
+    def testProfile(self):
+        with tmpDatabase() as db:
+            profileDir = os.path.join(db.directory, 'profile')
+            self.assertIsNone(checks.performDatabaseCheck(db).profiles)
+            errors, warnings = result = checks.performDatabaseCheck(
+                db, cacheDir=os.path.join(db.directory, 'cache'), profile=True,
+                profileDir=profileDir)
+            profiles = {profile.name: profile for profile in result.profiles}
+            self.assertEqual(set(profiles), set(checks.loadChecks(db)))
+            self.assertEqual(profiles['entry owners'].entries, 2)
+            self.assertEqual(profiles['entry owners'].results, 2)
+            self.assertIsNone(profiles['file links'].entries)
+            self.assertEqual(sum(profile.results for profile in profiles.values()),
+                             len(errors) + len(warnings))
+            self.assertTrue(os.path.exists(os.path.join(profileDir, 'entry owners.pstats')))
+            # a warm run does not replay cached results, but runs and profiles all checks again
+            checks.performDatabaseCheck(db, cacheDir=os.path.join(db.directory, 'cache'))
+            warmDir = os.path.join(db.directory, 'warmProfile')
+            result = checks.performDatabaseCheck(
+                db, cacheDir=os.path.join(db.directory, 'cache'), profile=True,
+                profileDir=warmDir, timeout=60)
+            profiles = {profile.name: profile for profile in result.profiles}
+            self.assertEqual(profiles['entry owners'].entries, 2)
+            self.assertEqual(profiles['entry owners'].results, 2)
+            self.assertTrue(os.path.exists(os.path.join(warmDir, 'entry owners.pstats')))
+
+
+slowChecks = """
+import time
+from bibtexvcs.checks import CheckFailed, databaseCheck, entryCheck
+
+@databaseCheck('hanging')
+def checkHanging(database):
+    yield CheckFailed('Started hanging.')
+    time.sleep(5)
+    yield CheckFailed('Stopped hanging.')
+
+@entryCheck('slow entries')
+def checkSlowEntries(database, entry):
+    time.sleep(0.2)
+    yield CheckFailed('Slowly checked "{}".'.format(entry.citekey))
+"""
+
+hangingChecks = """
+import io, os, time
+from bibtexvcs.checks import CheckFailed, databaseCheck, entryCheck, isAbandoned
+
+@entryCheck('hanging entry')
+def checkHangingEntry(database, entry):
+    if entry.citekey == 'Authors2011':
+        time.sleep(5)
+    yield CheckFailed('Checked "{}".'.format(entry.citekey))
+
+@databaseCheck('polling')
+def checkPolling(database):
+    while not isAbandoned():
+        time.sleep(0.01)
+    io.open(os.path.join(database.directory, 'abandoned.txt'), 'wb').close()
+    yield CheckFailed('Never reported.')
+"""
+
+
+class TestCheckLimits(unittest.TestCase):
+
+    def testTimeout(self):
+        with tmpDatabase() as db:
+            with io.open(db.checksPath, 'wt', encoding='UTF-8') as checksFile:
+                checksFile.write(slowChecks)
+            start = time.time()
+            errors, warnings = checks.performDatabaseCheck(db, timeout=0.1)
+            self.assertLess(time.time() - start, 2)
+            errors = [str(error) for error in errors]
+            self.assertIn('Started hanging.', errors)
+            self.assertNotIn('Stopped hanging.', errors)
+            # the slow entry check is abandoned during its call on the first entry
+            self.assertEqual([error for error in errors if error.startswith('Slowly')], [])
+            abandoned = [str(warning) for warning in warnings
+                         if isinstance(warning, checks.CheckAbandoned)]
+            self.assertEqual(len(abandoned), 2)
+            self.assertIn('The check "hanging" exceeded its time limit of 0.1 seconds and was '
+                          'abandoned.', abandoned)
+
+    def testHangingChecks(self):
+        with tmpDatabase() as db:
+            with io.open(db.checksPath, 'wt', encoding='UTF-8') as checksFile:
+                checksFile.write(hangingChecks)
+            start = time.time()
+            errors, warnings = checks.performDatabaseCheck(db, timeout=0.3)
+            self.assertLess(time.time() - start, 2)
+            errors = [str(error) for error in errors]
+            self.assertNotIn('Checked "Authors2011".', errors)
+            self.assertNotIn('Never reported.', errors)
+            # the other entry checks are run on all entries
+            self.assertIn('Entry "Authors2011" has no owner.', errors)
+            self.assertIn('Entry "SomeKey" has no owner.', errors)
+            self.assertIn('The check "hanging entry" exceeded its time limit of 0.3 seconds and '
+                          'was abandoned.', [str(warning) for warning in warnings])
+            # the abandoned database check stops when it polls isAbandoned()
+            marker = os.path.join(db.directory, 'abandoned.txt')
+            for _ in range(100):
+                if os.path.exists(marker):
+                    break
+                time.sleep(0.01)
+            self.assertTrue(os.path.exists(marker))
+
+    def testBudget(self):
+        with tmpDatabase() as db:
+            with io.open(db.checksPath, 'wt', encoding='UTF-8') as checksFile:
+                checksFile.write(slowChecks)
+            start = time.time()
+            errors, warnings = checks.performDatabaseCheck(db, budget=0.3)
+            self.assertLess(time.time() - start, 2)
+            self.assertIn('The check "hanging" was abandoned because the time budget of 0.3 '
+                          'seconds was used up.', [str(warning) for warning in warnings])
+            # complete checks are still reported
+            self.assertIn('Entry "SomeKey" has no owner.', [str(error) for error in errors])
+
+    def testMaxErrors(self):
+        with tmpDatabase() as db:
+            errors, warnings = checks.performDatabaseCheck(db, maxErrors=2)
+            self.assertEqual(len(errors), 2)
+            self.assertIn('Stopped checking after 2 failed check(s).',
+                          [str(warning) for warning in warnings])
+            self.assertGreater(len(checks.performDatabaseCheck(db)[0]), 2)
+
+    def testMaxErrorsReached(self):
+        with tmpDatabase() as db:
+            with io.open(db.checksPath, 'wt', encoding='UTF-8') as checksFile:
+                checksFile.write(countingChecks)
+            exclude = [name for name in checks.loadChecks(db) if name != 'counting']
+            errors, warnings = checks.performDatabaseCheck(
+                db, exclude=exclude, cacheDir=os.path.join(db.directory, 'cache'), maxErrors=2)
+            self.assertEqual(len(errors), 2)
+            self.assertEqual(warnings, [])
+
+    def testConfiguredLimits(self):
+        with tmpDatabase() as db:
+            with io.open(db.configPath, 'at', encoding='UTF-8') as config:
+                config.write('\ncheckMaxErrors = 1\ncheckTimeout = 2.5\n')
+            db.reload()
+            self.assertEqual((db.checkMaxErrors, db.checkTimeout, db.checkBudget),
+                             (1, 2.5, None))
+            self.assertEqual(len(checks.performDatabaseCheck(db)[0]), 1)
+
+    def testInvalidLimits(self):
+        with tmpDatabase() as db:
+            self.assertRaises(ValueError, checks.performDatabaseCheck, db, maxErrors=0)
+            self.assertRaises(ValueError, checks.performDatabaseCheck, db, timeout=-1)
+            with io.open(db.configPath, 'rt', encoding='UTF-8') as config:
+                original = config.read()
+            for option in 'checkMaxErrors = 0', 'checkTimeout = -1', 'checkBudget = 0':
+                with io.open(db.configPath, 'wt', encoding='UTF-8') as config:
+                    config.write(original + '\n' + option + '\n')
+                self.assertRaises(DatabaseFormatError, db.reload)
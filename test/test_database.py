@@ -7,11 +7,11 @@
 # published by the Free Software Foundation
 
 from __future__ import division, print_function, unicode_literals
-import unittest
+import hashlib, io, os, unittest
 from os.path import join, split
 
 from bibtexvcs import database
-from . import datadir
+from . import datadir, tmpDatabase
 
 class TestDatabaseConfig(unittest.TestCase):
 
@@ -26,3 +26,113 @@ class TestDatabaseConfig(unittest.TestCase):
         self.assertEqual(self.db.bibfileName, 'sample.bib')
 
 
+
+
+class TestDatabaseReload(unittest.TestCase):
+
+    def testIncrementalReload(self):
+        with tmpDatabase() as db:
+            self.assertEqual(sorted(db.bibfileChanges.added), ['Authors2011', 'SomeKey'])
+            entry = db.bibfile['Authors2011']
+            with io.open(db.bibfilePath, 'at', encoding='UTF-8') as bibfile:
+                bibfile.write('\n@misc{NewKey, title={New}}\n')
+            changes = db.reload()
+            self.assertEqual(changes, (['NewKey'], [], []))
+            self.assertIs(db.bibfile['Authors2011'], entry)
+            self.assertEqual(db.refreshed, frozenset(['bibfile']))
+
+    def testUnchangedFiles(self):
+        with tmpDatabase() as db:
+            self.assertEqual(db.refreshed, frozenset(['config']))
+            journals, bib = db.journals, db.bibfile
+            self.assertEqual(db.reload(), ([], [], []))
+            self.assertEqual(db.refreshed, frozenset())
+            self.assertIs(db.journals, journals)
+            self.assertIs(db.bibfile, bib)
+            # same size and contents, but a new modification time
+            os.utime(db.journalsPath, None)
+            db.reload()
+            self.assertEqual(db.refreshed, frozenset())
+            with io.open(db.journalsPath, 'at', encoding='UTF-8') as journalsFile:
+                journalsFile.write('\n[NEW_J]\nfull = New Journal\nabbr = New J.\n')
+            db.reload()
+            self.assertEqual(db.refreshed, frozenset(['journals']))
+            self.assertEqual(db.macros['NEW_J'], 'New Journal')
+
+    def testSameSizeModification(self):
+        with tmpDatabase() as db:
+            db.bibfile
+            with io.open(db.bibfilePath, 'rt', encoding='UTF-8') as bibfile:
+                text = bibfile.read()
+            os.utime(db.bibfilePath, None)
+            db.reload()  # the file was modified just before, so its contents must be checked
+            stat = os.stat(db.bibfilePath)
+            with io.open(db.bibfilePath, 'wt', encoding='UTF-8') as bibfile:
+                bibfile.write(text.replace('Authors2011', 'Authors2012'))
+            os.utime(db.bibfilePath, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+            self.assertEqual(db.reload(), (['Authors2012'], ['Authors2011'], []))
+
+    def testFailedReload(self):
+        with tmpDatabase() as db:
+            db.bibfile
+            with io.open(db.bibfilePath, 'at', encoding='UTF-8') as bibfile:
+                bibfile.write('\n@misc{broken')
+            self.assertRaises(Exception, db.reload)
+            self.assertRaises(Exception, db.reload)
+
+
+class TestLazyLoading(unittest.TestCase):
+
+    def testLazyLoading(self):
+        with tmpDatabase() as db:
+            self.assertIsNone(db._bibfile)
+            self.assertIsNone(db._journals)
+            self.assertEqual(db.reload(), ([], [], []))
+            self.assertIsNone(db._bibfile)
+            self.assertEqual(db.macros['macroname'], 'definition definition')
+            self.assertIsNotNone(db._bibfile)
+            self.assertEqual(sorted(db.bibfileChanges.added), ['Authors2011', 'SomeKey'])
+            db.journals = database.JournalsFile(journals=[])
+            self.assertNotIn('COMP_GEOM', db.macros)
+
+
+class TestJournalBibfiles(unittest.TestCase):
+
+    def testContentBasedRegeneration(self):
+        with tmpDatabase() as db:
+            abbr = join(db.directory, db.abbrJournalsName)
+            with io.open(db.journalsPath, 'rb') as journalsFile:
+                digest = hashlib.sha1(journalsFile.read()).hexdigest()
+            self.assertEqual(database.journalsDigest(abbr), digest)
+            # a newer journals file with the same contents does not cause a rewrite
+            os.utime(abbr, (0, 0))
+            db.makeJournalBibfiles()
+            self.assertEqual(os.path.getmtime(abbr), 0)
+            with io.open(db.journalsPath, 'at', encoding='UTF-8') as journalsFile:
+                journalsFile.write('\n[NEW_J]\nfull = New Journal\nabbr = New J.\n')
+            db.reload()
+            self.assertNotEqual(database.journalsDigest(abbr), digest)
+            with io.open(abbr, 'rt', encoding='UTF-8') as abbrFile:
+                self.assertIn('@STRING{NEW_J = {New J.}}\n', abbrFile.read())
+            # only files with different contents are written
+            self.assertEqual(db.journals.writeBibfiles(db.bibfilePath[:-4],
+                                                       database.journalsDigest(abbr)), [])
+
+
+class TestMacroResolution(unittest.TestCase):
+
+    def testStrval(self):
+        with tmpDatabase() as db:
+            with io.open(db.bibfilePath, 'at', encoding='UTF-8') as bibfile:
+                bibfile.write('\n@string{full = "Full " # base # { and } # COMP_GEOM}\n'
+                              '@string{base={Base}}\n'
+                              '@misc{NewKey, journal=full, month=jun # {/} # jul, note=undef}\n')
+            db.reload()
+            self.assertEqual(db.strval(db.bibfile['Authors2011']['journal']),
+                             'MacroReference("IEEE_J_IT")')
+            entry = db.bibfile['NewKey']
+            self.assertEqual(db.strval(entry['journal']),
+                             'Full Base and Computational Geometry -- Theory and Applications')
+            self.assertEqual(db.strval(entry['month']), 'June/July')
+            self.assertEqual(db.strval(entry['note']), 'MacroReference("undef")')
+            self.assertEqual(db.macros['base'], 'Base')
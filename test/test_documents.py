@@ -0,0 +1,143 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+# Copyright 2014-2015 Michael Helmling
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 3 as
+# published by the Free Software Foundation
+
+from __future__ import division, print_function, unicode_literals
+import io, os, shutil, tempfile
+import unittest
+from os.path import join
+
+from bibtexvcs import checks, documents
+from bibtexvcs.documents import DocumentsManifest
+from . import tmpDatabase
+
+
+class TestDocumentsManifest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.cacheDir = join(self.tmpdir, 'cache')
+        self.root = join(self.tmpdir, 'Documents')
+        os.makedirs(join(self.root, 'sub', 'subsub'))
+        for path in 'a.pdf', '.DS_Store', join('sub', 'b.pdf'), join('sub', 'subsub', 'c.pdf'):
+            self.touch(path)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def touch(self, path):
+        io.open(join(self.root, path), 'wb').close()
+
+    def age(self):
+        """Set the modification times of all directories far into the past, so that their
+        listings are not racy.
+        """
+        for dirpath, _, _ in os.walk(self.root):
+            os.utime(dirpath, (1, 1))
+
+    def testRefresh(self):
+        manifest = DocumentsManifest(self.root)
+        self.assertEqual(manifest.refresh(),
+                         ['a.pdf', join('sub', 'b.pdf'), join('sub', 'subsub', 'c.pdf')])
+        self.touch(join('sub', 'subsub', 'd.pdf'))
+        os.remove(join(self.root, 'a.pdf'))
+        self.assertEqual(sorted(manifest.refresh()),
+                         [join('sub', 'b.pdf'), join('sub', 'subsub', 'c.pdf'),
+                          join('sub', 'subsub', 'd.pdf')])
+        shutil.rmtree(join(self.root, 'sub', 'subsub'))
+        self.assertEqual(manifest.refresh(), [join('sub', 'b.pdf')])
+        self.assertEqual(sorted(manifest.directories), ['', 'sub'])
+
+    def testUnchangedDirectoriesAreNotListed(self):
+        self.age()
+        manifest = DocumentsManifest(self.root)
+        manifest.refresh()
+        # a file added without changing the directory's mtime is not seen
+        self.touch(join('sub', 'e.pdf'))
+        os.utime(join(self.root, 'sub'), (1, 1))
+        self.assertNotIn(join('sub', 'e.pdf'), manifest.refresh())
+
+    def testPersistentManifest(self):
+        self.age()
+        manifest = DocumentsManifest.load(self.root, self.cacheDir)
+        files = manifest.refresh()
+        self.assertTrue(os.path.exists(manifest.cacheFile))
+        loaded = DocumentsManifest.load(self.root, self.cacheDir)
+        self.assertEqual(loaded.directories, manifest.directories)
+        self.assertEqual(loaded.files(), files)
+
+
+class TestDatabaseDocuments(unittest.TestCase):
+
+    def testSnapshot(self):
+        with tmpDatabase() as db:
+            documents = db.existingDocuments()
+            self.assertEqual(sorted(documents), ['emptyDoc.pdf', 'unversioned.pdf'])
+            io.open(join(db.documentsPath, 'new.pdf'), 'wb').close()
+            self.assertIs(db.existingDocuments(), documents)
+            db.reload()
+            self.assertIn('new.pdf', db.existingDocuments())
+
+
+class TestFingerprintIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.root = join(self.tmpdir, 'Documents')
+        os.makedirs(join(self.root, 'sub'))
+        large = b'x' * (documents.PARTIAL_HASH_SIZE + 10)
+        contents = {'a.pdf': b'same', join('sub', 'b.pdf'): b'same', 'c.pdf': b'unique',
+                    'd.pdf': b'', 'e.pdf': b'', 'large1.pdf': large + b'1',
+                    'large2.pdf': large + b'2', 'large3.pdf': large + b'1'}
+        for path, data in contents.items():
+            with io.open(join(self.root, path), 'wb') as stream:
+                stream.write(data)
+        self.files = sorted(contents)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def testDuplicates(self):
+        index = documents.FingerprintIndex(self.root)
+        expected = [['a.pdf', join('sub', 'b.pdf')], ['large1.pdf', 'large3.pdf']]
+        self.assertEqual(index.duplicates(self.files), expected)
+        self.assertIsNone(index.fingerprints['c.pdf'][2])  # unique size: never hashed
+        self.assertIsNone(index.fingerprints['a.pdf'][3])  # small file: partial hash suffices
+        self.assertIsNotNone(index.fingerprints['large2.pdf'][3])
+        cached = documents.FingerprintIndex.load(self.root, join(self.tmpdir, 'cache'))
+        cached.duplicates(self.files)
+        loaded = documents.FingerprintIndex.load(self.root, join(self.tmpdir, 'cache'))
+        self.assertEqual(loaded.fingerprints, index.fingerprints)
+        self.assertEqual(loaded.duplicates(self.files), expected)
+
+    def testVanishedDocument(self):
+        # simulate that a document is deleted after duplicates() has read its size
+        hashFile = documents._hashFile
+
+        def deleteAndHash(path, size=None):
+            if os.path.basename(path) == 'large3.pdf' and os.path.exists(path):
+                os.remove(path)
+            return hashFile(path, size)
+        documents._hashFile = deleteAndHash
+        try:
+            index = documents.FingerprintIndex(self.root)
+            self.assertEqual(index.duplicates(self.files), [['a.pdf', join('sub', 'b.pdf')]])
+        finally:
+            documents._hashFile = hashFile
+        self.assertNotIn('large3.pdf', index.fingerprints)
+
+    def testDuplicatesCheck(self):
+        with tmpDatabase() as db:
+            self.assertEqual(list(checks.checkDuplicateDocuments(db)), [])
+            for name in 'copy1.pdf', 'copy2.pdf':
+                with io.open(join(db.documentsPath, name), 'wb') as stream:
+                    stream.write(b'%PDF')
+            db.reload()
+            self.assertEqual(db.duplicateDocuments(), [['copy1.pdf', 'copy2.pdf']])
+            warnings = list(checks.checkDuplicateDocuments(db))
+            self.assertEqual(len(warnings), 1)
+            self.assertIn('copy1.pdf\ncopy2.pdf', str(warnings[0]))
@@ -0,0 +1,110 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+# Copyright 2014-2015 Michael Helmling
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 3 as
+# published by the Free Software Foundation
+
+from __future__ import division, print_function, unicode_literals
+import io, shutil, tempfile
+import unittest
+from collections import OrderedDict
+from os.path import join
+
+from bibtexvcs import bibfile, parser
+
+bibtext = """@article{Helmling2014,
+  author = {Helmling, Michael and Ruzika, Stefan},
+  journal = IEEE_J_IT,
+  year = {2014},
+  doi = {10.1109/TIT.2014.1},
+  file = {:Helmling2014.pdf:PDF}
+}
+@inproceedings{Helmling2011,
+  author = {Michael Helmling and van Emde Boas, P.},
+  booktitle = PROC_ISIT,
+  year = {2011}
+}
+@article{Other2015,
+  author = {Other, A.},
+  journal = IEEE_J_IT,
+  year = {2015}
+}
+@misc{NoYear,
+  author = {Helmling, M.},
+  year = {to appear}
+}
+"""
+
+
+class TestFind(unittest.TestCase):
+
+    def keys(self, entries):
+        return [entry.citekey for entry in entries]
+
+    def testQueries(self):
+        for backend in parser.BACKENDS:
+            bib = bibfile.BibFile(bibstring=bibtext, backend=backend)
+            self.assertEqual(self.keys(bib.find(author='helmling')),
+                             ['Helmling2014', 'Helmling2011', 'NoYear'])
+            self.assertEqual(self.keys(bib.find(author='Van Emde Boas')), ['Helmling2011'])
+            self.assertEqual(self.keys(bib.find(author='helmling', yearRange=(2010, 2015),
+                                                entrytype='article')), ['Helmling2014'])
+            self.assertEqual(self.keys(bib.find(yearRange=(2014, 2015))),
+                             ['Helmling2014', 'Other2015'])
+            self.assertEqual(self.keys(bib.find(year=2011)), ['Helmling2011'])
+            self.assertEqual(self.keys(bib.find(journal='IEEE_J_IT')),
+                             ['Helmling2014', 'Other2015'])
+            self.assertEqual(self.keys(bib.find(journal='PROC_ISIT')), ['Helmling2011'])
+            self.assertEqual(self.keys(bib.find(doi='10.1109/tit.2014.1')), ['Helmling2014'])
+            self.assertEqual(self.keys(bib.find(filename='Helmling2014.pdf')), ['Helmling2014'])
+            self.assertEqual(self.keys(bib.find()), list(bib))
+            self.assertEqual(bib.find(author='nobody'), [])
+
+    def testAssignment(self):
+        bib = bibfile.BibFile(bibstring=bibtext)
+        bib.find()
+        entry = bib['Other2015']
+        del bib['Other2015']
+        self.assertEqual(self.keys(bib.find(journal='IEEE_J_IT')), ['Helmling2014'])
+        entry['year'] = '2009'
+        entry.citekey = 'Other2009'
+        bib['Other2009'] = entry
+        self.assertEqual(self.keys(bib.find(yearRange=(2000, 2012))),
+                         ['Helmling2011', 'Other2009'])
+        replacement = bibfile.Entry('article', 'Helmling2014', OrderedDict(year='2013'), '')
+        bib['Helmling2014'] = replacement
+        self.assertEqual(self.keys(bib.find(author='helmling')), ['Helmling2011', 'NoYear'])
+        self.assertEqual(bib.find(year=2013), [replacement])
+
+    def testMutatingMethods(self):
+        bib = bibfile.BibFile(bibstring=bibtext)
+        bib.find()
+        entry = bib.pop('Helmling2014')
+        self.assertEqual(self.keys(bib.find(journal='IEEE_J_IT')), ['Other2015'])
+        self.assertIsNone(bib.pop('Helmling2014', None))
+        citekey, _ = bib.popitem()
+        self.assertNotIn(citekey, self.keys(bib.find()))
+        self.assertIs(bib.setdefault('Helmling2014', entry), entry)
+        self.assertEqual(self.keys(bib.find(doi='10.1109/tit.2014.1')), ['Helmling2014'])
+        bib.move_to_end('Helmling2014', last=False)
+        self.assertEqual(self.keys(bib.find()), list(bib))
+
+    def testUpdate(self):
+        tmpdir = tempfile.mkdtemp()
+        try:
+            path = join(tmpdir, 'test.bib')
+            with io.open(path, 'wt', encoding='UTF-8') as bibFile:
+                bibFile.write(bibtext)
+            bib = bibfile.BibFile(path, backend='lazy')
+            self.assertEqual(len(bib.find(author='helmling')), 3)
+            with io.open(path, 'wt', encoding='UTF-8') as bibFile:
+                bibFile.write('@misc{First, author={Helmling, M.}}\n'
+                              + bibtext.replace('Helmling, Michael and ', ''))
+            bib.reload()
+            self.assertEqual(self.keys(bib.find(author='helmling')),
+                             ['First', 'Helmling2011', 'NoYear'])
+            self.assertEqual(self.keys(bib.find(author='ruzika')), ['Helmling2014'])
+        finally:
+            shutil.rmtree(tmpdir)
@@ -7,9 +7,13 @@
 # published by the Free Software Foundation
 
 from __future__ import division, print_function, unicode_literals
+import io, os, pickle, shutil, tempfile
 import unittest
+from collections import OrderedDict
+from os.path import join, dirname
 
 from bibtexvcs import bibfile, parser
+from . import datadir
 
 bibtext = """This is an implicit comment.
 @PREAMBLE{"This is the preamble."}
@@ -87,3 +91,363 @@ class TestNamesListParsing(unittest.TestCase):
         self.assertEqual(ministry.last, "Ministry of Truth and Justice")
         me = parsed[1]
         self.assertEqual(me.last, "Helmling")
+
+
+def normalize(item):
+    """Convert parsed elements into plain, comparable data structures."""
+    if isinstance(item, (list, tuple)) or hasattr(item, 'asList'):
+        return [normalize(subitem) for subitem in item]
+    if isinstance(item, bibfile.Entry):
+        return ('Entry', item.entrytype, item.citekey, item.bibsrc,
+                [(key, normalize(value)) for key, value in item.items()])
+    if isinstance(item, bibfile.Name):
+        return ('Name', item.first, item.nobility, item.last, item.suffix)
+    if isinstance(item, bibfile.MacroReference):
+        return ('MacroReference', item.name)
+    if isinstance(item, bibfile.MacroDefinition):
+        return ('MacroDefinition', item.key, normalize(item.value))
+    if isinstance(item, bibfile.Preamble):
+        return ('Preamble', normalize(item.contents))
+    if isinstance(item, bibfile.Comment):
+        return (type(item).__name__, item.comment)
+    return item
+
+
+class TestBackendConformance(unittest.TestCase):
+    """Checks that the pyparsing and the fast backend produce identical results."""
+
+    snippets = [
+        '', '   ', bibtext, '@misc{k,}', '@ misc { k , title = { a } }',
+        '@commentary{k, a=1}', '@misc{k, a=1, a=2, b=3}',
+        '@preamble{"a" # {b}}', '@preamble{{a{b}c}}',
+        '@string{Foo = {a {B} c}}', '@string{foo = "x" # Bar}', '@string{foo = 12}',
+        '  \n@comment{ hi }',
+        'text @misc{k, title={ a {b}  c }, year=2011, month = jan # " / " # feb, x="", y={},'
+        ' z = {a{}b}}',
+        '@misc{k, title = "a {"} b"}',
+        '@misc{k, author={A and B}, editor = "Q", Title={x},}',
+        '@misc{k, author={de la fuente, X}}', '@misc{k, author={Forney, Jr., D.G. M.}}',
+        '@misc{k, author={D.G.  Forney and AND B}}', '@misc{k, author = {}}',
+        '@misc{k, author={{Ministry of Truth}}}', '@misc{k, author={{Min}, X and {A}{B} C}}',
+    ]
+
+    def assertConform(self, bibstring):
+        expected = normalize(parser.parseBibstring(bibstring, 'pyparsing'))
+        for backend in 'fast', 'lazy':
+            self.assertEqual(expected, normalize(parser.parseBibstring(bibstring, backend)))
+
+    def testSnippets(self):
+        for snippet in self.snippets:
+            self.assertConform(snippet)
+
+    def testFiles(self):
+        for path in (join(datadir(), 'sampleDB', 'sample.bib'),
+                     join(dirname(datadir()), '..', 'example-database', 'exampledb.bib')):
+            with io.open(path, encoding='UTF-8') as bibFile:
+                self.assertConform(bibFile.read())
+
+    def testBibFile(self):
+        path = join(datadir(), 'sampleDB', 'sample.bib')
+        slow = bibfile.BibFile(path, backend='pyparsing')
+        fast = bibfile.BibFile(path, backend='fast')
+        self.assertEqual(list(slow.keys()), list(fast.keys()))
+        self.assertEqual(normalize(list(slow.values())), normalize(list(fast.values())))
+        self.assertEqual(normalize(slow.comments), normalize(fast.comments))
+        self.assertEqual(list(slow.macroDefinitions), list(fast.macroDefinitions))
+
+    def testMalformed(self):
+        for snippet in (' hello ', '@misc{k}', '@misc{k, a = 1}  \n junk', '@comment{a{b}}'):
+            self.assertRaises(Exception, parser.parseBibstring, snippet, 'pyparsing')
+            for backend in 'fast', 'lazy':
+                self.assertRaises(bibfile.DatabaseFormatError, parser.parseBibstring, snippet,
+                                  backend)
+
+    def testLazyDecoding(self):
+        entry = bibfile.BibFile(bibstring=bibtext, backend='lazy')['ArticleKey']
+        self.assertIsInstance(entry, bibfile.LazyEntry)
+        raw = lambda key: entry._values[entry._layout[key]]
+        self.assertIsInstance(raw('title'), bibfile.FieldSpan)
+        self.assertEqual(entry['title'], 'A bibtex database under revision control')
+        self.assertEqual(raw('title'), entry['title'])
+        self.assertIsInstance(raw('author'), bibfile.FieldSpan)
+        self.assertIn('author', entry)
+        self.assertIsInstance(raw('author'), bibfile.FieldSpan)
+        self.assertEqual(entry.lastNames(), 'Helmling')
+        self.assertIsNone(entry.get('year'))
+
+    def testSharedMacroReferences(self):
+        for backend in parser.BACKENDS:
+            bib = bibfile.BibFile(bibstring='@string{a = b # {x}}\n'
+                                            '@misc{k, journal=b, month=jan}\n'
+                                            '@misc{l, journal=b, month=jun # {/} # jan}',
+                                  backend=backend)
+            b = bib['k']['journal']
+            self.assertIs(bib['l']['journal'], b)
+            self.assertIs(bib.macroDefinitions['a'].value[0], b)
+            self.assertIs(bib['l']['month'][2], bib['k']['month'])
+            self.assertIs(bib.macroReferences['jan'], bib['k']['month'])
+
+    def testSharedNames(self):
+        bib = bibfile.BibFile(bibstring='@misc{a, author={Doe, John and Roe, R.}}\n'
+                                        '@misc{b, editor={Doe, John}}', backend='fast')
+        doe = bib['a']['author'][0]
+        self.assertEqual(doe.last, 'Doe')
+        self.assertIs(bib['b']['editor'], doe)
+        self.assertRaises(AttributeError, setattr, doe, 'last', 'Roe')
+
+
+class TestParallelParsing(unittest.TestCase):
+
+    def setUp(self):
+        self.sizes = parser.PARALLEL_THRESHOLD, parser.CHUNK_SIZE
+        parser.PARALLEL_THRESHOLD, parser.CHUNK_SIZE = 0, 500
+        with io.open(join(datadir(), 'sampleDB', 'sample.bib'), encoding='UTF-8') as bibFile:
+            sample = bibFile.read()
+        self.bibstring = (bibtext + '\n@comment{first}\n'
+                          + '\n'.join(sample[sample.index('@'):]
+                                      .replace('{SomeKey', '{SomeKey' + str(i))
+                                      .replace('{Authors2011', '{Authors' + str(i))
+                                      for i in range(20)))
+
+    def tearDown(self):
+        parser.PARALLEL_THRESHOLD, parser.CHUNK_SIZE = self.sizes
+
+    def testParallelEqualsSerial(self):
+        for backend in parser.BACKENDS:
+            serial = parser.parseBibstring(self.bibstring, backend)
+            parallel = parser.parseBibstring(self.bibstring, backend, workers=2)
+            self.assertEqual(normalize(serial), normalize(parallel))
+            self.assertIsInstance(parallel[0], bibfile.ImplicitComment)
+            self.assertIsInstance(parallel[1], bibfile.Preamble)
+
+
+class TestIterparse(unittest.TestCase):
+
+    def testDefinitions(self):
+        texts = list(parser.iterdefinitions(io.StringIO(bibtext), blockSize=5))
+        self.assertEqual(texts[0], (1, 'This is an implicit comment.\n'))
+        self.assertEqual(texts[1], (2, '@PREAMBLE{"This is the preamble."}'))
+        self.assertEqual(texts[2][0], 4)
+        self.assertTrue(texts[2][1].startswith('@ArtiCLe{ArticleKey,'))
+        self.assertTrue(texts[2][1].endswith('revision control}\n}'))
+        self.assertEqual(len(texts), 3)
+
+    def testBlockSizes(self):
+        with io.open(join(datadir(), 'sampleDB', 'sample.bib'), encoding='UTF-8') as bibFile:
+            sample = bibFile.read()
+        for backend in parser.BACKENDS:
+            expected = normalize(parser.parseBibstring(sample, backend))
+            for blockSize in 1, 3, 64:
+                parsed = parser.iterparse(io.StringIO(sample), backend, blockSize=blockSize)
+                self.assertEqual(normalize(list(parsed)), expected)
+
+    def testErrorLine(self):
+        for backend in parser.BACKENDS:
+            with self.assertRaisesRegex(bibfile.DatabaseFormatError, 'line 9'):
+                parser.parseBibstring(bibtext + '\n@misc{key}', backend)
+        with self.assertRaisesRegex(bibfile.DatabaseFormatError, 'line 9, column 2'):
+            parser.parseBibstring(bibtext + '\n junk', 'fast')
+        with self.assertRaisesRegex(bibfile.DatabaseFormatError, 'unbalanced'):
+            parser.parseBibstring(bibtext + '@misc{key, title={}', 'fast')
+
+
+class TestIncrementalParsing(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = join(self.tmpdir, 'sample.bib')
+        with io.open(join(datadir(), 'sampleDB', 'sample.bib'), encoding='UTF-8') as bibFile:
+            self.sample = bibFile.read()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def write(self, text):
+        with io.open(self.path, 'wt', encoding='UTF-8') as bibFile:
+            bibFile.write(text)
+
+    def testReload(self):
+        for backend in parser.BACKENDS:
+            self.write(self.sample)
+            bib = bibfile.BibFile(self.path, backend=backend)
+            unchanged = bib['Authors2011']
+            self.write(self.sample.replace('without authors', 'with changed title')
+                       + '\n@misc{NewKey, title={New}}\n@comment{new comment}\n')
+            changes = bib.reload()
+            self.assertEqual(changes, bibfile.BibFileChanges(added=['NewKey'], removed=[],
+                                                             modified=['SomeKey']))
+            self.assertIs(bib['Authors2011'], unchanged)
+            self.assertEqual(bib['SomeKey']['title'], 'An article with changed title')
+            self.assertEqual(bib.comments[-1].comment, 'new comment')
+            expected = bibfile.BibFile(self.path, backend=backend)
+            self.assertEqual(normalize(list(bib.values())), normalize(list(expected.values())))
+
+            self.write(self.sample[:self.sample.index('@INCOLLECTION')])
+            self.assertEqual(bib.reload(), bibfile.BibFileChanges(added=[], modified=[],
+                                                                  removed=['SomeKey', 'NewKey']))
+
+    def testReloadModifiedEntry(self):
+        self.write(self.sample)
+        for backend in parser.BACKENDS:
+            bib = bibfile.BibFile(self.path, backend=backend)
+            edited = bib['SomeKey']
+            edited['title'] = 'Edited'
+            changes = bib.reload()
+            self.assertEqual(changes, bibfile.BibFileChanges(added=[], removed=[],
+                                                             modified=['SomeKey']))
+            self.assertIsNot(bib['SomeKey'], edited)
+            self.assertEqual(bib['SomeKey']['title'], 'An article without authors')
+            self.assertFalse(bib['SomeKey'].modified)
+
+    def testMalformedReload(self):
+        self.write(self.sample)
+        bib = bibfile.BibFile(self.path)
+        self.write(self.sample + '@misc{key')
+        with self.assertRaises(bibfile.DatabaseFormatError):
+            bib.reload()
+        self.assertEqual(list(bib), ['Authors2011', 'SomeKey'])
+
+    def testMappingUpdate(self):
+        self.write(self.sample)
+        bib = bibfile.BibFile(self.path)
+        entry = bibfile.Entry('misc', 'NewKey', {'title': 'New'}, '')
+        bib.update({'NewKey': entry})
+        self.assertIs(bib['NewKey'], entry)
+        self.assertTrue(entry.modified)
+
+
+class TestSharedSource(unittest.TestCase):
+
+    def testBibsrcSlices(self):
+        path = join(datadir(), 'sampleDB', 'sample.bib')
+        for backend in parser.BACKENDS:
+            bib = bibfile.BibFile(path, backend=backend)
+            parsed = parser.parseBibstring(bib.source, backend)[1::2]
+            for entry, parsed in zip(bib.values(), parsed):
+                self.assertIs(entry._buffer, bib.source)
+                self.assertEqual(entry.bibsrc, parsed.bibsrc)
+            copy = pickle.loads(pickle.dumps(bib))
+            self.assertIs(copy['SomeKey']._buffer, copy.source)
+            self.assertEqual(copy['SomeKey']['file'], ':emptyDoc.pdf:')
+
+
+class TestEntry(unittest.TestCase):
+
+    def testMapping(self):
+        entry = bibfile.Entry('article', 'key', OrderedDict([('title', 'T'), ('year', '2015')]),
+                              '@article{key, title={T}, year={2015}}')
+        other = bibfile.Entry('misc', 'other', OrderedDict([('title', 'U'), ('year', '2014')]),
+                              '')
+        self.assertIs(entry._layout, other._layout)
+        entry['author'] = 'A'
+        del entry['title']
+        entry['year'] = '2016'
+        self.assertEqual(list(entry.items()), [('year', '2016'), ('author', 'A')])
+        self.assertEqual(list(other.items()), [('title', 'U'), ('year', '2014')])
+        self.assertNotIn('title', entry)
+        self.assertEqual(entry.get('title', 'none'), 'none')
+        self.assertRaises(AttributeError, setattr, entry, 'custom', 1)
+        copy = pickle.loads(pickle.dumps(entry))
+        self.assertEqual(copy, entry)
+        self.assertEqual((copy.citekey, copy.bibsrc), (entry.citekey, entry.bibsrc))
+
+
+class TestSave(unittest.TestCase):
+
+    bibtext = ('% leading comment\r\n'
+               '@string{macro = {Some Journal}}\r\n\r\n'
+               '@article{First,\r\n    title = {{T}he first},  journal = macro,\r\n'
+               '    author = {van Beethoven, Jr, Ludwig and John Doe}}\r\n\r\n'
+               '@misc{Second,title="Second" # macro}\r\n'
+               '@misc{Third, title={Third}}')
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = join(self.tmpdir, 'test.bib')
+        with io.open(self.path, 'wb') as bibFile:
+            bibFile.write(self.bibtext.encode('UTF-8'))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def read(self, path=None):
+        with io.open(path or self.path, 'rb') as bibFile:
+            return bibFile.read().decode('UTF-8')
+
+    def testRoundTrip(self):
+        for backend in parser.BACKENDS:
+            bib = bibfile.BibFile(self.path, backend=backend)
+            bib['First']['title']  # decoding fields does not modify entries
+            copy = join(self.tmpdir, 'copy.bib')
+            bib.save(copy)
+            self.assertEqual(self.read(copy), self.bibtext)
+
+    def testMixedNewlines(self):
+        with io.open(self.path, 'wb') as bibFile:
+            bibFile.write(self.bibtext.replace('\r\n', '\n', 2).encode('UTF-8'))
+        bib = bibfile.BibFile(self.path)
+        self.assertIsNone(bib.newlines)
+        copy = join(self.tmpdir, 'copy.bib')
+        bib.save(copy)
+        self.assertEqual(self.read(copy), self.bibtext.replace('\r\n', '\n'))
+
+    def testModifiedEntries(self):
+        for backend in parser.BACKENDS:
+            bib = bibfile.BibFile(self.path, backend=backend)
+            bib['First']['year'] = '2015'
+            del bib['Second']
+            bib['New'] = bibfile.Entry('book', 'New', OrderedDict(title='New'), '')
+            bib.save()
+            self.assertEqual(self.read(), self.bibtext.replace(
+                '@article{First,\r\n    title = {{T}he first},  journal = macro,\r\n'
+                '    author = {van Beethoven, Jr, Ludwig and John Doe}}\r\n\r\n'
+                '@misc{Second,title="Second" # macro}\r\n',
+                '@article{First,\r\n  title = {{T}he first},\r\n  journal = macro,\r\n'
+                '  author = {van Beethoven, Jr, Ludwig and John Doe},\r\n  year = {2015}\r\n}'
+                '\r\n\r\n') + '\r\n\r\n@book{New,\r\n  title = {New}\r\n}\r\n')
+            self.assertEqual(list(bib), ['First', 'Third', 'New'])
+            self.assertEqual(bib['First']['year'], '2015')
+            self.assertEqual(bib['First']['author'][0],
+                             bibfile.Name('Beethoven', 'van', 'Ludwig', 'Jr'))
+            self.assertFalse(bib['First'].modified)
+            with io.open(self.path, 'wb') as bibFile:
+                bibFile.write(self.bibtext.encode('UTF-8'))
+
+    def testMalformedValue(self):
+        for backend in parser.BACKENDS:
+            bib = bibfile.BibFile(self.path, backend=backend)
+            bib['Third']['title'] = 'a { b'
+            with self.assertRaisesRegex(bibfile.DatabaseFormatError, 'Entry "Third"'):
+                bib.save()
+            self.assertEqual(self.read(), self.bibtext)
+            self.assertEqual(os.listdir(self.tmpdir), ['test.bib'])
+
+    def testNamesRoundTrip(self):
+        authors = ('{Ministry of Truth} and {Barnes and Noble} and {Lloyd Webber}, Andrew and '
+                   'de la Fuente, Juan and van Beethoven, Jr, Ludwig and {Smith, Jones and Co}')
+        for backend in parser.BACKENDS:
+            bib = bibfile.BibFile(bibstring='@misc{Key, author={' + authors + '}}',
+                                  backend=backend)
+            entry = bib['Key']
+            entry['author'] = list(entry['author'])
+            parsed = bibfile.BibFile(bibstring=entry.toBibtex(), backend=backend)['Key']
+            self.assertEqual(parsed['author'], entry['author'])
+            self.assertEqual(len(parsed['author']), 6)
+
+    def testConcatenation(self):
+        bib = bibfile.BibFile(self.path)
+        entry = bib['Second']
+        self.assertEqual(entry.toBibtex(), '@misc{Second,\n  title = "Second" # macro\n}')
+        entry['title'] = entry['title']
+        self.assertEqual(entry.toBibtex(), '@misc{Second,\n  title = {Second} # macro\n}')
+
+    def testBracesPreserved(self):
+        source = ('@article{Key,\n  title = {The {IEEE} {LDPC} codes},\n'
+                  '  author = {{Barnes and Noble} and Doe, J.}\n}')
+        for backend in parser.BACKENDS:
+            bib = bibfile.BibFile(bibstring=source, backend=backend)
+            entry = bib['Key']
+            entry['title'], entry['author']  # decode the values
+            entry['year'] = '2015'
+            self.assertEqual(entry.toBibtex(), source[:-2] + ',\n  year = {2015}\n}')
+            self.assertEqual(len(entry['author']), 2)
@@ -0,0 +1,75 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+# Copyright 2014-2015 Michael Helmling
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 3 as
+# published by the Free Software Foundation
+
+from __future__ import division, print_function, unicode_literals
+import io, shutil, tempfile
+import unittest
+
+from bibtexvcs import bibfile, search
+from . import tmpDatabase
+
+bibtext = """@article{Decoding,
+  title = {{LP} Decoding of {T}urbo-Like Codes},
+  abstract = {We consider linear programming decoding of turbo-like codes.}
+}
+@article{Goedel,
+  title = {{\\"U}ber formal unentscheidbare S{\\"a}tze},
+  keywords = {logic, incompleteness}
+}
+@article{Codes,
+  title = {Codes and {M}atroids}
+}
+"""
+
+
+class TestSearchIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.bib = bibfile.BibFile(bibstring=bibtext, backend='lazy')
+        self.index = search.SearchIndex()
+        self.index.synchronize(self.bib)
+
+    def testTokenize(self):
+        self.assertEqual(search.tokenize('{\\"U}ber Gr{\\"o}{\\ss}e {\\em of} Sätze'),
+                         ['uber', 'grosse', 'of', 'satze'])
+
+    def testSearch(self):
+        self.assertEqual([key for key, _ in self.index.search('codes')], ['Codes', 'Decoding'])
+        self.assertEqual([key for key, _ in self.index.search('decoding codes')], ['Decoding'])
+        self.assertEqual([key for key, _ in self.index.search('UBER satze')], ['Goedel'])
+        self.assertEqual([key for key, _ in self.index.search('incompleteness')], ['Goedel'])
+        self.assertEqual(self.index.search('unknown'), [])
+        self.assertEqual(len(self.index.search('codes', limit=1)), 1)
+
+    def testSynchronize(self):
+        bib = bibfile.BibFile(bibstring=bibtext.replace('{M}atroids', 'Graphs')
+                              .replace('@article{Decoding', '@article{Renamed'), backend='lazy')
+        self.assertEqual(self.index.synchronize(bib), 3)
+        self.assertEqual(self.index.search('matroids'), [])
+        self.assertEqual([key for key, _ in self.index.search('graphs')], ['Codes'])
+        self.assertEqual([key for key, _ in self.index.search('turbo')], ['Renamed'])
+        self.assertEqual(self.index.synchronize(bib), 0)
+        self.assertEqual(sorted(self.index.lengths), ['Codes', 'Goedel', 'Renamed'])
+
+
+class TestPersistentIndex(unittest.TestCase):
+
+    def testLoadIndex(self):
+        cacheDir = tempfile.mkdtemp()
+        try:
+            with tmpDatabase() as db:
+                index = search.loadIndex(db, cacheDir)
+                self.assertEqual([key for key, _ in index.search('something')], ['Authors2011'])
+                with io.open(db.bibfilePath, 'at', encoding='UTF-8') as bibFile:
+                    bibFile.write('\n@misc{NewKey, title={Something new}}\n')
+                db.reload()
+                index = search.loadIndex(db, cacheDir)
+                self.assertEqual([key for key, _ in index.search('new')], ['NewKey'])
+                self.assertIn('NewKey', search.loadIndex(db, cacheDir).lengths)
+        finally:
+            shutil.rmtree(cacheDir)
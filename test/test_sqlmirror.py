@@ -0,0 +1,90 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+# Copyright 2014-2015 Michael Helmling
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 3 as
+# published by the Free Software Foundation
+
+from __future__ import division, print_function, unicode_literals
+import io, shutil, tempfile
+import unittest
+
+from bibtexvcs import sqlmirror
+from . import tmpDatabase
+
+
+class TestSQLMirror(unittest.TestCase):
+
+    def setUp(self):
+        self.cacheDir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.cacheDir)
+
+    def query(self, db, statement):
+        return sqlmirror.query(sqlmirror.synchronize(db, self.cacheDir), statement)[1]
+
+    def testTables(self):
+        with tmpDatabase() as db:
+            self.assertEqual(self.query(db, 'SELECT citekey FROM entries ORDER BY position'),
+                             [('Authors2011',), ('SomeKey',)])
+            self.assertEqual(self.query(db, "SELECT value FROM fields "
+                                            "WHERE citekey = 'Authors2011' AND name = 'journal'"),
+                             [('IEEE_J_IT',)])
+            self.assertEqual(self.query(db, 'SELECT * FROM documents'),
+                             [('SomeKey', 'emptyDoc.pdf')])
+            self.assertEqual(self.query(db, 'SELECT macro FROM journals ORDER BY macro'),
+                             [('COMP_GEOM',), ('DECISION_SCI',)])
+            self.assertEqual(self.query(db, 'SELECT name FROM macros'), [('macroname',)])
+            lastNames = self.query(db, "SELECT last FROM names WHERE citekey = 'Authors2011' "
+                                       "AND field = 'author' ORDER BY position")
+            self.assertEqual([last for last, in lastNames],
+                             [name.last for name in db.bibfile['Authors2011']['author']])
+
+    def testMalformedFileField(self):
+        with tmpDatabase() as db:
+            with io.open(db.bibfilePath, 'at', encoding='UTF-8') as bibFile:
+                bibFile.write('\n@misc{MacroFile, file = macroname}\n'
+                              '@misc{Concatenated, file = ":a" # macroname}\n')
+            db.reload()
+            self.assertEqual(self.query(db, 'SELECT * FROM documents ORDER BY citekey'),
+                             [('Concatenated', None), ('MacroFile', None),
+                              ('SomeKey', 'emptyDoc.pdf')])
+
+    def testIncrementalUpdate(self):
+        with tmpDatabase() as db:
+            path = sqlmirror.synchronize(db, self.cacheDir)
+            self.assertEqual(sqlmirror.freshMirror(db.directory, self.cacheDir), path)
+            with io.open(db.bibfilePath, 'at', encoding='UTF-8') as bibFile:
+                bibFile.write('\n@misc{NewKey, title={New}}\n')
+            self.assertIsNone(sqlmirror.freshMirror(db.directory, self.cacheDir))
+            db.reload()
+            self.assertEqual(self.query(db, "SELECT position, hash FROM entries "
+                                            "WHERE citekey = 'NewKey'")[0][0], 2)
+            self.assertEqual(sqlmirror.freshMirror(db.directory, self.cacheDir), path)
+            del db.bibfile['Authors2011']
+            db.bibfile.save()
+            self.assertEqual(self.query(db, 'SELECT citekey, position FROM entries '
+                                            'ORDER BY position'),
+                             [('SomeKey', 0), ('NewKey', 1)])
+            self.assertEqual(self.query(db, "SELECT count(*) FROM fields "
+                                            "WHERE citekey = 'Authors2011'"), [(0,)])
+
+    def testStaleDatabase(self):
+        with tmpDatabase() as db:
+            db.bibfile
+            with io.open(db.bibfilePath, 'at', encoding='UTF-8') as bibFile:
+                bibFile.write('\n@misc{NewKey, title={New}}\n')
+            # the mirror reflects the loaded data, so it must not be considered fresh
+            self.assertEqual(self.query(db, "SELECT * FROM entries WHERE citekey = 'NewKey'"), [])
+            self.assertIsNone(sqlmirror.freshMirror(db.directory, self.cacheDir))
+            db.reload()
+            self.assertEqual(len(self.query(db, "SELECT * FROM entries "
+                                                "WHERE citekey = 'NewKey'")), 1)
+            self.assertIsNotNone(sqlmirror.freshMirror(db.directory, self.cacheDir))
+
+    def testReadOnly(self):
+        with tmpDatabase() as db:
+            path = sqlmirror.synchronize(db, self.cacheDir)
+            self.assertRaises(Exception, sqlmirror.query, path, 'DELETE FROM entries')